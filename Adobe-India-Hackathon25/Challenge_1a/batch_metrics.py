@@ -0,0 +1,268 @@
+import json
+import os
+import time
+from collections import Counter
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = "pdf_outline"
+SERVICE_NAME = "pdf-outline-extractor"
+
+
+class StageRecorder:
+    """
+    Stage hook timing the stages of one document in the process that extracts it
+    Stages are recorded as (name, start_ns, end_ns); a "start" mark only moves
+    the start of the next stage
+    """
+
+    def __init__(self):
+        self.start_ns = self._last_ns = time.time_ns()
+        self.stages = []
+
+    def __call__(self, stage):
+        now = time.time_ns()
+        if stage != "start":
+            self.stages.append((stage, self._last_ns, now))
+        self._last_ns = now
+
+    def finish(self):
+        """Return the timings as a small picklable dict for the parent process"""
+        return {"start_ns": self.start_ns, "end_ns": time.time_ns(), "stages": self.stages}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        """Return [(upper bound label, cumulative count)] including +Inf"""
+        rows = []
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            running += count
+            rows.append(("+Inf" if bound == float("inf") else repr(bound), running))
+        return rows
+
+    def to_json(self):
+        return {"count": self.count, "sum": round(self.total, 6),
+                "buckets": {label: count for label, count in self.cumulative()}}
+
+
+class BatchMetrics:
+    """
+    Metrics of one batch, aggregated in the parent process from what the workers
+    return with every document: document/page/error counters, cache requests,
+    document and per-stage latency histograms, and throughput
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.documents = Counter()
+        self.pages = Counter()
+        self.errors = Counter()
+        self.retries = 0
+        self.ocr_documents = Counter()
+        self.cache = Counter()
+        self.document_seconds = Histogram()
+        self.stage_seconds = {}
+
+    def record_document(self, status, attempts=1, timings=None, page_kinds=None, error_type=None):
+        """Record one finished (status "ok") or given-up (status "failed") document"""
+        self.documents[status] += 1
+        self.retries += attempts - 1
+        if error_type:
+            self.errors[error_type] += 1
+        for kind in (page_kinds or {}).values():
+            self.pages[kind] += 1
+        if timings:
+            self.record_cache(timings.get("cache_hits", 0), timings.get("cache_misses", 0))
+            self.document_seconds.observe((timings["end_ns"] - timings["start_ns"]) / 1e9)
+            for stage, start_ns, end_ns in timings["stages"]:
+                if stage not in self.stage_seconds:
+                    self.stage_seconds[stage] = Histogram()
+                self.stage_seconds[stage].observe((end_ns - start_ns) / 1e9)
+
+    def record_ocr(self, status):
+        """Record one document of the OCR queue"""
+        self.ocr_documents[status] += 1
+
+    def record_cache(self, hits=0, misses=0):
+        """Record cache lookups (e.g. of the span cache)"""
+        self.cache["hit"] += hits
+        self.cache["miss"] += misses
+
+    def finish(self):
+        """Stop the batch clock"""
+        self.seconds = time.perf_counter() - self.started
+
+    def summary(self):
+        """Return the derived batch figures: seconds, rates and ratios"""
+        seconds = self.seconds if self.seconds is not None else time.perf_counter() - self.started
+        documents = sum(self.documents.values())
+        lookups = self.cache["hit"] + self.cache["miss"]
+        return {
+            "batch_seconds": round(seconds, 4),
+            "documents_per_second": round(documents / seconds, 3) if seconds else 0.0,
+            "pages_per_second": round(sum(self.pages.values()) / seconds, 3) if seconds else 0.0,
+            "error_rate": round(self.documents["failed"] / documents, 4) if documents else 0.0,
+            "cache_hit_ratio": round(self.cache["hit"] / lookups, 4) if lookups else None,
+        }
+
+    def to_json(self):
+        """Return all metrics as a JSON-serialisable dict"""
+        return dict(self.summary(),
+                    documents=dict(self.documents), pages=dict(self.pages), errors=dict(self.errors),
+                    retries=self.retries, ocr_documents=dict(self.ocr_documents), cache=dict(self.cache),
+                    document_seconds=self.document_seconds.to_json(),
+                    stage_seconds={stage: h.to_json() for stage, h in sorted(self.stage_seconds.items())})
+
+    def prometheus_text(self):
+        """Return the metrics in the Prometheus text exposition format"""
+        p = METRIC_PREFIX
+        lines = []
+
+        def counter(name, help_text, label, values):
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} counter")
+            for key, value in sorted(values.items()):
+                lines.append(f'{p}_{name}{{{label}="{key}"}} {value}')
+
+        def gauge(name, help_text, value):
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} gauge")
+            lines.append(f"{p}_{name} {value}")
+
+        def histogram(name, help_text, histograms):
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} histogram")
+            for labels, h in histograms:
+                prefix = labels + "," if labels else ""
+                for bound, count in h.cumulative():
+                    lines.append(f'{p}_{name}_bucket{{{prefix}le="{bound}"}} {count}')
+                suffix = "{" + labels + "}" if labels else ""
+                lines.append(f"{p}_{name}_sum{suffix} {h.total:.6f}")
+                lines.append(f"{p}_{name}_count{suffix} {h.count}")
+
+        summary = self.summary()
+        counter("documents_total", "Documents finished, by status", "status", self.documents)
+        counter("pages_total", "Pages read, by kind", "kind", self.pages)
+        counter("errors_total", "Documents given up on, by error type", "type", self.errors)
+        counter("ocr_documents_total", "Documents of the OCR queue, by status", "status", self.ocr_documents)
+        counter("cache_requests_total", "Cache lookups, by result", "result", self.cache)
+        lines.append(f"# HELP {p}_retries_total Retried attempts")
+        lines.append(f"# TYPE {p}_retries_total counter")
+        lines.append(f"{p}_retries_total {self.retries}")
+        gauge("batch_seconds", "Wall time of the batch", summary["batch_seconds"])
+        gauge("documents_per_second", "Batch throughput in documents", summary["documents_per_second"])
+        gauge("pages_per_second", "Batch throughput in pages", summary["pages_per_second"])
+        gauge("error_rate", "Share of documents given up on", summary["error_rate"])
+        if summary["cache_hit_ratio"] is not None:
+            gauge("cache_hit_ratio", "Share of cache lookups that hit", summary["cache_hit_ratio"])
+        histogram("document_seconds", "Extraction latency per document", [("", self.document_seconds)])
+        histogram("stage_seconds", "Latency per extraction stage",
+                  [(f'stage="{stage}"', h) for stage, h in sorted(self.stage_seconds.items())])
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Write the metrics to path: Prometheus text for a .prom file (for the node
+        exporter's textfile collector), JSON otherwise; replaced atomically
+        """
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            if path.endswith(".prom"):
+                f.write(self.prometheus_text())
+            else:
+                json.dump(self.to_json(), f, indent=2)
+        os.replace(tmp_path, path)
+
+
+def _attributes(values):
+    attributes = []
+    for key, value in values.items():
+        if isinstance(value, bool):
+            attributes.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            attributes.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            attributes.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            attributes.append({"key": key, "value": {"stringValue": str(value)}})
+    return attributes
+
+
+def _span(trace_id, span_id, parent_span_id, name, start_ns, end_ns, attributes=None, error=None):
+    span = {
+        "traceId": trace_id,
+        "spanId": span_id,
+        "name": name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(start_ns),
+        "endTimeUnixNano": str(end_ns),
+        "attributes": _attributes(attributes or {}),
+        "status": {"code": 2, "message": error} if error else {"code": 1},
+    }
+    if parent_span_id:
+        span["parentSpanId"] = parent_span_id
+    return span
+
+
+class TraceWriter:
+    """
+    Writes trace spans as OTLP/JSON lines (one ExportTraceServiceRequest per
+    line, as the OpenTelemetry collector's file exporter does), so traces work
+    offline and can be replayed into any OTLP backend later
+    One trace per batch: a batch span with a span per document and a child span
+    per stage
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8")
+        self.trace_id = os.urandom(16).hex()
+        self.batch_span_id = os.urandom(8).hex()
+        self.start_ns = time.time_ns()
+        self.documents = 0
+
+    def _write(self, spans):
+        request = {"resourceSpans": [{
+            "resource": {"attributes": _attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": "process_pdfs"}, "spans": spans}],
+        }]}
+        self.file.write(json.dumps(request) + "\n")
+        self.file.flush()
+
+    def document(self, file, status, attempts, timings=None, error=None, attributes=None):
+        """Write the spans of one document; without timings only its outcome is recorded"""
+        self.documents += 1
+        span_id = os.urandom(8).hex()
+        now = time.time_ns()
+        start_ns, end_ns = (timings["start_ns"], timings["end_ns"]) if timings else (now, now)
+        spans = [_span(self.trace_id, span_id, self.batch_span_id, "document", start_ns, end_ns,
+                       dict(attributes or {}, file=file, status=status, attempts=attempts), error)]
+        for stage, stage_start_ns, stage_end_ns in (timings or {}).get("stages", ()):
+            spans.append(_span(self.trace_id, os.urandom(8).hex(), span_id, stage,
+                               stage_start_ns, stage_end_ns))
+        self._write(spans)
+
+    def close(self, attributes=None):
+        """Write the batch span and close the file"""
+        self._write([_span(self.trace_id, self.batch_span_id, None, "batch", self.start_ns, time.time_ns(),
+                           dict(attributes or {}, documents=self.documents))])
+        self.file.close()
@@ -0,0 +1,288 @@
+import heapq
+import json
+import multiprocessing
+import os
+import shutil
+import time
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import resource  # POSIX only: used for worker memory limits
+except ImportError:
+    resource = None
+
+# Attempts per task before it is given up on
+MAX_ATTEMPTS = 3
+# Delay before the first retry of a failed task; doubled for every further retry
+RETRY_BACKOFF_SECONDS = 0.5
+# Tasks each worker process handles (on average) before its pool is replaced by
+# a freshly forked one, so leaks in the C layer never accumulate
+WORKER_RECYCLE_TASKS = 200
+
+# Start method of the worker processes; None forks where the platform can
+START_METHOD = None
+
+# Error details reported for a task whose worker process died (segfault, abort,
+# killed for exceeding its memory limit)
+WORKER_CRASH = {
+    "error_type": "WorkerCrash",
+    "message": "worker process died while processing the task",
+    "traceback": "",
+    "permanent": False,
+}
+
+
+def retry_delay(attempt):
+    """Return the backoff in seconds before retrying a task that failed attempt times"""
+    return RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+
+
+def _init_worker(memory_limit_mb, initializer, initargs):
+    """
+    Worker initializer: cap the address space of the worker process, then run
+    the caller's initializer(*initargs) if any
+    """
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def error_details(e, permanent):
+    """Return the error details reported for a task that raised e (while it is being handled)"""
+    return {
+        "error_type": type(e).__name__,
+        "message": str(e),
+        "traceback": traceback.format_exc(),
+        "permanent": permanent,
+    }
+
+
+def _supervised_call(call):
+    """
+    Run function(task) for one (function, task, permanent_errors) call
+    Returns ("ok", result) or ("error", details); exceptions never escape, so a
+    failing task does not take its worker down
+    """
+    function, task, permanent_errors = call
+    try:
+        return "ok", function(task)
+    except Exception as e:
+        return "error", error_details(e, isinstance(e, permanent_errors))
+
+
+def _run_isolated(call, context, worker_initargs):
+    """
+    Run one call alone in a fresh, single-use worker process so a crash can be
+    blamed on it without taking this process down
+    """
+    with ProcessPoolExecutor(1, mp_context=context, initializer=_init_worker,
+                             initargs=worker_initargs) as executor:
+        try:
+            return executor.submit(_supervised_call, call).result()
+        except BrokenProcessPool:
+            return "error", dict(WORKER_CRASH)
+
+
+def run_supervised(function, tasks, workers=1, memory_limit_mb=None, max_attempts=MAX_ATTEMPTS,
+                   permanent_errors=(), recycle_tasks=WORKER_RECYCLE_TASKS, prefetch=None, ordered=False,
+                   initializer=None, initargs=(), isolate=False, followups=None):
+    """
+    Run function over tasks (any iterable, consumed lazily) with failures isolated per task
+
+    With workers > 1, or with isolate or memory_limit_mb set, tasks run in worker
+    processes, forked unless START_METHOD says otherwise (at least one;
+    memory-limited to memory_limit_mb when given, replaced every recycle_tasks
+    tasks per worker).
+    A failing task is retried with exponential backoff up to max_attempts times;
+    errors that are instances of permanent_errors are not retried. When a worker
+    dies, every task it may have been running is re-run alone in a fresh worker,
+    so only the task that really crashes is charged an attempt.
+    Otherwise tasks run in this process (exceptions are isolated, crashes are not).
+    Where processes cannot be forked, initializer(*initargs) runs in every worker
+    process as it starts, to rebuild the state a forked worker would inherit.
+    A task that cannot be sent to a worker or whose result cannot be sent back
+    (e.g. it does not pickle) fails at once without retries, like a permanent error.
+
+    No more than prefetch tasks (default: two per worker) are taken from tasks
+    and not yet yielded, so memory stays bounded however many tasks there are.
+    With ordered set, outcomes are yielded in task order, holding back those
+    that finish early (within the same prefetch window).
+
+    followups, if given, is a deque the caller may append tasks to while it
+    consumes the outcomes (e.g. a task that needs the results of earlier ones);
+    they are run before any task not yet taken from tasks.
+
+    Yields (task, status, payload, attempts) as tasks finish: status "ok" with the
+    function's result, or "failed" with the error details of the last attempt
+    """
+    if followups is None:
+        followups = deque()
+    if workers <= 1 and not isolate and not memory_limit_mb:
+        def with_followups():
+            for task in tasks:
+                yield task
+                while followups:
+                    yield followups.popleft()
+
+        for task in with_followups():
+            attempt = 1
+            while True:
+                status, payload = _supervised_call((function, task, permanent_errors))
+                if status == "ok":
+                    yield task, "ok", payload, attempt
+                    break
+                if payload["permanent"] or attempt >= max_attempts:
+                    yield task, "failed", payload, attempt
+                    break
+                time.sleep(retry_delay(attempt))
+                attempt += 1
+        return
+
+    workers = max(workers, 1)
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context(START_METHOD or ("fork" if "fork" in methods else None))
+
+    # Forked workers inherit this process's state and need no initializer
+    worker_initargs = (memory_limit_mb, None if context.get_start_method() == "fork" else initializer, initargs)
+
+    def new_executor():
+        return ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                   initargs=worker_initargs)
+
+    if prefetch is None:
+        prefetch = 2 * workers
+    prefetch = max(prefetch, 1)
+    executor = new_executor()
+    submitted = 0
+    tasks = iter(tasks)
+    taken = 0  # tasks taken from tasks and followups; the index of a task is its position there
+    finished = 0  # tasks yielded
+    exhausted = False
+    pending = deque()  # (index, task, attempt) ready to submit
+    waiting = []  # heap of (ready_at, index, task, attempt) for backed-off retries
+    in_flight = {}  # future -> (index, task, attempt, executor)
+    held = {}  # index -> outcome finished ahead of its turn (ordered)
+    try:
+        while True:
+            while followups:
+                pending.append((taken, followups.popleft(), 1))
+                taken += 1
+            # Keep the prefetch window full (retries already count towards it)
+            while not exhausted and taken - finished < prefetch:
+                try:
+                    pending.append((taken, next(tasks), 1))
+                except StopIteration:
+                    exhausted = True
+                    break
+                taken += 1
+            if not (pending or waiting or in_flight):
+                break
+            now = time.monotonic()
+            while waiting and waiting[0][0] <= now:
+                _, index, task, attempt = heapq.heappop(waiting)
+                pending.append((index, task, attempt))
+
+            while pending:
+                if submitted >= recycle_tasks * workers:
+                    # Running tasks finish in the old pool; new ones go to a fresh fork
+                    executor.shutdown(wait=False)
+                    executor = new_executor()
+                    submitted = 0
+                index, task, attempt = pending.popleft()
+                try:
+                    future = executor.submit(_supervised_call, (function, task, permanent_errors))
+                except Exception as e:
+                    # Reported with the finished tasks below
+                    future = Future()
+                    future.set_exception(e)
+                in_flight[future] = (index, task, attempt, executor)
+                submitted += 1
+
+            timeout = max(0.0, waiting[0][0] - now) if waiting else None
+            if not in_flight:
+                time.sleep(timeout)
+                continue
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            outcomes = []
+            for future in done:
+                index, task, attempt, owner = in_flight.pop(future)
+                try:
+                    outcomes.append((index, task, attempt) + future.result())
+                except BrokenProcessPool:
+                    # Any task of the broken pool may be the culprit: re-run it alone
+                    owner.shutdown(wait=False)
+                    if owner is executor:
+                        executor = new_executor()
+                        submitted = 0
+                    call = (function, task, permanent_errors)
+                    outcomes.append((index, task, attempt) + _run_isolated(call, context, worker_initargs))
+                except Exception as e:
+                    # Raised by the pool itself, not the function: the task or its
+                    # result did not pickle, which no retry changes
+                    outcomes.append((index, task, attempt, "error", error_details(e, True)))
+
+            for index, task, attempt, status, payload in sorted(outcomes, key=lambda outcome: outcome[0]):
+                if status == "ok":
+                    outcome = (task, "ok", payload, attempt)
+                elif payload["permanent"] or attempt >= max_attempts:
+                    outcome = (task, "failed", payload, attempt)
+                else:
+                    heapq.heappush(waiting, (time.monotonic() + retry_delay(attempt), index, task, attempt + 1))
+                    continue
+                if not ordered:
+                    finished += 1
+                    yield outcome
+                    continue
+                held[index] = outcome
+                while finished in held:
+                    finished += 1
+                    yield held.pop(finished - 1)
+    finally:
+        executor.shutdown(wait=not in_flight, cancel_futures=True)
+
+
+def quarantine(name, source_path, error, attempts, dead_letter_dir):
+    """
+    Copy a task's input file into dead_letter_dir next to a <name>.error.json
+    file describing the failure; the input itself is left in place
+    """
+    os.makedirs(dead_letter_dir, exist_ok=True)
+    try:
+        shutil.copy2(source_path, os.path.join(dead_letter_dir, name))
+    except OSError:
+        pass  # the input may be what is missing or unreadable
+    details = dict(error, file=name, source=source_path, attempts=attempts,
+                   quarantined_at=time.strftime("%Y-%m-%dT%H:%M:%S%z"))
+    with open(os.path.join(dead_letter_dir, name + ".error.json"), "w", encoding="utf-8") as f:
+        json.dump(details, f, ensure_ascii=False, indent=2)
+
+
+def load_checkpoint(checkpoint_path):
+    """
+    Read a checkpoint written by append_checkpoint
+    Returns {name: record} with the last record of every task; a record cut
+    short by a crash is ignored
+    """
+    records = {}
+    if not os.path.exists(checkpoint_path):
+        return records
+    with open(checkpoint_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            records[record["file"]] = record
+    return records
+
+
+def append_checkpoint(checkpoint_file, record):
+    """Append one record to an open checkpoint file and flush it to the OS"""
+    checkpoint_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+    checkpoint_file.flush()
@@ -0,0 +1,1858 @@
+import argparse
+import contextlib
+import heapq
+import io
+import json
+import math
+import os
+import pickle
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, deque
+
+import fitz  # PyMuPDF
+
+import batch_runner
+import font_styles
+import process_pdfs
+import train_heading_classifier
+from corpus_frequency import CorpusFrequencyModel
+from heading_classifier import HeadingClassifier
+from batch_metrics import StageRecorder
+from shared_artifacts import ARTIFACT_DIR, ArtifactHandle, ArtifactStore
+from span_cache import SpanCache, read_span_table, write_span_table
+from process_pdfs import (
+    extract_outline,
+    normalize_unicode_characters,
+    convert_special_chars_to_hex,
+)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PDF_DIR = os.path.join(SCRIPT_DIR, "sample_dataset", "pdfs")
+OUTPUT_DIR = os.path.join(SCRIPT_DIR, "sample_dataset", "outputs")
+
+# Expected results of the unicode helpers, pinned from the original
+# replace-loop implementation
+PINNED_NORMALIZATION = {
+    "": "",
+    "Plain heading": "Plain heading",
+    "Foundation-Level": "Foundation–Level",
+    "\"quoted\"": "”quoted”",
+    "Ontario's Digital Library": "Ontario’s Digital Library",
+    "`tick'": "‘tick’",
+    "Wait...": "Wait…",
+    "Four dots....": "Four dots….",
+    "Brand(TM) and brand(tm)": "Brand™ and brand™",
+    "Mark(R) mark(r) (Tm)": "Mark® mark® (Tm)",
+    "(C) 2014 (c)": "© 2014 ©",
+    "em—dash en–dash • ·": "em—dash en–dash • ·",
+}
+
+PINNED_HEX = {
+    "": "",
+    "Plain heading": "Plain heading",
+    "Parsippany –Troy Hills": "Parsippany \\x{2013}Troy Hills",
+    "Ontario’s": "Ontario\\x{2019}s",
+    "“q” ‘q’": "\\x{201C}q\\x{201D} \\x{2018}q\\x{2019}",
+    "a—b…•·": "a\\x{2014}b\\x{2026}\\x{2022}\\x{00B7}",
+    "™®©": "\\x{2122}\\x{00AE}\\x{00A9}",
+}
+
+# Heading levels of numbered texts: the first block pinned from the original
+# three-regex get_numbering_level, the second for the letter and roman numbering
+PINNED_NUMBERING_LEVELS = {
+    "1. Introduction": "H1",
+    "12. Twelve": "H1",
+    "2.1 Scope": "H2",
+    "2.1.1 Details": "H3",
+    "2.1.1.1 Too deep": None,
+    "2.1. Dotted": None,
+    "1.": None,
+    "2 Intro": None,
+    "2) Item": None,
+    "Introduction": None,
+    "A. Appendix": "H1",
+    "IV. Results": "H1",
+    "b) item": "H1",
+    "A.2 Sub-appendix": "H2",
+    "e.g. an example": None,
+    "U.S. Army": None,
+}
+
+# (weight, italic) read from font names: bold and italic through the name alone,
+# as PyMuPDF reports no flag for e.g. "Arial-Black"
+PINNED_FONT_STYLES = {
+    "Helvetica": (400, False),
+    "Helvetica-Bold": (700, False),
+    "Arial,Bold": (700, False),
+    "Arial-BoldItalicMT": (700, True),
+    "Arial-Black": (900, False),
+    "Arial-BlackItalic": (900, True),
+    "Arial Black": (900, False),
+    "ABCDEF+Calibri-SemiBold": (600, False),
+    "Montserrat-ExtraBold": (800, False),
+    "Roboto-Light": (300, False),
+    "Helvetica-Oblique": (400, True),
+    "ArialBold": (700, False),
+    "Blackadder": (400, False),
+    "Garamond-Academic": (400, False),
+    "Arial-Bolditalic": (700, True),
+    "ARIALBOLD": (700, False),
+    "Trebuchet MS": (400, False),
+    "Times-Roman": (400, False),
+    "": (400, False),
+}
+
+# Levels assign_proper_hierarchy gives runs of numbered headings at the default
+# OUTLINE_DEPTH: arabic numbers keep their plain depth whatever style came first
+PINNED_NUMBERED_OUTLINES = (
+    (("a) Eligibility notes", "H1"), ("1. Introduction", "H1"), ("1.1 Scope", "H2"), ("2. Method", "H1")),
+    (("1. Introduction", "H1"), ("1.1 Scope", "H2"), ("a) Eligibility", "H3"), ("2. Method", "H1")),
+    (("I. Background", "H1"), ("A. Scope", "H2"), ("B. Method", "H2"), ("II. Results", "H1"), ("A. Costs", "H2")),
+    # A lone letter or roman numeral without a numbering context is not numbering,
+    # so the heading is placed by its emphasis instead of nesting
+    (("1. Introduction", "H1"), ("1.1 Scope", "H2"), ("CD. Player", "H1"), ("1.2 Method", "H2")),
+    (("1. Introduction", "H1"), ("MD. Smith", "H1"), ("2. Method", "H1")),
+)
+
+# Whether assign_proper_hierarchy keeps each heading of a run numbered: a single
+# letter or roman numeral needs a sibling or, starting its sequence, a numbered
+# heading before it
+PINNED_NUMBERING_CONTEXTS = (
+    (("A. Smith", False), ("1. Introduction", True)),
+    (("CD. Player", False), ("MD. Smith", False)),
+    (("1. Introduction", True), ("A. Scope", True), ("CD. Player", False)),
+    (("III. Methods", True), ("IV. Results", True)),
+    (("b) second", True), ("c) third", True)),
+)
+
+# Patterns of the original per-use numbering regexes, for benchmark_numbering
+LEGACY_SECTION_NUMBERING = re.compile(r"^[0-9]+(\.[0-9]+)*[\.\s]")
+LEGACY_NUMBER_DOT_START = re.compile(r"^\d+\.")
+LEGACY_BARE_SECTION_NUMBER = re.compile(r"^[0-9]+\.$")
+LEGACY_LEVEL_PATTERNS = (("H1", re.compile(r"^[0-9]+\.\s")), ("H2", re.compile(r"^[0-9]+\.[0-9]+\s")),
+                         ("H3", re.compile(r"^[0-9]+\.[0-9]+\.[0-9]+\s")))
+
+
+def legacy_normalize_unicode_characters(text):
+    """Reference copy of the original replace loop, used for equivalence checks"""
+    if not text:
+        return text
+    replacements = {
+        '-': '–', '—': '—', '–': '–',
+        '"': '”', "'": '’', '`': '‘',
+        '...': '…', '•': '•', '·': '·',
+        '(TM)': '™', '(tm)': '™', '(R)': '®', '(r)': '®',
+        '(C)': '©', '(c)': '©',
+    }
+    for old_char, new_char in replacements.items():
+        text = text.replace(old_char, new_char)
+    return text
+
+
+def legacy_convert_special_chars_to_hex(text):
+    """Reference copy of the original replace loop, used for equivalence checks"""
+    if not text:
+        return text
+    for char in '–—“”‘’…•·™®©':
+        text = text.replace(char, '\\x{%04X}' % ord(char))
+    return text
+
+
+def check_pinned_unicode():
+    """Return a list of mismatches against the pinned unicode helper outputs"""
+    failures = []
+    for source, expected in PINNED_NORMALIZATION.items():
+        actual = normalize_unicode_characters(source)
+        if actual != expected:
+            failures.append(("normalize", source, expected, actual))
+    for source, expected in PINNED_HEX.items():
+        actual = convert_special_chars_to_hex(source)
+        if actual != expected:
+            failures.append(("hex", source, expected, actual))
+    return failures
+
+
+def check_pinned_numbering():
+    """Return a list of mismatches against the pinned numbering levels and numbered outlines"""
+    failures = [(text, expected, process_pdfs.get_numbering_level(text))
+                for text, expected in PINNED_NUMBERING_LEVELS.items()
+                if process_pdfs.get_numbering_level(text) != expected]
+    def hierarchy(texts):
+        headings = []
+        for text in texts:
+            numbering = process_pdfs.parse_numbering(text)
+            headings.append({"level": "H2", "text": text, "size": 14.0, "size_class": 2, "bold": True,
+                             "numbering": numbering,
+                             "has_numbering": process_pdfs.starts_with_section_number(numbering)})
+        return process_pdfs.assign_proper_hierarchy(headings, 10.0)
+
+    for outline in PINNED_NUMBERED_OUTLINES:
+        levels = [heading["level"] for heading in hierarchy(text for text, _ in outline)]
+        if levels != [level for _, level in outline]:
+            failures.append(([text for text, _ in outline], [level for _, level in outline], levels))
+    for run in PINNED_NUMBERING_CONTEXTS:
+        numbered = [heading["has_numbering"] for heading in hierarchy(text for text, _ in run)]
+        if numbered != [expected for _, expected in run]:
+            failures.append(([text for text, _ in run], [expected for _, expected in run], numbered))
+    return failures
+
+
+# (top, bottom) boxes of PyMuPDF lines on one page and the visual lines
+# merge_collinear_lines must give them
+PINNED_COLLINEAR_LINES = (
+    # Two stacked body lines beside a tall heading or drop cap in another column
+    (((0, 10), (0, 30), (12, 22)), [0, 0, 1]),
+    (((-2, 30), (0, 10), (12, 22)), [0, 0, 1]),
+    # Table cells of one row with slightly different boxes
+    (((0, 10), (1, 11), (0.5, 10.5), (20, 30)), [0, 0, 0, 1]),
+)
+
+
+def check_collinear_lines():
+    """Return a list of mismatches against the pinned visual lines"""
+    return [(boxes, expected, process_pdfs.merge_collinear_lines(list(boxes)))
+            for boxes, expected in PINNED_COLLINEAR_LINES
+            if process_pdfs.merge_collinear_lines(list(boxes)) != expected]
+
+
+def check_font_styles(long_pages=200, repeats=5):
+    """
+    Check the font style resolver: the pinned font names, bold "Arial-Black"
+    spans in file03 (no bold flag) both when read and when replayed from a
+    span table, one parse per unique font name, and equally emphasised bold
+    headings being siblings in the hierarchy
+    Also time the style of every span of a long document resolved from the
+    flags only (the original) and from flags plus the cached font name, next
+    to the time per span of reading the document
+    """
+    failures = [(font, expected, font_styles.parse_font_name(font))
+                for font, expected in PINNED_FONT_STYLES.items()
+                if font_styles.parse_font_name(font) != expected]
+
+    parsed = Counter()
+    parse = font_styles.parse_font_name
+
+    def counting_parse_font_name(font):
+        parsed[font] += 1
+        return parse(font)
+
+    font_styles.parse_font_name = counting_parse_font_name
+    font_styles.font_style.cache_clear()
+    try:
+        doc = process_pdfs.open_pdf(os.path.join(PDF_DIR, "file03.pdf"))
+        elements = process_pdfs.read_pages(doc, range(doc.page_count), False, {})
+        doc.close()
+    finally:
+        font_styles.parse_font_name = parse
+    if any(count > 1 for count in parsed.values()):
+        failures.append(f"font names parsed more than once: {sorted(f for f, c in parsed.items() if c > 1)}")
+    black = [element for element in elements if element["font"].startswith("Arial-Black")]
+    if not black or not all(element["is_bold"] for element in black):
+        failures.append("Arial-Black spans of file03 not bold")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "file03.spans")
+        write_span_table(path, elements, {})
+        with open(path, "rb") as f:
+            replayed, _ = read_span_table(f.read())
+    if replayed != elements:
+        failures.append("span table replay of file03 differs in style")
+
+    headings = [{"text": text, "size": 16.0, "size_class": 3, "bold": True, "has_numbering": False,
+                 "level": "H1", "page": 0} for text in ("Background", "Approach", "Results")]
+    levels = [h["level"] for h in process_pdfs.assign_proper_hierarchy(headings, 10.0)]
+    if levels != ["H1", "H1", "H1"]:
+        failures.append(f"equally emphasised bold headings levelled {levels}")
+
+    doc = fitz.open(stream=make_long_document(long_pages), filetype="pdf")
+    start = time.perf_counter()
+    spans = [(element["font"], element["flags"])
+             for element in process_pdfs.read_pages(doc, range(doc.page_count), False, {})]
+    read_seconds = time.perf_counter() - start
+    doc.close()
+
+    def flags_only():
+        return [(bool(flags & 16), bool(flags & 2)) for _, flags in spans]
+
+    def flags_and_font():
+        font_style = font_styles.font_style
+        styles = []
+        for font, flags in spans:
+            style = font_style(font)
+            styles.append((bool(flags & 16) or style[0], bool(flags & 2) or style[1]))
+        return styles
+
+    timings = {}
+    for name, function in (("flags_only", flags_only), ("flags_and_font", flags_and_font)):
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+    per_span = {name: round(seconds / len(spans) * 1e9) for name, seconds in timings.items()}
+    return {"failures": failures, "spans": len(spans), "unique_fonts": len({font for font, _ in spans}),
+            "style_ns_per_span": per_span, "read_ns_per_span": round(read_seconds / len(spans) * 1e9),
+            "added_share_of_read": round((per_span["flags_and_font"] - per_span["flags_only"]) /
+                                         (read_seconds / len(spans) * 1e9), 5)}
+
+
+def legacy_numbering_checks(text):
+    """The numbering checks of one heading as the original regexes made them"""
+    level = None
+    for name, pattern in LEGACY_LEVEL_PATTERNS:
+        if pattern.match(text):
+            level = name
+            break
+    return (bool(LEGACY_SECTION_NUMBERING.match(text)), level,
+            bool(LEGACY_BARE_SECTION_NUMBER.match(text)), bool(LEGACY_NUMBER_DOT_START.match(text)))
+
+
+def benchmark_numbering(clause_count=50_000, seed=0):
+    """
+    Time the numbering checks of a legal-code-like run of numbered clauses: the
+    original regexes (re-matched for every check) against one parse_numbering per
+    heading; the results must agree
+    """
+    rng = random.Random(seed)
+    texts = []
+    for index in range(clause_count):
+        depth = rng.choice((1, 2, 3, 4))
+        number = ".".join(str(rng.randint(1, 40)) for _ in range(depth))
+        texts.append(rng.choice((f"{number}. Clause {index}", f"{number} Clause {index}", f"{number}.", f"Clause {index}")))
+
+    start = time.perf_counter()
+    legacy = [legacy_numbering_checks(text) for text in texts]
+    legacy_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    parsed = []
+    for text in texts:
+        numbering = process_pdfs.parse_numbering(text)
+        parsed.append((process_pdfs.starts_with_section_number(numbering),
+                       process_pdfs.depth_level(process_pdfs.numbering_depth(numbering)),
+                       process_pdfs.is_bare_section_number(numbering),
+                       process_pdfs.is_dotted_section_number(numbering)))
+    parsed_seconds = time.perf_counter() - start
+    return {
+        "clauses": clause_count,
+        "legacy_seconds": round(legacy_seconds, 4),
+        "parsed_seconds": round(parsed_seconds, 4),
+        "speedup": round(legacy_seconds / parsed_seconds, 2) if parsed_seconds else None,
+        "identical": legacy == parsed,
+    }
+
+
+def check_fixture_outputs():
+    """Compare extract_outline against the committed sample outputs"""
+    results = []
+    for file in sorted(os.listdir(PDF_DIR)):
+        if not file.lower().endswith(".pdf"):
+            continue
+        expected_path = os.path.join(OUTPUT_DIR, file.replace(".pdf", ".json"))
+        with open(expected_path, encoding="utf-8") as f:
+            expected = json.load(f)
+        start = time.perf_counter()
+        result = extract_outline(os.path.join(PDF_DIR, file))
+        elapsed = time.perf_counter() - start
+        results.append({
+            "file": file,
+            "seconds": round(elapsed, 4),
+            "headings": len(result["outline"]),
+            "matches_expected": result == expected,
+        })
+    return results
+
+
+def check_pipeline_stages():
+    """
+    Run the samples through an OutlinePipeline with a stage cache: the first and
+    the fully cached run must give the sample outputs, stopping after the title
+    stage must give the same title artifact, and a replaced stage must be used
+    """
+    failures = []
+    stage_cache = {}
+    pipeline = process_pdfs.OutlinePipeline(stage_cache=stage_cache)
+    for file in sorted(os.listdir(PDF_DIR)):
+        if not file.lower().endswith(".pdf"):
+            continue
+        with open(os.path.join(OUTPUT_DIR, file.replace(".pdf", ".json")), encoding="utf-8") as f:
+            expected = json.load(f)
+        with process_pdfs.open_pdf(os.path.join(PDF_DIR, file)) as doc:
+            elements = process_pdfs.read_pages(doc, range(doc.page_count), False, {})
+            spans = {"elements": elements, "statistics_elements": elements,
+                     "metadata_title": process_pdfs.read_metadata_title(doc)}
+        first = pipeline.run(spans, document_key=file)
+        cached = pipeline.run(spans, document_key=file)
+        title_only = process_pdfs.OutlinePipeline().run(spans, stop_after="title")
+        if first["result"] != expected or cached["result"] != expected:
+            failures.append(f"{file}: pipeline result differs")
+        if "raw_headings" in title_only or title_only["title"] != first["title"]:
+            failures.append(f"{file}: stop_after='title' gave {sorted(title_only)}")
+        no_outline = pipeline.replace_stage("consolidate", lambda spans, size_model, headings: [])
+        if no_outline.run(spans)["result"]["outline"]:
+            failures.append(f"{file}: replaced consolidation stage was not used")
+    if len(stage_cache) != 7 * len([f for f in os.listdir(PDF_DIR) if f.lower().endswith(".pdf")]):
+        failures.append(f"stage cache holds {len(stage_cache)} artifacts")
+    return failures
+
+
+def make_scanned_document(pdf_name="file02.pdf", pages=3, dpi=72):
+    """Build a PDF (as bytes) whose pages are images of a sample document, with no text layer"""
+    scanned = fitz.open()
+    with fitz.open(os.path.join(PDF_DIR, pdf_name)) as src_doc:
+        for page in list(src_doc)[:pages]:
+            image_page = scanned.new_page(width=page.rect.width, height=page.rect.height)
+            image_page.insert_image(image_page.rect, pixmap=page.get_pixmap(dpi=dpi))
+    pdf_bytes = scanned.tobytes()
+    scanned.close()
+    return pdf_bytes
+
+
+def check_scanned_documents():
+    """
+    Check that scanned and blank documents are classified and come back with an
+    empty outline instead of failing, and that sample pages are all text pages
+    """
+    blank = fitz.open()
+    blank.new_page()
+    blank_bytes = blank.tobytes()
+    blank.close()
+    failures = []
+    for name, pdf_bytes, expected_kind in (("scanned", make_scanned_document(), "scanned"),
+                                           ("blank", blank_bytes, "empty")):
+        page_kinds = {}
+        try:
+            result = extract_outline(pdf_bytes, page_kinds=page_kinds, analysis=True)
+        except Exception as e:
+            failures.append(f"{name}: {type(e).__name__}: {e}")
+            continue
+        if result["outline"] or set(page_kinds.values()) != {expected_kind}:
+            failures.append(f"{name}: outline {result['outline']}, page kinds {page_kinds}")
+    for file in sorted(os.listdir(PDF_DIR)):
+        if file.lower().endswith(".pdf"):
+            page_kinds = {}
+            extract_outline(os.path.join(PDF_DIR, file), page_kinds=page_kinds)
+            if set(page_kinds.values()) != {"text"}:
+                failures.append(f"{file}: page kinds {page_kinds}")
+    return failures
+
+
+def check_fault_isolation(workers=2):
+    """
+    Run a batch of the samples plus a broken and a truncated PDF with a dead-letter
+    directory and a checkpoint; the batch must finish, quarantine exactly the two bad
+    files, match the sample outputs, and only retry the failed files when run a
+    second time (a third run after repairing one of them processes it)
+    The batch's Prometheus metrics must count the failures and its trace must hold
+    one span per document with the stage spans of every processed document
+    A document whose OCR failed is queued for OCR again when the batch is rerun
+    """
+    failures = []
+    original_backoff = batch_runner.RETRY_BACKOFF_SECONDS
+    batch_runner.RETRY_BACKOFF_SECONDS = 0.01
+    work_dir = tempfile.mkdtemp()
+    try:
+        input_dir = os.path.join(work_dir, "pdfs")
+        output_dir = os.path.join(work_dir, "outputs")
+        dead_letter_dir = os.path.join(work_dir, "dead_letter")
+        checkpoint_path = os.path.join(work_dir, "checkpoint.jsonl")
+        metrics_path = os.path.join(work_dir, "batch.prom")
+        trace_path = os.path.join(work_dir, "trace.jsonl")
+        shutil.copytree(PDF_DIR, input_dir)
+        with open(os.path.join(input_dir, "broken.pdf"), "wb") as f:
+            f.write(b"not a pdf")
+        with open(os.path.join(PDF_DIR, "file02.pdf"), "rb") as src_file, \
+                open(os.path.join(input_dir, "truncated.pdf"), "wb") as f:
+            f.write(src_file.read(3000))
+
+        counts = process_pdfs.process_pdfs(input_dir, output_dir, workers=workers,
+                                           dead_letter_dir=dead_letter_dir, checkpoint_path=checkpoint_path,
+                                           metrics_path=metrics_path, trace_path=trace_path)
+        quarantined = sorted(f for f in os.listdir(dead_letter_dir) if f.endswith(".error.json"))
+        if quarantined != ["broken.pdf.error.json", "truncated.pdf.error.json"]:
+            failures.append(f"quarantined {quarantined}")
+        if counts["failed_documents"] != 2:
+            failures.append(f"counts {counts}")
+        for file in os.listdir(PDF_DIR):
+            if file.lower().endswith(".pdf"):
+                with open(os.path.join(OUTPUT_DIR, file.replace(".pdf", ".json")), encoding="utf-8") as f:
+                    expected = json.load(f)
+                with open(os.path.join(output_dir, file.replace(".pdf", ".json")), encoding="utf-8") as f:
+                    if json.load(f) != expected:
+                        failures.append(f"{file}: output differs")
+        with open(metrics_path, encoding="utf-8") as f:
+            metrics = f.read()
+        for line in ('pdf_outline_documents_total{status="failed"} 2',
+                     f'pdf_outline_documents_total{{status="ok"}} {counts["documents"]}',
+                     f'pdf_outline_document_seconds_count {counts["documents"]}'):
+            if line not in metrics:
+                failures.append(f"metrics lack {line!r}")
+        with open(trace_path, encoding="utf-8") as f:
+            spans = [span for line in f for span in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+        documents = [span for span in spans if span["name"] == "document"]
+        stage_parents = {span["parentSpanId"] for span in spans if span["name"] == "outline"}
+        if (len(documents) != counts["documents"] + counts["failed_documents"] or
+                len(stage_parents) != counts["documents"] or len({span["traceId"] for span in spans}) != 1):
+            failures.append(f"trace has {len(documents)} document spans, "
+                            f"{len(stage_parents)} with stages, for {counts}")
+
+        counts = process_pdfs.process_pdfs(input_dir, output_dir, workers=workers,
+                                           dead_letter_dir=dead_letter_dir, checkpoint_path=checkpoint_path)
+        if counts["documents"] or counts["failed_documents"] != 2 or counts["resumed_documents"] != 5:
+            failures.append(f"resumed batch did not retry exactly the failed documents: {counts}")
+        shutil.copyfile(os.path.join(PDF_DIR, "file01.pdf"), os.path.join(input_dir, "broken.pdf"))
+        counts = process_pdfs.process_pdfs(input_dir, output_dir, workers=workers, checkpoint_path=checkpoint_path)
+        if counts["documents"] != 1 or counts["failed_documents"] != 1:
+            failures.append(f"repaired document was not processed on the next run: {counts}")
+
+        ocr_checkpoint_path = os.path.join(work_dir, "ocr_checkpoint.jsonl")
+        with open(ocr_checkpoint_path, "w", encoding="utf-8") as f:
+            for file in sorted(os.listdir(PDF_DIR)):
+                if file.lower().endswith(".pdf"):
+                    status = "ocr_failed" if file == "file01.pdf" else "ok"
+                    f.write(json.dumps({"file": file, "status": status}) + "\n")
+        shutil.rmtree(input_dir)
+        shutil.copytree(PDF_DIR, input_dir)
+        counts = process_pdfs.process_pdfs(input_dir, output_dir, workers=workers,
+                                           checkpoint_path=ocr_checkpoint_path)
+        if counts["documents"] or counts["ocr_queued_documents"] != 1:
+            failures.append(f"document whose OCR failed was not queued for OCR again: {counts}")
+    finally:
+        batch_runner.RETRY_BACKOFF_SECONDS = original_backoff
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return failures
+
+
+def check_batch_settings(workers=2):
+    """
+    Run the samples through process_pdfs with per-batch settings in forked and in
+    spawned workers; both must give the same outputs (which the settings change),
+    and the module's settings must be restored after the batch, also when one of
+    the settings fails to load
+    """
+    failures = []
+    defaults = (process_pdfs.RULES, process_pdfs.OUTLINE_DEPTH, process_pdfs.CORPUS_MODEL,
+                process_pdfs.HEADING_CLASSIFIER)
+    original_start_method = batch_runner.START_METHOD
+    work_dir = tempfile.mkdtemp()
+    try:
+        rules_path = os.path.join(work_dir, "rules.json")
+        shutil.copyfile(process_pdfs.DEFAULT_RULES_PATH, rules_path)
+        settings = {"rules_path": rules_path, "outline_depth": 1,
+                    "corpus_model_path": os.path.join(work_dir, "corpus.cms")}
+        outputs = {}
+        for start_method in ("fork", "spawn"):
+            batch_runner.START_METHOD = start_method
+            output_dir = os.path.join(work_dir, start_method)
+            with contextlib.redirect_stdout(io.StringIO()):
+                process_pdfs.process_pdfs(PDF_DIR, output_dir, workers=workers, **settings)
+            outputs[start_method] = {}
+            for file in sorted(os.listdir(output_dir)):
+                with open(os.path.join(output_dir, file), encoding="utf-8") as f:
+                    outputs[start_method][file] = json.load(f)
+            if (process_pdfs.RULES, process_pdfs.OUTLINE_DEPTH, process_pdfs.CORPUS_MODEL,
+                    process_pdfs.HEADING_CLASSIFIER) != defaults:
+                failures.append(f"{start_method}: settings not restored after the batch")
+        if outputs["fork"] != outputs["spawn"]:
+            failures.append("spawned workers give other outputs than forked ones")
+        if any(h["level"] != "H1" for output in outputs["fork"].values() for h in output["outline"]):
+            failures.append("outline_depth 1 was not applied")
+        try:
+            process_pdfs.process_pdfs(PDF_DIR, os.path.join(work_dir, "missing"), rules_path=rules_path,
+                                      outline_depth=1, heading_classifier_path=os.path.join(work_dir, "none.json"))
+            failures.append("a missing classifier did not fail the batch")
+        except FileNotFoundError:
+            pass
+        if (process_pdfs.RULES, process_pdfs.OUTLINE_DEPTH, process_pdfs.CORPUS_MODEL,
+                process_pdfs.HEADING_CLASSIFIER) != defaults:
+            failures.append("settings not restored after a setting failed to load")
+    finally:
+        batch_runner.START_METHOD = original_start_method
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return failures
+
+
+def check_split_documents(long_pages=120, workers=2):
+    """
+    Run a batch splitting a long document into page-range subtasks, with its spans
+    pickled and handed over as artifacts, while the first analysis of the whole
+    document fails; the retried analysis must run in a worker, read the same
+    parts again and give the output of an unsplit extraction, and the batch's
+    corpus model must learn the document
+    """
+    failures = []
+    original_backoff = batch_runner.RETRY_BACKOFF_SECONDS
+    original_finish_outline = process_pdfs.finish_outline
+    batch_runner.RETRY_BACKOFF_SECONDS = 0.01
+    work_dir = tempfile.mkdtemp()
+    try:
+        input_dir = os.path.join(work_dir, "pdfs")
+        os.makedirs(input_dir)
+        long_path = os.path.join(input_dir, "long.pdf")
+        with open(long_path, "wb") as f:
+            f.write(make_long_document(long_pages))
+        shutil.copyfile(os.path.join(PDF_DIR, "file02.pdf"), os.path.join(input_dir, "file02.pdf"))
+        expected = extract_outline(long_path)
+        attempts_path = os.path.join(work_dir, "attempts")
+
+        def failing_once(text_elements, metadata_title, analysis=False):
+            if not text_elements or text_elements[-1]["page"] < process_pdfs.SPLIT_MIN_PAGES:
+                return original_finish_outline(text_elements, metadata_title, analysis)
+            # Forked workers share this function; the file counts attempts across them
+            with open(attempts_path, "a", encoding="utf-8") as f:
+                f.write(f"{os.getpid()}\n")
+            with open(attempts_path, encoding="utf-8") as f:
+                if len(f.read().split()) == 1:
+                    raise RuntimeError("first analysis fails")
+            return original_finish_outline(text_elements, metadata_title, analysis)
+
+        for shared_artifacts in (False, True):
+            if os.path.exists(attempts_path):
+                os.remove(attempts_path)
+            output_dir = os.path.join(work_dir, f"outputs-{shared_artifacts}")
+            corpus_model_path = os.path.join(work_dir, f"corpus-{shared_artifacts}.cms")
+            process_pdfs.finish_outline = failing_once
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    counts = process_pdfs.process_pdfs(input_dir, output_dir, workers=workers,
+                                                       shared_artifacts=shared_artifacts,
+                                                       corpus_model_path=corpus_model_path)
+            finally:
+                process_pdfs.finish_outline = original_finish_outline
+            with open(attempts_path, encoding="utf-8") as f:
+                pids = f.read().split()
+            if counts["split_documents"] != 1 or counts["documents"] != 2 or counts["failed_documents"]:
+                failures.append(f"shared_artifacts={shared_artifacts}: counts {counts}")
+            if len(pids) != 2 or str(os.getpid()) in pids:
+                failures.append(f"shared_artifacts={shared_artifacts}: split document analysed by {pids}, "
+                                f"not retried once in a worker")
+            output_path = os.path.join(output_dir, "long.json")
+            if not os.path.exists(output_path):
+                failures.append(f"shared_artifacts={shared_artifacts}: split document has no output")
+                continue
+            with open(output_path, encoding="utf-8") as f:
+                if json.load(f) != expected:
+                    failures.append(f"shared_artifacts={shared_artifacts}: split output differs")
+            if CorpusFrequencyModel.load(corpus_model_path).documents != 2:
+                failures.append(f"shared_artifacts={shared_artifacts}: corpus model missed a document")
+    finally:
+        batch_runner.RETRY_BACKOFF_SECONDS = original_backoff
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return failures
+
+
+def _abort_on_crash(task):
+    """Return task, or kill the worker process for a task named "crash..." (as a segfault would)"""
+    if task.startswith("crash"):
+        os.abort()
+    return task
+
+
+def check_worker_crashes():
+    """
+    Run tasks of which two kill their worker process through run_supervised with a
+    pool, with one isolated worker and with one memory-limited worker; this
+    process must survive, the crashing tasks fail as worker crashes and the
+    others succeed
+    """
+    failures = []
+    original_backoff = batch_runner.RETRY_BACKOFF_SECONDS
+    batch_runner.RETRY_BACKOFF_SECONDS = 0.01
+    tasks = ["first", "crash-1", "second", "crash-2", "third"]
+    try:
+        for name, options in (("pool", {"workers": 2}), ("isolate", {"workers": 1, "isolate": True}),
+                              ("memory_limit", {"workers": 1, "memory_limit_mb": 4096})):
+            outcomes = {task: (status, payload) for task, status, payload, _ in batch_runner.run_supervised(
+                _abort_on_crash, tasks, max_attempts=2, **options)}
+            for task in tasks:
+                status, payload = outcomes.get(task, (None, None))
+                if task.startswith("crash"):
+                    if status != "failed" or payload["error_type"] != "WorkerCrash":
+                        failures.append(f"{name}: {task} reported as {status} {payload}")
+                elif status != "ok" or payload != task:
+                    failures.append(f"{name}: {task} reported as {status} {payload}")
+    finally:
+        batch_runner.RETRY_BACKOFF_SECONDS = original_backoff
+    return failures
+
+
+# String methods and regex calls that derive new text from a line's text
+DERIVING_CALLS = frozenset(("strip", "rstrip", "lower", "split", "join", "sub"))
+
+
+def count_line_derivations(repeats=5):
+    """
+    Run the heading stage over the candidate lines of the samples and the deep
+    specification, counting the text-deriving calls (DERIVING_CALLS) it makes
+    per line through a profile hook, and time it without the hook
+    """
+    documents = [os.path.join(PDF_DIR, file) for file in sorted(os.listdir(PDF_DIR)) if file.lower().endswith(".pdf")]
+    documents.append(make_deep_document())
+    calls = Counter()
+    lines = heading_sized = 0
+    seconds = 0.0
+
+    def count_call(frame, event, arg):
+        if event == "c_call" and getattr(arg, "__name__", None) in DERIVING_CALLS:
+            calls[arg.__name__] += 1
+
+    for source in documents:
+        doc = process_pdfs.open_pdf(source)
+        elements = process_pdfs.read_pages(doc, range(doc.page_count), False, {})
+        doc.close()
+        spans = {"elements": elements, "statistics_elements": elements, "metadata_title": ""}
+        artifacts = process_pdfs.OUTLINE_PIPELINE.run(spans, stop_after="line_groups")
+        size_model, title_info, candidate_lines = (artifacts["size_model"], artifacts["title"],
+                                                   artifacts["candidate_lines"])
+        lines += len(candidate_lines["lines"])
+        heading_sized += sum(1 for line, _, _, _ in candidate_lines["lines"]
+                             if process_pdfs.line_features(line, size_model["heading_levels"]) is not None)
+        previous_profile = sys.getprofile()
+        sys.setprofile(count_call)
+        try:
+            process_pdfs.find_raw_headings(size_model, title_info, candidate_lines)
+        finally:
+            sys.setprofile(previous_profile)
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            process_pdfs.find_raw_headings(size_model, title_info, candidate_lines)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        seconds += best
+    return {"lines": lines, "heading_sized_lines": heading_sized, "calls": dict(calls),
+            "calls_per_heading_sized_line": round(sum(calls.values()) / heading_sized, 2) if heading_sized else None,
+            "seconds": round(seconds, 4)}
+
+
+def check_iter_outlines(workers=2, copies=4, prefetch=3):
+    """
+    Stream the samples (paths, bytes, memoryviews and keyed pairs, plus a broken
+    PDF and a source that does not pickle) through iter_outlines: ordered results
+    must come in input order, unordered ones in any order, every result must
+    match the sample outputs, the broken PDF and the unpicklable source must be
+    reported under their keys without ending the stream, and the sources must
+    never be read more than prefetch documents ahead of the results
+    """
+    failures = []
+    expected = {}
+    for file in sorted(os.listdir(PDF_DIR)):
+        if file.lower().endswith(".pdf"):
+            with open(os.path.join(OUTPUT_DIR, file.replace(".pdf", ".json")), encoding="utf-8") as f:
+                expected[os.path.join(PDF_DIR, file)] = json.load(f)
+    paths = list(expected) * copies
+    for run_workers in (1, workers):
+        for ordered in (True, False):
+            results = list(process_pdfs.iter_outlines(paths, workers=run_workers, ordered=ordered))
+            keys = [key for key, _ in results]
+            if (keys != paths if ordered else sorted(keys) != sorted(paths)):
+                failures.append(f"workers={run_workers} ordered={ordered}: keys in order {keys}")
+            if any(result != expected[key] for key, result in results):
+                failures.append(f"workers={run_workers} ordered={ordered}: results differ")
+
+    pdf_bytes = {}
+    for path in expected:
+        with open(path, "rb") as f:
+            pdf_bytes[path] = f.read()
+    read_ahead = []
+    taken = 0
+
+    def sources():
+        nonlocal taken
+        for index, path in enumerate(paths):
+            taken += 1
+            yield memoryview(pdf_bytes[path]) if index % 2 else pdf_bytes[path]
+        taken += 1
+        yield ("broken", b"not a pdf")
+        taken += 1
+        yield ("unpicklable", lambda: None)
+
+    yielded = 0
+    results = {}
+    for key, result in process_pdfs.iter_outlines(sources(), workers=workers, prefetch=prefetch,
+                                                  return_errors=True):
+        yielded += 1
+        read_ahead.append(taken - yielded)
+        results[key] = result
+    if max(read_ahead) > prefetch:
+        failures.append(f"sources read {max(read_ahead)} documents ahead with prefetch {prefetch}")
+    if any(results.get(index) != expected[path] for index, path in enumerate(paths)):
+        failures.append("results of PDF bytes differ")
+    if results.get("broken", {}).get("error_type") != "FileDataError":
+        failures.append(f"broken PDF reported as {results.get('broken')}")
+    if "error_type" not in results.get("unpicklable", {}):
+        failures.append(f"unpicklable source reported as {results.get('unpicklable')}")
+    try:
+        list(process_pdfs.iter_outlines([b"not a pdf"]))
+        failures.append("failed document did not raise")
+    except RuntimeError:
+        pass
+    return failures
+
+
+def check_heading_classifier():
+    """
+    Train the heading classifier on the samples: the model must survive a
+    save/load round trip, one that never decides must leave every output to the
+    rule chain unchanged, and the trained (calibrated) one must give every
+    sample's expected output (reported with the share of lines it decides and
+    the heading stage time with and without it)
+    """
+    failures = []
+    documents, _ = train_heading_classifier.load_corpus([(PDF_DIR, OUTPUT_DIR)])
+    rows = [row for _, document_rows in documents.values() for row in document_rows]
+    vectors = [vector for vector, _, _ in rows]
+    classifier = train_heading_classifier.fit(rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "heading_classifier.json")
+        classifier.save(path)
+        loaded = HeadingClassifier.load(path)
+    if loaded.score(vectors) != classifier.score(vectors):
+        failures.append("scores differ after a save/load round trip")
+
+    undecided = HeadingClassifier(classifier.weights, classifier.bias, accept=1.1, reject=-0.1)
+    matching = 0
+    for pdf_path, (expected, _) in documents.items():
+        for model in (undecided, classifier):
+            previous = process_pdfs.use_heading_classifier(model)
+            try:
+                result = process_pdfs.extract_outline(pdf_path)
+            finally:
+                process_pdfs.use_heading_classifier(previous)
+            if model is undecided and result != expected:
+                failures.append(f"{os.path.basename(pdf_path)}: output changed by a model that decides no line")
+            elif model is classifier:
+                matching += result == expected
+    if matching != len(documents):
+        failures.append(f"only {matching} of {len(documents)} samples match with the classifier")
+    decided = sum(1 for decision in classifier.decide(vectors) if decision is not None)
+
+    # The model scores how often a text repeats: an edit changing a heading's
+    # count on another page must redo its page in an incremental run
+    repeats_only = HeadingClassifier([0.0] * 11 + [-8.0], 10.0, accept=0.5, reject=0.5)
+    previous = process_pdfs.use_heading_classifier(repeats_only)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "repeats.pdf")
+            with fitz.open() as doc:
+                for index, heading in enumerate(("Annual Programme Report", "Introduction", "Background",
+                                                 "Scope", "Overview", "Methods", "Results", "Summary")):
+                    page = doc.new_page()
+                    page.insert_text((72, 80), heading, fontsize=24 if index == 0 else 18, fontname="hebo")
+                    for line in range(20):
+                        page.insert_text((72, 120 + line * 14), f"Body text sentence {line} of page {index}",
+                                         fontsize=10)
+                doc.save(path)
+            state_dir = os.path.join(tmp, "state")
+            process_pdfs.extract_outline_incremental(path, state_dir)
+            with fitz.open(path) as doc:
+                for y in (500, 520):
+                    doc[6].insert_text((72, y), "Overview", fontsize=10)
+                doc.saveIncr()
+            if process_pdfs.extract_outline_incremental(path, state_dir) != extract_outline(path):
+                failures.append("incremental result differs from a full extraction after a repeat count changed")
+    finally:
+        process_pdfs.use_heading_classifier(previous)
+    return {"failures": failures, "lines": len(rows), "decided_lines": decided,
+            "fixtures_matching": matching, "fixtures": len(documents),
+            "rule_chain_seconds": round(train_heading_classifier.time_heading_stage(list(documents), None, 5), 4),
+            "classifier_seconds": round(train_heading_classifier.time_heading_stage(list(documents), classifier, 5), 4)}
+
+
+def check_load_test(rate=4.0, duration=1.0):
+    """
+    Run a short open-loop step of load_test.py in each mode: every request must
+    complete, with latency percentiles and usage samples in the report
+    """
+    import load_test  # imports this module for its synthetic documents
+
+    failures = []
+    documents = load_test.build_documents(PDF_DIR, 20)
+    for mode in load_test.MODES:
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = load_test.run_load_test(mode, [rate], duration, documents, {"sample": 3, "synthetic": 1},
+                                             workers=2, sample_seconds=0.1, warm_requests=1)
+        step = report["steps"][0]
+        if step["completed"] != step["requests"] or step["failed"]:
+            failures.append(f"{mode}: {step['completed']}/{step['requests']} completed, errors {step['errors']}")
+        if not step["latency_ms"] or not step["samples"]:
+            failures.append(f"{mode}: no latency percentiles or usage samples")
+    return failures
+
+
+def benchmark_analysis_overhead(repeats=5):
+    """Time extraction of the sample PDFs with and without the analysis report"""
+    paths = [os.path.join(PDF_DIR, f) for f in sorted(os.listdir(PDF_DIR)) if f.lower().endswith(".pdf")]
+    report = {}
+    for name, analysis in (("without_analysis", False), ("with_analysis", True)):
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for path in paths:
+                extract_outline(path, analysis=analysis)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        report[name + "_seconds"] = round(best, 4)
+    return report
+
+
+def compare_size_clustering(tolerances=(0.0, 0.3, 0.5), repeats=3):
+    """
+    Run the samples with several size-class tolerances (0.0 is the old exact
+    comparison of sizes rounded to 0.1pt) and report distinct size classes,
+    fixture accuracy and runtime for each
+    """
+    paths = [os.path.join(PDF_DIR, f) for f in sorted(os.listdir(PDF_DIR)) if f.lower().endswith(".pdf")]
+    expected = {}
+    sizes = {}
+    for path in paths:
+        with open(os.path.join(OUTPUT_DIR, os.path.basename(path).replace(".pdf", ".json")), encoding="utf-8") as f:
+            expected[path] = json.load(f)
+        with fitz.open(path) as doc:
+            sizes[path] = [round(s["size"], 1) for page in doc for b in page.get_text("dict")["blocks"]
+                           for l in b.get("lines", []) for s in l["spans"]]
+
+    original_tolerance = process_pdfs.SIZE_CLASS_TOLERANCE
+    report = []
+    try:
+        for tolerance in tolerances:
+            process_pdfs.SIZE_CLASS_TOLERANCE = tolerance
+            matches = 0
+            best = None
+            for _ in range(repeats):
+                start = time.perf_counter()
+                results = {path: extract_outline(path) for path in paths}
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            matches = sum(1 for path in paths if results[path] == expected[path])
+            report.append({
+                "tolerance": tolerance,
+                "size_classes": {os.path.basename(path): len(process_pdfs.build_size_classes(sizes[path])[1])
+                                 for path in paths},
+                "fixtures_matching": f"{matches}/{len(paths)}",
+                "seconds": round(best, 4),
+            })
+    finally:
+        process_pdfs.SIZE_CLASS_TOLERANCE = original_tolerance
+    return report
+
+
+def make_span_corpus(count, seed=0):
+    """Build a synthetic list of span strings resembling PDF text"""
+    rng = random.Random(seed)
+    words = ["Foundation", "Level", "Extensions", "Agile", "Tester", "the", "of",
+             "Ontario's", "Digital", "Library", "2.1", "Overview", "–", "•"]
+    extras = [""] * 12 + ["-", "...", "(TM)", "(c)", "\"", "'", "`"]
+    corpus = []
+    for _ in range(count):
+        span = " ".join(rng.choice(words) for _ in range(rng.randint(1, 8)))
+        corpus.append(span + rng.choice(extras))
+    return corpus
+
+
+def benchmark_unicode(span_count):
+    """Time the unicode helpers against the legacy replace loops"""
+    corpus = make_span_corpus(span_count)
+    report = {"spans": span_count}
+
+    for name, func in (("normalize", normalize_unicode_characters),
+                       ("normalize_legacy", legacy_normalize_unicode_characters)):
+        start = time.perf_counter()
+        normalized = [func(span) for span in corpus]
+        report[name + "_seconds"] = round(time.perf_counter() - start, 4)
+        report[name + "_output"] = normalized
+
+    hex_input = report["normalize_output"]
+    for name, func in (("hex", convert_special_chars_to_hex),
+                       ("hex_legacy", legacy_convert_special_chars_to_hex)):
+        start = time.perf_counter()
+        report[name + "_output"] = [func(span) for span in hex_input]
+        report[name + "_seconds"] = round(time.perf_counter() - start, 4)
+
+    report["normalize_identical"] = report.pop("normalize_output") == report.pop("normalize_legacy_output")
+    report["hex_identical"] = report.pop("hex_output") == report.pop("hex_legacy_output")
+    report["normalize_speedup"] = round(report["normalize_legacy_seconds"] / max(report["normalize_seconds"], 1e-9), 2)
+    report["hex_speedup"] = round(report["hex_legacy_seconds"] / max(report["hex_seconds"], 1e-9), 2)
+    return report
+
+
+COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import process_pdfs
+import_seconds = time.perf_counter() - start
+warm_up_seconds = process_pdfs.warm_up() if sys.argv[1] == "warm" else 0.0
+timings = []
+for path in sys.argv[2:]:
+    start = time.perf_counter()
+    process_pdfs.extract_outline(path)
+    timings.append(time.perf_counter() - start)
+print(json.dumps({"import_seconds": import_seconds, "warm_up_seconds": warm_up_seconds,
+                  "first_document_seconds": timings[0], "second_document_seconds": timings[1]}))
+"""
+
+
+def benchmark_cold_start(pdf_name="file02.pdf"):
+    """
+    Measure import time and first-document latency in fresh interpreters,
+    once cold and once after warm_up(); the same document is extracted twice
+    so the second run shows the steady-state latency
+    """
+    pdf_path = os.path.join(PDF_DIR, pdf_name)
+    report = {"document": pdf_name}
+    for mode in ("cold", "warm"):
+        completed = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", COLD_START_SCRIPT, mode, pdf_path, pdf_path],
+            cwd=SCRIPT_DIR, capture_output=True, text=True, check=True)
+        timings = json.loads(completed.stdout.strip().splitlines()[-1])
+        report[mode] = {key: round(value, 4) for key, value in timings.items()}
+    return report
+
+
+def make_long_document(page_count):
+    """
+    Build a long PDF (as bytes) by repeating the sample documents, file02 first
+    so the document starts with a real title page
+    """
+    sources = ["file02.pdf", "file03.pdf", "file04.pdf", "file01.pdf"]
+    long_doc = fitz.open()
+    while long_doc.page_count < page_count:
+        for name in sources:
+            with fitz.open(os.path.join(PDF_DIR, name)) as src_doc:
+                long_doc.insert_pdf(src_doc)
+            if long_doc.page_count >= page_count:
+                break
+    long_doc.select(list(range(page_count)))
+    pdf_bytes = long_doc.tobytes()
+    long_doc.close()
+    return pdf_bytes
+
+
+def legacy_group_text_by_lines(text_elements):
+    """Reference: the original grouping by 5-pixel buckets of the span's top y"""
+    line_groups = {}
+    for element in text_elements:
+        line_key = (element["page"], round(element.get("y_position", 0) / 5) * 5)
+        if line_key not in line_groups:
+            line_groups[line_key] = []
+        line_groups[line_key].append(element)
+    for line_key in line_groups:
+        line_groups[line_key].sort(key=lambda x: x.get("x_position", 0))
+    return list(line_groups.values())
+
+
+def compare_line_grouping(page_count, repeats=5):
+    """
+    Compare the visual-line grouping with the legacy y-bucket grouping on a long
+    document: grouping time, line counts, and how many visual lines the buckets
+    split in two (lines straddling a bucket boundary)
+    """
+    doc = process_pdfs.open_pdf(make_long_document(page_count))
+    start = time.perf_counter()
+    elements = [e for page_index in range(doc.page_count)
+                for e in process_pdfs.extract_page_elements(doc[page_index], page_index)]
+    extract_seconds = time.perf_counter() - start
+    doc.close()
+
+    report = {"pages": page_count, "spans": len(elements), "extract_seconds": round(extract_seconds, 4)}
+    for name, group in (("legacy", legacy_group_text_by_lines), ("visual_lines", process_pdfs.group_text_by_lines)):
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            groups = group(elements)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        report[name] = {"seconds": round(best, 5), "lines": len(groups)}
+        if name == "legacy":
+            buckets = {}
+            for index, line_group in enumerate(groups):
+                for element in line_group:
+                    buckets.setdefault((element["page"], element["line"]), set()).add(index)
+            report["legacy_split_lines"] = sum(1 for indexes in buckets.values() if len(indexes) > 1)
+    return report
+
+
+def simulate_makespan(durations, workers, followups=()):
+    """
+    Makespan of dispatching tasks of the given durations, in order, to the first
+    free worker; followups are (duration, indexes) of tasks that become ready once
+    the tasks at those indexes finish, and then go ahead of the tasks left
+    """
+    free_at = [0.0] * workers
+    finished_at = {}
+    queue = deque(enumerate(durations))
+    waiting = list(followups)
+    makespan = 0.0
+    while queue or waiting:
+        start = heapq.heappop(free_at)
+        ready = [followup for followup in waiting
+                 if all(finished_at.get(index, math.inf) <= start for index in followup[1])]
+        index = None
+        if ready:
+            duration = ready[0][0]
+            waiting.remove(ready[0])
+        elif queue:
+            index, duration = queue.popleft()
+        else:
+            # Only follow-ups are left: wait for the first to become ready
+            followup = min(waiting, key=lambda f: max(finished_at[index] for index in f[1]))
+            waiting.remove(followup)
+            duration = followup[0]
+            start = max(start, max(finished_at[index] for index in followup[1]))
+        if index is not None:
+            finished_at[index] = start + duration
+        heapq.heappush(free_at, start + duration)
+        makespan = max(makespan, start + duration)
+    return makespan
+
+
+def simulated_makespans(input_dir, output_dir, workers):
+    """
+    Time every task of both dispatch orders once, sequentially, and simulate the
+    makespan each order gives on workers processes (independent of the cores of
+    the machine running the benchmark); a split document is analysed by a
+    follow-up task that becomes ready once all its page-range subtasks finish
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(file, os.path.join(input_dir, file), os.path.join(output_dir, file.replace(".pdf", ".json")),
+              False, None) for file in sorted(os.listdir(input_dir))]
+    scheduled, parts = process_pdfs.schedule_tasks(tasks, workers)
+    durations = {}
+    for order in (tasks, scheduled):
+        for task in order:
+            if task in durations:
+                continue
+            start = time.perf_counter()
+            process_pdfs._process_pdf_task(task)
+            durations[task] = time.perf_counter() - start
+    followups = []
+    for file in parts:
+        indexes = [index for index, task in enumerate(scheduled) if task[0] == file]
+        split_parts = {}
+        for index in indexes:
+            _, page_range, part_result, _, _ = process_pdfs._process_pdf_task(scheduled[index])
+            split_parts[page_range] = part_result
+        start = time.perf_counter()
+        process_pdfs.finish_split_document(
+            process_pdfs.split_document_task(scheduled[indexes[-1]], split_parts, {}, []))
+        followups.append((time.perf_counter() - start, indexes))
+    return {"name_order": round(simulate_makespan([durations[t] for t in tasks], workers), 3),
+            "cost_scheduled": round(simulate_makespan([durations[t] for t in scheduled], workers, followups), 3),
+            "split_documents": len(parts)}
+
+
+def benchmark_scheduling(small_copies=8, manual_pages=300, manuals=2, workers=4):
+    """
+    Compare the batch makespan of name order with longest-first cost scheduling on
+    a skewed corpus: copies of the samples plus a few long manuals named so that
+    name order reaches them last. Reports the measured wall time of both batches
+    (which only shows the difference with at least `workers` cores) and the
+    simulated makespan from per-task timings. Both runs must write identical outputs
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        input_dir = os.path.join(work_dir, "pdfs")
+        os.makedirs(input_dir)
+        for copy in range(small_copies):
+            for file in sorted(os.listdir(PDF_DIR)):
+                if file.lower().endswith(".pdf"):
+                    shutil.copy(os.path.join(PDF_DIR, file), os.path.join(input_dir, f"a{copy:02d}_{file}"))
+        manual_bytes = make_long_document(manual_pages)
+        for index in range(manuals):
+            with open(os.path.join(input_dir, f"z_manual{index}.pdf"), "wb") as f:
+                f.write(manual_bytes)
+
+        report = {"documents": len(os.listdir(input_dir)), "workers": workers, "manual_pages": manual_pages}
+        outputs = {}
+        for name, cost_scheduling in (("name_order", False), ("cost_scheduled", True)):
+            output_dir = os.path.join(work_dir, name)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                counts = process_pdfs.process_pdfs(input_dir, output_dir, workers=workers,
+                                                   cost_scheduling=cost_scheduling)
+            elapsed = time.perf_counter() - start
+            outputs[name] = {}
+            for file in os.listdir(output_dir):
+                with open(os.path.join(output_dir, file), encoding="utf-8") as f:
+                    outputs[name][file] = json.load(f)
+            report[name] = {"seconds": round(elapsed, 3), "split_documents": counts["split_documents"]}
+        report["speedup"] = round(report["name_order"]["seconds"] / report["cost_scheduled"]["seconds"], 2)
+        report["simulated"] = simulated_makespans(input_dir, os.path.join(work_dir, "simulated"), workers)
+        report["simulated"]["speedup"] = round(report["simulated"]["name_order"] /
+                                               report["simulated"]["cost_scheduled"], 2)
+        report["cpu_count"] = os.cpu_count()
+        report["identical_outputs"] = outputs["name_order"] == outputs["cost_scheduled"]
+        # What cost scheduling adds before the first task is dispatched, run serially
+        # in the parent: opening every document for its page count, and sorting
+        tasks = [(file, os.path.join(input_dir, file), None, False, None) for file in sorted(os.listdir(input_dir))]
+        start = time.perf_counter()
+        process_pdfs.schedule_tasks(tasks, workers)
+        report["schedule_seconds"] = round(time.perf_counter() - start, 4)
+        report["schedule_share"] = round(report["schedule_seconds"] / report["cost_scheduled"]["seconds"], 4)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+MEMORY_PROFILE_SCRIPT = """
+import json, sys
+import process_pdfs
+process_pdfs.MEMORY_BUDGET_MB = float(sys.argv[1]) or None
+result, report = process_pdfs.profile_memory(sys.argv[2])
+report["outline"] = result["outline"]
+print(json.dumps(report))
+"""
+
+
+def benchmark_memory(long_pages=200):
+    """
+    Profile extraction memory per stage in fresh interpreters (so the RSS of one
+    run does not hide the next) for the samples, a long document and an
+    image-only document, each without a memory budget and with a tiny one that
+    switches to the low-memory path after the first page
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        documents = {file: os.path.join(PDF_DIR, file) for file in sorted(os.listdir(PDF_DIR))
+                     if file.lower().endswith(".pdf")}
+        generated = {"scanned_200dpi.pdf": make_scanned_document(dpi=200)}
+        if long_pages:
+            generated[f"long_{long_pages}_pages.pdf"] = make_long_document(long_pages)
+        for name, pdf_bytes in generated.items():
+            documents[name] = os.path.join(work_dir, name)
+            with open(documents[name], "wb") as f:
+                f.write(pdf_bytes)
+
+        report = {}
+        for name, path in documents.items():
+            runs = {}
+            for mode, budget in (("default", "0"), ("low_memory", "0.001")):
+                completed = subprocess.run(
+                    [sys.executable, "-W", "ignore", "-c", MEMORY_PROFILE_SCRIPT, budget, path],
+                    cwd=SCRIPT_DIR, capture_output=True, text=True, check=True)
+                runs[mode] = json.loads(completed.stdout.strip().splitlines()[-1])
+            default = runs["default"]
+            report[name] = {
+                "peak_traced_kb": default["peak_traced_kb"],
+                "peak_rss_growth_kb": default["peak_rss_growth_kb"],
+                "stages": [{key: stage[key] for key in ("stage", "seconds", "traced_peak_kb", "rss_kb",
+                                                        "top_allocations")}
+                           for stage in default["stages"]],
+                "low_memory": {
+                    "switched": any(stage["stage"] == "low_memory" for stage in runs["low_memory"]["stages"]),
+                    "peak_traced_kb": runs["low_memory"]["peak_traced_kb"],
+                    "peak_rss_growth_kb": runs["low_memory"]["peak_rss_growth_kb"],
+                    "same_outline": runs["low_memory"]["outline"] == default["outline"],
+                },
+            }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+def benchmark_partial_extraction(page_count, repeats=3):
+    """
+    Compare full, title-only, first-pages and early-stop extraction on a long
+    document; every partial mode must give the title of the full extraction
+    """
+    pdf_bytes = make_long_document(page_count)
+    modes = {
+        "full": {},
+        "title_only": {"title_only": True},
+        "first_10_pages": {"pages": range(0, 10)},
+        "max_5_headings": {"max_headings": 5},
+    }
+    report = {"pages": page_count, "failures": []}
+    full_title = None
+    for name, options in modes.items():
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = extract_outline(pdf_bytes, **options)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        if name == "full":
+            full_title = result["title"]
+        report[name] = {"seconds": round(best, 4), "headings": len(result["outline"]),
+                        "same_title_as_full": result["title"] == full_title}
+        if result["title"] != full_title:
+            report["failures"].append(f"{name}: title {result['title']!r}, full extraction {full_title!r}")
+    return report
+
+
+def benchmark_span_cache(long_pages, repeats=3):
+    """
+    Time full extraction of the samples (plus a long document when long_pages is
+    set) without the span cache, with an empty one (extract and store) and with a
+    filled one (replay the analysis from the cache); every cached run, with and
+    without the analysis report, must give the uncached result
+    Span seconds are the time spent getting the spans (opening and reading the
+    PDFs, or loading the cache entries), the rest is analysis
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        paths = [os.path.join(PDF_DIR, file) for file in sorted(os.listdir(PDF_DIR)) if file.lower().endswith(".pdf")]
+        if long_pages:
+            paths.append(os.path.join(work_dir, "long.pdf"))
+            with open(paths[-1], "wb") as f:
+                f.write(make_long_document(long_pages))
+        expected = {(path, analysis): extract_outline(path, analysis=analysis)
+                    for path in paths for analysis in (False, True)}
+
+        def run_all(analysis=False):
+            recorder = StageRecorder()
+            previous_hook = process_pdfs.use_stage_hook(recorder)
+            try:
+                mismatches = [os.path.basename(path) for path in paths
+                              if extract_outline(path, analysis=analysis) != expected[path, analysis]]
+            finally:
+                process_pdfs.use_stage_hook(previous_hook)
+            timings = recorder.finish()
+            span_seconds = sum(end - start for stage, start, end in timings["stages"]
+                               if stage in ("open", "extract_pages", "span_cache")) / 1e9
+            return (timings["end_ns"] - timings["start_ns"]) / 1e9, span_seconds, mismatches
+
+        uncached_runs = [run_all() for _ in range(repeats)]
+        uncached, uncached_spans, _ = min(uncached_runs)
+        cache = SpanCache(os.path.join(work_dir, "cache"), process_pdfs.span_cache_fingerprint())
+        previous = process_pdfs.use_span_cache(cache)
+        try:
+            cold, _, mismatches = run_all()
+            warm_runs = [run_all() for _ in range(repeats)]
+            mismatches += [file for _, _, run in warm_runs for file in run]
+            mismatches += run_all(analysis=True)[2] + run_all(analysis=True)[2]
+        finally:
+            process_pdfs.use_span_cache(previous)
+        warm, warm_spans, _ = min(warm_runs)
+        cache_bytes = sum(os.path.getsize(os.path.join(cache.directory, f)) for f in os.listdir(cache.directory))
+        pdf_bytes = sum(os.path.getsize(path) for path in paths)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {"documents": len(paths), "long_pages": long_pages,
+            "uncached_seconds": round(uncached, 4), "cold_cache_seconds": round(cold, 4),
+            "warm_cache_seconds": round(warm, 4), "speedup": round(uncached / warm, 2),
+            "uncached_span_seconds": round(uncached_spans, 4), "warm_cache_span_seconds": round(warm_spans, 4),
+            "span_speedup": round(uncached_spans / warm_spans, 1),
+            "cache_bytes": cache_bytes, "pdf_bytes": pdf_bytes, "mismatches": sorted(set(mismatches))}
+
+
+def benchmark_artifact_transport(long_pages, copies=3, workers=2, repeats=2):
+    """
+    Batch copies of a long document, split into page-range subtasks, with their
+    spans pickled through the parent (the baseline) and handed over through an
+    ArtifactStore. Reports the wall time, the parent's CPU time and its peak
+    traced heap (with pickling it holds the parts of every split document until
+    its analysis is queued, then pickles them again) and what goes through the
+    pipes: the subtasks' results and the follow-up tasks analysing the
+    documents. Both must give the same spans and the same outputs
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        input_dir = os.path.join(work_dir, "in")
+        os.makedirs(input_dir)
+        long_bytes = make_long_document(long_pages)
+        for copy in range(copies):
+            with open(os.path.join(input_dir, f"long{copy}.pdf"), "wb") as f:
+                f.write(long_bytes)
+        shutil.copyfile(os.path.join(PDF_DIR, "file02.pdf"), os.path.join(input_dir, "file02.pdf"))
+        long_path = os.path.join(input_dir, "long0.pdf")
+        tasks = [("long0.pdf", long_path, None, False, (start, min(start + process_pdfs.SPLIT_CHUNK_PAGES, long_pages)))
+                 for start in range(0, long_pages, process_pdfs.SPLIT_CHUNK_PAGES)]
+
+        def collect(store):
+            previous = process_pdfs.use_artifact_store(store)
+            try:
+                payloads = [payload for _, _, payload, _ in
+                            batch_runner.run_supervised(process_pdfs._process_pdf_task, tasks, workers)]
+            finally:
+                process_pdfs.use_artifact_store(previous)
+            followup = process_pdfs.split_document_task(tasks[0], {payload[1]: payload[2] for payload in payloads},
+                                                        {}, [payload[4] for payload in payloads])
+            pipe_bytes = sum(len(pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL))
+                             for item in payloads + [followup])
+            parts = [store.get(payload[2]) if isinstance(payload[2], ArtifactHandle) else payload[2]
+                     for payload in payloads]
+            return parts, pipe_bytes
+
+        baseline_parts, pickle_bytes = collect(None)
+        with ArtifactStore() as store:
+            handle_parts, handle_bytes = collect(store)
+            artifact_bytes = store.received_bytes
+        identical_parts = sorted(baseline_parts, key=repr) == sorted(handle_parts, key=repr)
+
+        report = {"pickle": {"pipe_bytes_per_document": pickle_bytes},
+                  "handles": {"pipe_bytes_per_document": handle_bytes, "artifact_bytes_per_document": artifact_bytes}}
+        outputs = {}
+        artifact_dirs = set(os.listdir(ARTIFACT_DIR))
+        for mode in ("pickle", "handles"):
+            output_dir = os.path.join(work_dir, mode)
+            runs = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                cpu_start = time.process_time()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    process_pdfs.process_pdfs(input_dir, output_dir, workers=workers,
+                                              shared_artifacts=mode == "handles")
+                runs.append((time.perf_counter() - start, time.process_time() - cpu_start))
+            # A separate run: tracing slows the batch down
+            tracemalloc.start()
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    process_pdfs.process_pdfs(input_dir, output_dir, workers=workers,
+                                              shared_artifacts=mode == "handles")
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            report[mode].update(seconds=round(min(run[0] for run in runs), 3),
+                                parent_cpu_seconds=round(min(run[1] for run in runs), 4),
+                                parent_peak_kb=peak // 1024)
+            outputs[mode] = {file: open(os.path.join(output_dir, file), encoding="utf-8").read()
+                             for file in sorted(os.listdir(output_dir))}
+        report["identical_outputs"] = outputs["pickle"] == outputs["handles"]
+        report["leftover_artifact_dirs"] = len(set(os.listdir(ARTIFACT_DIR)) - artifact_dirs)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return dict(report, documents=copies, pages=long_pages, parts=len(tasks), workers=workers,
+                spans=sum(len(part[0]) for part in baseline_parts), identical_parts=identical_parts)
+
+
+def benchmark_incremental(long_pages):
+    """
+    Edit one page of each sample and of a long document (a body-text line added
+    by an incremental save) and re-extract it from the state of the unedited
+    version: the result must equal a full extraction of the edited file, and
+    the long document should only have its edited page read and analysed
+    """
+    work_dir = tempfile.mkdtemp()
+    mismatches = []
+    try:
+        paths = [os.path.join(PDF_DIR, file) for file in sorted(os.listdir(PDF_DIR)) if file.lower().endswith(".pdf")]
+        long_path = os.path.join(work_dir, "long.pdf")
+        with open(long_path, "wb") as f:
+            f.write(make_long_document(long_pages))
+        paths.append(long_path)
+        for path in paths:
+            edited = os.path.join(work_dir, "edited-" + os.path.basename(path))
+            shutil.copyfile(path, edited)
+            state_dir = os.path.join(work_dir, os.path.basename(path) + ".state")
+            start = time.perf_counter()
+            first = process_pdfs.extract_outline_incremental(edited, state_dir)
+            cold = time.perf_counter() - start
+            with fitz.open(edited) as doc:
+                page = doc[doc.page_count // 2]
+                page.insert_text((72, page.rect.height - 60), "An added sentence of body text", fontsize=10)
+                doc.saveIncr()
+            work = {}
+            start = time.perf_counter()
+            result = process_pdfs.extract_outline_incremental(edited, state_dir, work=work)
+            incremental = time.perf_counter() - start
+            start = time.perf_counter()
+            expected = extract_outline(edited)
+            full = time.perf_counter() - start
+            if result != expected or first != extract_outline(path):
+                mismatches.append(os.path.basename(path))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    # Timings and work of the last (long) document
+    return {"pages": long_pages, "full_seconds": round(full, 4), "cold_seconds": round(cold, 4),
+            "edit_seconds": round(incremental, 4), "speedup": round(full / incremental, 1),
+            "work": work, "mismatches": mismatches}
+
+
+TEMPLATE_HEADER = "Regional Services Application Packet"
+TEMPLATE_FOOTER = "Office Use Only Reference Section"
+# A real section heading every document of the template shares
+TEMPLATE_SECTION = "Revision History"
+
+
+def make_template_document(index, pages=3):
+    """
+    Build one PDF (as bytes) of a templated corpus: every page repeats the same
+    heading-sized running header and footer, the last page ends with the shared
+    section heading, the other headings are per-document
+    """
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 40), TEMPLATE_HEADER, fontsize=14, fontname="hebo")
+        if page_number == 0:
+            page.insert_text((72, 90), f"Case {index} Summary", fontsize=22, fontname="hebo")
+        page.insert_text((72, 120), f"Review Part {page_number + 1} for Case {index}", fontsize=14, fontname="hebo")
+        for line in range(30):
+            page.insert_text((72, 150 + line * 18),
+                             f"Body text line {line} of case {index} describes the request in plain words.",
+                             fontsize=10)
+        if page_number == pages - 1:
+            page.insert_text((72, 700), TEMPLATE_SECTION, fontsize=14, fontname="hebo")
+            page.insert_text((72, 730), f"Revised for case {index} after the review.", fontsize=10)
+        page.insert_text((72, 800), TEMPLATE_FOOTER, fontsize=14, fontname="hebo")
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+
+# (text, font size) of the deep specification document, with the level of each
+# heading at OUTLINE_DEPTH 6
+DEEP_SPEC_HEADINGS = (
+    ("1. System Overview", 18, "H1"),
+    ("1.1 Hardware Components", 16, "H2"),
+    ("1.1.1 Controller", 14, "H3"),
+    ("1.1.1.1 Register Map", 13, "H4"),
+    ("1.1.1.1.1 Status register", 12, "H5"),
+    ("Reset behaviour", 11, "H6"),
+    ("Bit layout", 11, "H6"),
+    ("1.1.1.2 Timer Units", 13, "H4"),
+    ("1.2 External Interfaces", 16, "H2"),
+    ("2. Normal Operation", 18, "H1"),
+)
+
+
+def make_deep_document():
+    """Build a PDF (as bytes) of a specification whose headings go down to H6"""
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 50), "Interface Specification", fontsize=24, fontname="hebo")
+    y = 90
+    for text, size, _ in DEEP_SPEC_HEADINGS:
+        if y > 740:
+            page = doc.new_page()
+            y = 50
+        y += size
+        page.insert_text((72, y), text, fontsize=size, fontname="hebo")
+        y += 14
+        for _ in range(3):
+            page.insert_text((72, y), "Body text line describing the section in ordinary words here.", fontsize=9)
+            y += 13
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+
+def check_outline_depth(heading_counts=(5_000, 50_000)):
+    """
+    Extract the deep specification with OUTLINE_DEPTH 6 (every level must match)
+    and 3 (only H1-H3), and time assign_proper_hierarchy at depth 6 over a
+    growing number of headings, which should scale linearly
+    """
+    failures = []
+    previous_depth = process_pdfs.OUTLINE_DEPTH
+    with tempfile.TemporaryDirectory() as work_dir:
+        pdf_path = os.path.join(work_dir, "deep.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(make_deep_document())
+        try:
+            process_pdfs.OUTLINE_DEPTH = 6
+            outline = [(item["text"], item["level"]) for item in extract_outline(pdf_path)["outline"]]
+            expected = [(text, level) for text, _, level in DEEP_SPEC_HEADINGS]
+            if outline != expected:
+                failures.append(f"depth 6 outline {outline}")
+            process_pdfs.OUTLINE_DEPTH = 3
+            outline = [(item["text"], item["level"]) for item in extract_outline(pdf_path)["outline"]]
+            expected = [(text, level) for text, _, level in DEEP_SPEC_HEADINGS if int(level[1:]) <= 3]
+            if outline != expected:
+                failures.append(f"depth 3 outline {outline}")
+
+            process_pdfs.OUTLINE_DEPTH = 6
+            rng = random.Random(0)
+            scaling = []
+            for count in heading_counts:
+                headings = []
+                for index in range(count):
+                    number = ".".join(str(rng.randint(1, 9)) for _ in range(rng.randint(1, 6)))
+                    text = rng.choice((f"{number} Clause {index}", f"Clause {index}"))
+                    numbering = process_pdfs.parse_numbering(text)
+                    headings.append({"level": "H2", "text": text, "size": 12.0, "size_class": rng.randint(1, 6),
+                                     "bold": rng.random() < 0.5, "numbering": numbering,
+                                     "has_numbering": process_pdfs.starts_with_section_number(numbering)})
+                start = time.perf_counter()
+                process_pdfs.assign_proper_hierarchy(headings, 10.0)
+                scaling.append({"headings": count, "seconds": round(time.perf_counter() - start, 4)})
+        finally:
+            process_pdfs.OUTLINE_DEPTH = previous_depth
+    growth = heading_counts[-1] / heading_counts[0]
+    return {"failures": failures, "hierarchy_scaling": scaling,
+            "time_growth": round(scaling[-1]["seconds"] / scaling[0]["seconds"], 2) if scaling[0]["seconds"] else None,
+            "size_growth": growth}
+
+
+def benchmark_corpus_model(document_count=60):
+    """
+    Extract a templated corpus with and without a learning corpus frequency
+    model and count how often the running header/footer still reach the outline;
+    with the model, no running header/footer and every shared section heading
+    must remain
+    """
+    documents = [make_template_document(index) for index in range(document_count)]
+    boilerplate = {TEMPLATE_HEADER, TEMPLATE_FOOTER}
+    model = CorpusFrequencyModel(width=1 << 14, min_documents=10)
+    report = {"documents": document_count, "model_bytes": model.counts.itemsize * len(model.counts),
+              "failures": []}
+    for name, corpus_model in (("without_model", None), ("with_model", model)):
+        previous = process_pdfs.use_corpus_model(corpus_model)
+        try:
+            start = time.perf_counter()
+            outlines = [extract_outline(pdf_bytes)["outline"] for pdf_bytes in documents]
+            elapsed = time.perf_counter() - start
+        finally:
+            process_pdfs.use_corpus_model(previous)
+        # Only the documents after the warm-up period can be filtered
+        late = outlines[model.min_documents:]
+        report[name] = {
+            "seconds": round(elapsed, 4),
+            "boilerplate_headings": sum(1 for outline in late for h in outline if h["text"].strip() in boilerplate),
+            "other_headings": sum(1 for outline in late for h in outline if h["text"].strip() not in boilerplate),
+            "shared_section_headings": sum(1 for outline in late for h in outline
+                                           if h["text"].strip() == TEMPLATE_SECTION),
+        }
+    with_model = report["with_model"]
+    if with_model["boilerplate_headings"]:
+        report["failures"].append(f"{with_model['boilerplate_headings']} running headers/footers kept")
+    if with_model["shared_section_headings"] != report["without_model"]["shared_section_headings"]:
+        report["failures"].append(f"{TEMPLATE_SECTION!r} kept in {with_model['shared_section_headings']} of "
+                                  f"{report['without_model']['shared_section_headings']} documents")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and regression checks for process_pdfs")
+    parser.add_argument("--unicode-spans", type=int, default=1_000_000,
+                        help="number of spans for the unicode microbenchmark (0 to skip)")
+    parser.add_argument("--long-pages", type=int, default=200,
+                        help="page count of the synthetic document for partial extraction (0 to skip)")
+    parser.add_argument("--no-cold-start", action="store_true",
+                        help="skip the import and first-document latency measurement")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the per-stage memory profile")
+    parser.add_argument("--schedule-workers", type=int, default=4,
+                        help="workers for the cost-scheduling makespan comparison (0 to skip)")
+    parser.add_argument("--corpus-documents", type=int, default=60,
+                        help="size of the templated corpus for the corpus model check (0 to skip)")
+    parser.add_argument("--no-span-cache", action="store_true",
+                        help="skip the span cache replay benchmark")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = {"pinned_unicode_failures": check_pinned_unicode(),
+              "pinned_numbering_failures": check_pinned_numbering(),
+              "collinear_line_failures": check_collinear_lines(),
+              "numbering": benchmark_numbering(),
+              "line_derivations": count_line_derivations(),
+              "font_styles": check_font_styles(),
+              "fixtures": check_fixture_outputs(),
+              "pipeline_failures": check_pipeline_stages(),
+              "outline_depth": check_outline_depth(),
+              "scanned_document_failures": check_scanned_documents(),
+              "fault_isolation_failures": check_fault_isolation(),
+              "worker_crash_failures": check_worker_crashes(),
+              "batch_settings_failures": check_batch_settings(),
+              "split_document_failures": check_split_documents(),
+              "iter_outlines_failures": check_iter_outlines(),
+              "heading_classifier": check_heading_classifier(),
+              "load_test_failures": check_load_test(),
+              "analysis_overhead": benchmark_analysis_overhead(),
+              "size_clustering": compare_size_clustering()}
+    if args.unicode_spans:
+        report["unicode"] = benchmark_unicode(args.unicode_spans)
+    if not args.no_cold_start:
+        report["cold_start"] = benchmark_cold_start()
+    if args.long_pages:
+        report["partial_extraction"] = benchmark_partial_extraction(args.long_pages)
+        report["line_grouping"] = compare_line_grouping(args.long_pages)
+        report["incremental"] = benchmark_incremental(args.long_pages)
+        report["artifact_transport"] = benchmark_artifact_transport(args.long_pages)
+    if not args.no_memory:
+        report["memory"] = benchmark_memory(args.long_pages)
+    if args.schedule_workers:
+        report["scheduling"] = benchmark_scheduling(workers=args.schedule_workers)
+    if args.corpus_documents:
+        report["corpus_model"] = benchmark_corpus_model(args.corpus_documents)
+    if not args.no_span_cache:
+        report["span_cache"] = benchmark_span_cache(args.long_pages)
+
+    for row in report["fixtures"]:
+        status = "OK" if row["matches_expected"] else "MISMATCH"
+        print(f"{row['file']:<12} {row['seconds']:.3f}s  {row['headings']:>3} headings  {status}")
+    total = sum(row["seconds"] for row in report["fixtures"])
+    print(f"Total: {total:.3f}s for {len(report['fixtures'])} documents")
+    overhead = report["analysis_overhead"]
+    print(f"Analysis report: {overhead['with_analysis_seconds']:.3f}s with, "
+          f"{overhead['without_analysis_seconds']:.3f}s without (all samples, best of 5)")
+    if "unicode" in report:
+        u = report["unicode"]
+        print(f"Unicode normalize: {u['normalize_seconds']:.3f}s vs legacy {u['normalize_legacy_seconds']:.3f}s "
+              f"({u['normalize_speedup']}x, identical={u['normalize_identical']})")
+        print(f"Hex escaping:      {u['hex_seconds']:.3f}s vs legacy {u['hex_legacy_seconds']:.3f}s "
+              f"({u['hex_speedup']}x, identical={u['hex_identical']})")
+    numbering = report["numbering"]
+    print(f"Numbering checks ({numbering['clauses']} clauses): parsed once {numbering['parsed_seconds']:.3f}s vs "
+          f"legacy regexes {numbering['legacy_seconds']:.3f}s ({numbering['speedup']}x, "
+          f"identical={numbering['identical']})")
+    derivations = report["line_derivations"]
+    print(f"Heading stage: {derivations['lines']} candidate lines ({derivations['heading_sized_lines']} heading-sized) "
+          f"in {derivations['seconds']:.4f}s; {sum(derivations['calls'].values())} text-deriving calls, "
+          f"{derivations['calls_per_heading_sized_line']} per heading-sized line")
+    classifier = report["heading_classifier"]
+    print(f"Heading classifier (trained on the samples): decides {classifier['decided_lines']} of "
+          f"{classifier['lines']} classifiable lines, {classifier['fixtures_matching']}/{classifier['fixtures']} "
+          f"samples match; heading stage {classifier['classifier_seconds']:.4f}s vs rule chain "
+          f"{classifier['rule_chain_seconds']:.4f}s")
+    styles = report["font_styles"]
+    print(f"Span styles ({styles['spans']} spans, {styles['unique_fonts']} fonts): flags only "
+          f"{styles['style_ns_per_span']['flags_only']} ns/span, flags and font name "
+          f"{styles['style_ns_per_span']['flags_and_font']} ns/span; reading costs "
+          f"{styles['read_ns_per_span']} ns/span ({styles['added_share_of_read']:.3%} added)")
+    depth = report["outline_depth"]
+    timings = ", ".join(f"{row['headings']} headings {row['seconds']:.3f}s" for row in depth["hierarchy_scaling"])
+    print(f"Hierarchy at depth 6: {timings} ({depth['time_growth']}x the time for "
+          f"{depth['size_growth']:.0f}x the headings)")
+    for row in report["size_clustering"]:
+        classes = ", ".join(f"{name[:-4]}={count}" for name, count in row["size_classes"].items())
+        print(f"Size tolerance {row['tolerance']:.1f}pt: {row['fixtures_matching']} samples match, "
+              f"{row['seconds']:.3f}s, size classes {classes}")
+    if "cold_start" in report:
+        for mode in ("cold", "warm"):
+            c = report["cold_start"][mode]
+            print(f"{mode.capitalize()} start ({report['cold_start']['document']}): import {c['import_seconds']:.3f}s, "
+                  f"warm-up {c['warm_up_seconds']:.3f}s, first document {c['first_document_seconds']:.3f}s, "
+                  f"second document {c['second_document_seconds']:.3f}s")
+    if "partial_extraction" in report:
+        partial = report["partial_extraction"]
+        for mode in ("full", "title_only", "first_10_pages", "max_5_headings"):
+            row = partial[mode]
+            print(f"{partial['pages']}-page document, {mode:<15} {row['seconds']:.3f}s  "
+                  f"{row['headings']:>4} headings  same title: {row['same_title_as_full']}")
+    if "line_grouping" in report:
+        grouping = report["line_grouping"]
+        print(f"Line grouping ({grouping['pages']} pages, {grouping['spans']} spans): "
+              f"visual lines {grouping['visual_lines']['seconds']:.4f}s ({grouping['visual_lines']['lines']} lines) vs "
+              f"y buckets {grouping['legacy']['seconds']:.4f}s ({grouping['legacy']['lines']} lines, "
+              f"{grouping['legacy_split_lines']} lines split at bucket boundaries)")
+    if "incremental" in report:
+        inc = report["incremental"]
+        print(f"One-page edit of a {inc['pages']}-page document: full extraction {inc['full_seconds']:.3f}s, "
+              f"incremental {inc['edit_seconds']:.3f}s ({inc['speedup']}x; {inc['work']['read_pages']} page(s) "
+              f"read, {inc['work']['analysed_pages']} analysed, {inc['work']['consolidated_pages']} "
+              f"consolidated; first run with state {inc['cold_seconds']:.3f}s); "
+              f"mismatches: {inc['mismatches'] or 'none'}")
+    if "artifact_transport" in report:
+        transport = report["artifact_transport"]
+        for mode in ("pickle", "handles"):
+            row = transport[mode]
+            print(f"Split-document spans ({transport['documents']} x {transport['pages']} pages + 1 sample, "
+                  f"{transport['workers']} workers) by {mode:<7}: {row['seconds']:.2f}s, parent CPU "
+                  f"{row['parent_cpu_seconds']:.3f}s, parent peak heap {row['parent_peak_kb']} KB, "
+                  f"{row['pipe_bytes_per_document'] / 1024:.0f} KiB through the pipes per document")
+        print(f"Shared artifacts: {transport['handles']['artifact_bytes_per_document'] / 1024:.0f} KiB of scratch "
+              f"files per document ({transport['spans']} spans), same spans: {transport['identical_parts']}, "
+              f"identical outputs: {transport['identical_outputs']}, "
+              f"leftover scratch directories: {transport['leftover_artifact_dirs']}")
+    if "memory" in report:
+        for name, row in report["memory"].items():
+            heaviest = max(row["stages"], key=lambda stage: stage["traced_peak_kb"])
+            low = row["low_memory"]
+            print(f"Memory {name:<22} traced peak {row['peak_traced_kb']:>6} KB ({heaviest['stage']}), "
+                  f"RSS growth {row['peak_rss_growth_kb']:>6} KB; low-memory path: RSS growth "
+                  f"{low['peak_rss_growth_kb']:>6} KB, same outline: {low['same_outline']}")
+    if "scheduling" in report:
+        s = report["scheduling"]
+        print(f"Skewed batch ({s['documents']} documents incl. {s['manual_pages']}-page manuals, "
+              f"{s['workers']} workers): name order {s['name_order']['seconds']:.2f}s, "
+              f"cost scheduled {s['cost_scheduled']['seconds']:.2f}s ({s['speedup']}x, "
+              f"{s['cost_scheduled']['split_documents']} documents split, scheduling "
+              f"{s['schedule_seconds']:.3f}s = {s['schedule_share']:.1%} of the batch, identical outputs: {s['identical_outputs']}, "
+              f"{s['cpu_count']} CPU(s))")
+        print(f"Simulated makespan on {s['workers']} workers: name order {s['simulated']['name_order']:.2f}s, "
+              f"cost scheduled {s['simulated']['cost_scheduled']:.2f}s ({s['simulated']['speedup']}x)")
+    if "corpus_model" in report:
+        corpus = report["corpus_model"]
+        for mode in ("without_model", "with_model"):
+            row = corpus[mode]
+            print(f"Templated corpus ({corpus['documents']} docs), {mode:<13} {row['seconds']:.3f}s  "
+                  f"boilerplate headings {row['boilerplate_headings']}, other headings {row['other_headings']} "
+                  f"({row['shared_section_headings']} shared section headings)")
+        print(f"Corpus model size: {corpus['model_bytes'] / 1024:.0f} KiB")
+    if "span_cache" in report:
+        cache = report["span_cache"]
+        print(f"Span cache ({cache['documents']} documents incl. {cache['long_pages']}-page one): "
+              f"uncached {cache['uncached_seconds']:.3f}s, cold cache {cache['cold_cache_seconds']:.3f}s, "
+              f"warm cache {cache['warm_cache_seconds']:.3f}s ({cache['speedup']}x); getting the spans "
+              f"{cache['uncached_span_seconds']:.3f}s vs {cache['warm_cache_span_seconds']:.3f}s "
+              f"({cache['span_speedup']}x); "
+              f"{cache['cache_bytes'] / 1024:.0f} KiB cached for {cache['pdf_bytes'] / 1024:.0f} KiB of PDFs; "
+              f"mismatches: {cache['mismatches'] or 'none'}")
+    for failure in report["pinned_unicode_failures"]:
+        print("Pinned unicode mismatch:", failure)
+    for failure in report["pinned_numbering_failures"]:
+        print("Pinned numbering mismatch:", failure)
+    for failure in report["collinear_line_failures"]:
+        print("Visual line mismatch:", failure)
+    for failure in report["font_styles"]["failures"]:
+        print("Font style check failed:", failure)
+    for failure in report["outline_depth"]["failures"]:
+        print("Outline depth check failed:", failure)
+    for failure in report["pipeline_failures"]:
+        print("Pipeline check failed:", failure)
+    for failure in report["scanned_document_failures"]:
+        print("Scanned document check failed:", failure)
+    for failure in report["fault_isolation_failures"]:
+        print("Fault isolation check failed:", failure)
+    for failure in report["batch_settings_failures"]:
+        print("Batch settings check failed:", failure)
+    for failure in report["split_document_failures"]:
+        print("Split document check failed:", failure)
+    for failure in report["worker_crash_failures"]:
+        print("Worker crash check failed:", failure)
+    for failure in report["iter_outlines_failures"]:
+        print("iter_outlines check failed:", failure)
+    for failure in report["heading_classifier"]["failures"]:
+        print("Heading classifier check failed:", failure)
+    for failure in report["load_test_failures"]:
+        print("Load test check failed:", failure)
+    for failure in report.get("corpus_model", {}).get("failures", []):
+        print("Corpus model check failed:", failure)
+    for failure in report.get("partial_extraction", {}).get("failures", []):
+        print("Partial extraction check failed:", failure)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    ok = (not report["pinned_unicode_failures"] and
+          not report["pinned_numbering_failures"] and
+          not report["collinear_line_failures"] and
+          report["numbering"]["identical"] and
+          not report.get("span_cache", {}).get("mismatches") and
+          not report.get("partial_extraction", {}).get("failures") and
+          not report.get("corpus_model", {}).get("failures") and
+          not report.get("incremental", {}).get("mismatches") and
+          report.get("artifact_transport", {}).get("identical_parts", True) and
+          report.get("artifact_transport", {}).get("identical_outputs", True) and
+          not report.get("artifact_transport", {}).get("leftover_artifact_dirs") and
+          not report["scanned_document_failures"] and
+          not report["pipeline_failures"] and
+          not report["outline_depth"]["failures"] and
+          not report["font_styles"]["failures"] and
+          not report["fault_isolation_failures"] and
+          not report["worker_crash_failures"] and
+          not report["batch_settings_failures"] and
+          not report["split_document_failures"] and
+          not report["iter_outlines_failures"] and
+          not report["heading_classifier"]["failures"] and
+          not report["load_test_failures"] and
+          report.get("scheduling", {}).get("identical_outputs", True) and
+          all(row["matches_expected"] for row in report["fixtures"]) and
+          report.get("unicode", {}).get("normalize_identical", True) and
+          report.get("unicode", {}).get("hex_identical", True))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
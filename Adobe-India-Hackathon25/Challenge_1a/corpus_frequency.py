@@ -0,0 +1,108 @@
+import hashlib
+import os
+import struct
+from array import array
+
+# File layout: magic, width, depth, documents, then depth * width uint32 counters
+# (CMS1 files hashed rows with seeded CRC32 and are not read)
+FILE_MAGIC = b"CMS2"
+FILE_HEADER = struct.Struct("<4sIIQ")
+
+# Lines are keyed by text plus the band of the page they sit in and their
+# rounded font size, so a running header differs from the same words used as
+# a heading somewhere else on the page
+POSITION_BANDS = 20
+# Bands at the top and at the bottom of the page that hold running headers and
+# footers; a frequent line elsewhere is only boilerplate when it also repeats
+# within its document, as a shared section heading ("Introduction") does not
+MARGIN_BANDS = 2
+
+
+def corpus_line_key(clean_text, relative_y, size):
+    """
+    Build the corpus key of one line from its cleaned text, relative y position and font size
+    """
+    band = min(int(relative_y * POSITION_BANDS), POSITION_BANDS - 1)
+    return f"{clean_text.lower()}\x1f{band}\x1f{round(size)}"
+
+
+class CorpusFrequencyModel:
+    """
+    Count-min sketch of how many documents of a corpus contain each line key
+
+    Memory is fixed at width * depth 32-bit counters whatever the corpus size.
+    Counts are updated conservatively (only the minimal counters are raised),
+    which keeps over-estimation low; estimates never under-count. Each row
+    hashes a key with its own 32 bits of one BLAKE2b digest, so rows collide
+    independently (depth is at most 16).
+    """
+
+    def __init__(self, width=1 << 18, depth=4, min_documents=25, min_share=0.02, learning=True):
+        self.width = width
+        self.depth = depth
+        self._row_hashes = struct.Struct(f"<{depth}I")
+        self.min_documents = min_documents
+        self.min_share = min_share
+        self.learning = learning
+        self.documents = 0
+        self.counts = array("I", bytes(4 * width * depth))
+        # Keys of the most recently analysed document, so pool workers can send
+        # them back to the parent's model
+        self.last_document_keys = []
+
+    def _cells(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=self._row_hashes.size).digest()
+        width = self.width
+        return [row * width + value % width for row, value in enumerate(self._row_hashes.unpack(digest))]
+
+    def estimate(self, key):
+        """Return the (over-)estimated number of documents containing key"""
+        counts = self.counts
+        return min(counts[cell] for cell in self._cells(key))
+
+    def add_document(self, keys):
+        """Record one document; each distinct key counts once per document"""
+        counts = self.counts
+        for key in set(keys):
+            cells = self._cells(key)
+            new_value = min(counts[cell] for cell in cells) + 1
+            for cell in cells:
+                if counts[cell] < new_value:
+                    counts[cell] = new_value
+        self.documents += 1
+
+    def is_boilerplate(self, key, repeated=False):
+        """
+        Return True if key occurs in enough documents of the corpus to be treated as
+        a running header, footer or form label rather than a heading, and sits in
+        the header or footer bands or is repeated (on several pages) within its
+        document; a section heading every document shares is kept
+        """
+        if self.documents < self.min_documents:
+            return False
+        band = int(key.rsplit("\x1f", 2)[1])
+        if not repeated and MARGIN_BANDS <= band < POSITION_BANDS - MARGIN_BANDS:
+            return False
+        threshold = max(self.min_documents, self.min_share * self.documents)
+        return self.estimate(key) >= threshold
+
+    def save(self, path):
+        """Write the sketch to path in its compact binary form"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(FILE_HEADER.pack(FILE_MAGIC, self.width, self.depth, self.documents))
+            self.counts.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, **options):
+        """Read a sketch written by save(); options override the query thresholds"""
+        with open(path, "rb") as f:
+            magic, width, depth, documents = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+            if magic != FILE_MAGIC:
+                raise ValueError(f"{path} is not a corpus frequency model")
+            model = cls(width=width, depth=depth, **options)
+            model.counts = array("I")
+            model.counts.fromfile(f, width * depth)
+        model.documents = documents
+        return model
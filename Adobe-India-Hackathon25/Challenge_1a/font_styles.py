@@ -0,0 +1,77 @@
+import functools
+import re
+
+# PyMuPDF span flags
+BOLD_FLAG = 16
+ITALIC_FLAG = 2
+
+# Weights named by the style part of a font name, heaviest spellings first so
+# "ExtraBold" is not read as "Bold"
+FONT_NAME_WEIGHTS = (
+    ("extrabold", 800), ("ultrabold", 800), ("semibold", 600), ("demibold", 600),
+    ("black", 900), ("heavy", 900), ("bold", 700), ("demi", 600), ("medium", 500),
+    ("extralight", 200), ("ultralight", 200), ("light", 300), ("thin", 100),
+)
+FONT_NAME_WEIGHT_VALUES = dict(FONT_NAME_WEIGHTS)
+FONT_NAME_ITALIC_WORDS = ("italic", "oblique", "kursiv")
+FONT_NAME_STYLE_WORD_PATTERN = re.compile(
+    "|".join([name for name, _ in FONT_NAME_WEIGHTS] + list(FONT_NAME_ITALIC_WORDS)), re.IGNORECASE)
+# Semibold and heavier count as bold
+BOLD_WEIGHT = 600
+REGULAR_WEIGHT = 400
+
+# Separators between family and style in font names: "Helvetica-Bold",
+# "Arial,BoldItalic", "Arial Black"
+FONT_NAME_STYLE_SEPARATOR = re.compile(r"[-, ]")
+
+# Font names resolved by font_style kept at once; subset prefixes make most
+# names unique to their document, so the cache is bounded
+FONT_STYLE_CACHE_SIZE = 4096
+
+
+def style_words(name, start=0):
+    """
+    Yield the style words (lowercase) in name from start on that begin a word:
+    at the start of name, after a non-letter, at a capital letter ("SemiBold")
+    or right after another style word ("Bolditalic"), so "demi" in "Academic"
+    is not one
+    """
+    end = None
+    for match in FONT_NAME_STYLE_WORD_PATTERN.finditer(name, start):
+        position = match.start()
+        if position in (0, end) or not name[position - 1].isalpha() or name[position].isupper():
+            end = match.end()
+            yield match.group().lower()
+
+
+def parse_font_name(font):
+    """
+    Read the weight and slant a font name spells out, e.g. "Arial-BlackItalic"
+    or "ABCDEF+Calibri-Semibold" (the subset prefix is ignored)
+    Only the style part after the family is read when the name has one, and never
+    the first letter, so a family such as "Blackadder" is not taken for a weight;
+    style words count only where they begin a word (see style_words)
+    Returns (weight, italic); (400, False) for a name without style words
+    """
+    name = font.rpartition("+")[2]
+    family_and_style = FONT_NAME_STYLE_SEPARATOR.split(name, 1)
+    if len(family_and_style) == 2 and family_and_style[1]:
+        words = list(style_words(family_and_style[1]))
+    else:
+        # No separator ("ArialBold"): the family is at least the first letter
+        words = list(style_words(name, 1))
+    weight = next((FONT_NAME_WEIGHT_VALUES[word] for word in words if word in FONT_NAME_WEIGHT_VALUES),
+                  REGULAR_WEIGHT)
+    return weight, any(word in FONT_NAME_ITALIC_WORDS for word in words)
+
+
+@functools.lru_cache(maxsize=FONT_STYLE_CACHE_SIZE)
+def font_style(font):
+    """
+    Return (bold, italic) as named by a font name (see parse_font_name), to be
+    combined with the span flags: a span is bold when its flags or its font say so
+    Results are cached per name, so each name is parsed once while it stays in
+    the cache
+    """
+    weight, italic = parse_font_name(font)
+    return weight >= BOLD_WEIGHT, italic
@@ -0,0 +1,151 @@
+import json
+import math
+import os
+from operator import mul
+
+# Features of a heading-sized candidate line, in vector order (built by
+# process_pdfs.heading_line_vector)
+FEATURES = (
+    "size_ratio",        # heading size / body text size
+    "heading_share",     # share of the line's elements that are heading-sized
+    "bold",              # share of the line's elements that are bold
+    "relative_x",        # left edge, relative to the page width
+    "relative_y",        # top edge, relative to the page height
+    "log_words",         # log(1 + words of the cleaned text)
+    "numbered",          # starts with a section number
+    "end_punctuation",   # ends with : . ; ! ? or ,
+    "lowercase_start",   # starts with a lowercase letter
+    "caps_share",        # share of the letters that are uppercase
+    "digit_share",       # share of the characters that are digits
+    "log_repeats",       # log(1 + times the cleaned text occurs in the document)
+)
+
+# Lines scored at or above ACCEPT are headings and at or below REJECT are not,
+# without the rule chain; the ones in between are left to it
+DEFAULT_ACCEPT = 0.95
+DEFAULT_REJECT = 0.05
+
+
+def sigmoid(z):
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+class HeadingClassifier:
+    """
+    Logistic regression deciding whether a heading-sized candidate line is a heading
+
+    The model is one weight per feature (see FEATURES) plus a bias, kept as
+    plain float lists over the raw feature values. Scoring is a pure-Python
+    dot product per line (no numpy in this tree), nothing beyond the standard
+    library. Lines it is confident about (accept/reject) skip the hand-written
+    checks; calibrate() sets those thresholds so it never overrules them.
+    """
+
+    def __init__(self, weights, bias, accept=DEFAULT_ACCEPT, reject=DEFAULT_REJECT, features=FEATURES):
+        if len(weights) != len(features):
+            raise ValueError(f"{len(weights)} weights for {len(features)} features")
+        self.weights = [float(weight) for weight in weights]
+        self.bias = float(bias)
+        self.accept = accept
+        self.reject = reject
+        self.features = tuple(features)
+
+    def score(self, vectors):
+        """Return the heading probability of every feature vector in vectors"""
+        weights = self.weights
+        bias = self.bias
+        return [sigmoid(bias + sum(map(mul, weights, vector))) for vector in vectors]
+
+    def decide(self, vectors):
+        """
+        Return for every feature vector True (heading), False (not a heading) or
+        None (borderline: left to the rule chain)
+        """
+        accept = self.accept
+        reject = self.reject
+        return [True if p >= accept else False if p <= reject else None for p in self.score(vectors)]
+
+    def to_dict(self):
+        return {"features": list(self.features), "weights": self.weights, "bias": self.bias,
+                "accept": self.accept, "reject": self.reject}
+
+    def save(self, path):
+        """Write the model to path as JSON"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read a model written by save()"""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if tuple(data["features"]) != FEATURES:
+            raise ValueError(f"{path} was trained on other features: {data['features']}")
+        return cls(data["weights"], data["bias"], data["accept"], data["reject"])
+
+
+def calibrate(classifier, vectors, reference):
+    """
+    Tighten the accept and reject thresholds of classifier so it decides none of
+    the lines (feature vectors) against reference, the rule chain's decision of
+    each line: accept lies above the score of every line the rule chain
+    rejects, reject below the score of every line it accepts
+    Returns the classifier
+    """
+    rejected = []
+    accepted = []
+    for score, decision in zip(classifier.score(vectors), reference):
+        (accepted if decision else rejected).append(score)
+    if rejected:
+        classifier.accept = max(classifier.accept, math.nextafter(max(rejected), math.inf))
+    if accepted:
+        classifier.reject = min(classifier.reject, math.nextafter(min(accepted), -math.inf))
+    return classifier
+
+
+def train(vectors, labels, l2=0.01, epochs=3000, learning_rate=0.5, accept=DEFAULT_ACCEPT,
+          reject=DEFAULT_REJECT):
+    """
+    Fit a HeadingClassifier to feature vectors and their labels (True for
+    headings) by batch gradient descent on the L2-regularised log loss
+    Features are standardised while fitting and the weights folded back onto
+    the raw values, so the model scores unscaled vectors
+    Returns the classifier
+    """
+    if not vectors or len(set(labels)) < 2:
+        raise ValueError("training needs both headings and other lines")
+    count = len(vectors)
+    dimensions = len(vectors[0])
+    means = [sum(vector[i] for vector in vectors) / count for i in range(dimensions)]
+    scales = []
+    for i in range(dimensions):
+        variance = sum((vector[i] - means[i]) ** 2 for vector in vectors) / count
+        scales.append(math.sqrt(variance) or 1.0)
+    rows = [[(vector[i] - means[i]) / scales[i] for i in range(dimensions)] for vector in vectors]
+    targets = [1.0 if label else 0.0 for label in labels]
+    # Balance the classes: headings are a small minority of the lines
+    positives = sum(targets)
+    class_weights = {1.0: count / (2 * positives), 0.0: count / (2 * (count - positives))}
+    sample_weights = [class_weights[target] for target in targets]
+
+    weights = [0.0] * dimensions
+    bias = 0.0
+    for _ in range(epochs):
+        gradient = [l2 * weight for weight in weights]
+        bias_gradient = 0.0
+        for row, target, sample_weight in zip(rows, targets, sample_weights):
+            error = (sigmoid(bias + sum(map(mul, weights, row))) - target) * sample_weight / count
+            bias_gradient += error
+            for i, value in enumerate(row):
+                gradient[i] += error * value
+        weights = [weight - learning_rate * g for weight, g in zip(weights, gradient)]
+        bias -= learning_rate * bias_gradient
+
+    raw_weights = [weight / scale for weight, scale in zip(weights, scales)]
+    raw_bias = bias - sum(weight * mean / scale for weight, mean, scale in zip(weights, means, scales))
+    return HeadingClassifier(raw_weights, raw_bias, accept, reject)
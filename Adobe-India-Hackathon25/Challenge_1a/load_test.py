@@ -0,0 +1,333 @@
+import argparse
+import gc
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import process_pdfs
+from benchmark_test import make_deep_document, make_long_document, make_template_document
+from memory_profile import PAGE_SIZE
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PDF_DIR = os.path.join(SCRIPT_DIR, "sample_dataset", "pdfs")
+
+# How extract_outline is driven: in this process one request at a time, or
+# submitted to a pool of forked workers (warmed up as in process_pdfs)
+MODES = ("inprocess", "pool")
+# Latency percentiles reported per step
+PERCENTILES = (50, 90, 95, 99)
+# A step is saturated when it completes less than this share of the rate its
+# arrivals actually came at (requests over the time to the last arrival)
+SATURATION_THROUGHPUT = 0.95
+try:
+    CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = 100
+
+
+def build_documents(pdf_dir, synthetic_pages):
+    """
+    Read the sample PDFs and build the synthetic ones (a long document of
+    synthetic_pages pages, a templated form and a deeply numbered specification)
+    Returns {"sample": [(name, pdf bytes)], "synthetic": [(name, pdf bytes)]}
+    Documents are passed as bytes, as a service receives them
+    """
+    samples = []
+    for file in sorted(os.listdir(pdf_dir)):
+        if file.lower().endswith(".pdf"):
+            with open(os.path.join(pdf_dir, file), "rb") as f:
+                samples.append((file, f.read()))
+    synthetic = [(f"long{synthetic_pages}.pdf", make_long_document(synthetic_pages)),
+                 ("template.pdf", make_template_document(0)),
+                 ("deep.pdf", make_deep_document())]
+    return {"sample": samples, "synthetic": synthetic}
+
+
+def arrival_schedule(rate, requests, documents, mix, arrival, rng):
+    """
+    Draw the open-loop requests of one step: arrival offsets in seconds at rate
+    requests per second (exponential gaps for "poisson", even ones for
+    "uniform") and a document picked by the mix weights
+    Returns a list of (offset, name, pdf bytes)
+    """
+    kinds = [kind for kind, weight in mix.items() if weight > 0 and documents[kind]]
+    weights = [mix[kind] for kind in kinds]
+    schedule = []
+    offset = 0.0
+    for _ in range(requests):
+        offset += rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+        name, pdf_bytes = rng.choice(documents[rng.choices(kinds, weights)[0]])
+        schedule.append((offset, name, pdf_bytes))
+    return schedule
+
+
+def process_usage(pid):
+    """Return (RSS in KB, CPU seconds) of a process from /proc, or None once it is gone"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            rss_kb = int(f.read().split()[1]) * PAGE_SIZE // 1024
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the parenthesised command name; utime and stime are 14 and 15
+            fields = f.read().rpartition(")")[2].split()
+        return rss_kb, (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def child_pids():
+    """Return the pids of this process's children (the pool workers)"""
+    pids = []
+    try:
+        for task in os.listdir("/proc/self/task"):
+            with open(f"/proc/self/task/{task}/children") as f:
+                pids.extend(int(pid) for pid in f.read().split())
+    except OSError:
+        pass
+    return pids
+
+
+class UsageSampler:
+    """
+    Background thread sampling, every interval seconds, the RSS and CPU
+    utilisation of this process and of its children, and the requests completed
+    and in flight so far
+
+    CPU utilisation is CPU seconds used per second of the interval, in percent
+    (so up to 100% per core); a worker's CPU time is only counted while it lives.
+    """
+
+    def __init__(self, interval, progress):
+        self.interval = interval
+        self.progress = progress
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _cpu_and_rss(self):
+        usage = [process_usage(os.getpid())] + [process_usage(pid) for pid in child_pids()]
+        usage = [u for u in usage if u is not None]
+        return usage[0][0] if usage else 0, sum(rss for rss, _ in usage[1:]), sum(cpu for _, cpu in usage)
+
+    def _run(self):
+        start = time.perf_counter()
+        _, _, last_cpu = self._cpu_and_rss()
+        last = start
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            rss_kb, children_rss_kb, cpu = self._cpu_and_rss()
+            completed, in_flight = self.progress()
+            self.samples.append({"t": round(now - start, 3), "rss_kb": rss_kb, "children_rss_kb": children_rss_kb,
+                                 "cpu_percent": round(max(cpu - last_cpu, 0.0) / (now - last) * 100, 1),
+                                 "completed": completed, "in_flight": in_flight})
+            last, last_cpu = now, cpu
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def _timed_outline_task(task):
+    """Extract one document in a worker; returns (service seconds, headings)"""
+    start = time.perf_counter()
+    result = process_pdfs.extract_outline(task)
+    return time.perf_counter() - start, len(result["outline"])
+
+
+def run_step(mode, schedule, executor, sample_seconds):
+    """
+    Offer the requests of schedule at their arrival offsets, without waiting for
+    earlier ones (open loop), and time each from its arrival to its result, so
+    the queueing of a saturated mode counts towards its latency
+    Returns the step report
+    """
+    lock = threading.Lock()
+    latencies = []
+    service_times = []
+    failures = []
+    submitted = 0
+
+    def progress():
+        with lock:
+            return len(latencies) + len(failures), submitted - len(latencies) - len(failures)
+
+    def record(arrived_at, outcome=None, error=None):
+        finished_at = time.perf_counter()
+        with lock:
+            if error is not None:
+                failures.append(error)
+            else:
+                latencies.append(finished_at - arrived_at)
+                service_times.append(outcome[0])
+
+    with UsageSampler(sample_seconds, progress) as sampler:
+        start = time.perf_counter()
+        futures = []
+        for offset, name, pdf_bytes in schedule:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            arrived_at = start + offset
+            with lock:
+                submitted += 1
+            if mode == "inprocess":
+                try:
+                    record(arrived_at, _timed_outline_task(pdf_bytes))
+                except Exception as e:
+                    record(arrived_at, error=f"{name}: {type(e).__name__}: {e}")
+                continue
+            future = executor.submit(_timed_outline_task, pdf_bytes)
+
+            def done(future, arrived_at=arrived_at, name=name):
+                error = future.exception()
+                if error is not None:
+                    record(arrived_at, error=f"{name}: {type(error).__name__}: {error}")
+                else:
+                    record(arrived_at, future.result())
+
+            future.add_done_callback(done)
+            futures.append(future)
+        for future in futures:
+            future.exception()
+        elapsed = time.perf_counter() - start
+    offered_seconds = schedule[-1][0] if schedule else 0.0
+    return summarize_step(latencies, service_times, failures, len(schedule), offered_seconds, elapsed,
+                          sampler.samples)
+
+
+def percentile(sorted_values, percent):
+    """Return the nearest-rank percentile of an ascending list (None for an empty one)"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(percent * len(sorted_values) / 100) - 1
+    return sorted_values[min(max(rank, 0), len(sorted_values) - 1)]
+
+
+def summarize_step(latencies, service_times, failures, requests, offered_seconds, elapsed, samples):
+    """Return the report of one step: throughput, latency and service time percentiles, usage samples"""
+    latencies = sorted(latencies)
+    service_times = sorted(service_times)
+
+    def milliseconds(values):
+        if not values:
+            return {}
+        row = {f"p{p}": round(percentile(values, p) * 1000, 1) for p in PERCENTILES}
+        row["mean"] = round(sum(values) / len(values) * 1000, 1)
+        row["max"] = round(values[-1] * 1000, 1)
+        return row
+
+    return {
+        "requests": requests,
+        "completed": len(latencies),
+        "failed": len(failures),
+        "errors": failures[:10],
+        "offered_seconds": round(offered_seconds, 3),
+        "offered_rate": round(requests / offered_seconds, 3) if offered_seconds else None,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 3) if elapsed else None,
+        "latency_ms": milliseconds(latencies),
+        "service_ms": milliseconds(service_times),
+        "peak_rss_kb": max((s["rss_kb"] + s["children_rss_kb"] for s in samples), default=None),
+        "mean_cpu_percent": round(sum(s["cpu_percent"] for s in samples) / len(samples), 1) if samples else None,
+        "samples": samples,
+    }
+
+
+def run_load_test(mode, rates, duration, documents, mix, workers=2, arrival="poisson", seed=0,
+                  sample_seconds=0.25, warm_requests=3):
+    """
+    Run one open-loop step per offered rate (requests per second, lasting
+    duration seconds each) against mode, after warm_requests unmeasured requests
+    Returns the report: one row per step and the highest rate sustained
+    (throughput at least SATURATION_THROUGHPUT of the rate the arrivals came at,
+    no failures)
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, not {mode!r}")
+    rng = random.Random(seed)
+    executor = None
+    if mode == "pool":
+        # Warm the parent and fork the workers from it, as process_pdfs does
+        process_pdfs.warm_up()
+        gc.freeze()
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        executor = ProcessPoolExecutor(workers, mp_context=context)
+    try:
+        warm = arrival_schedule(1000.0, warm_requests, documents, mix, "uniform", rng) if warm_requests else []
+        if warm:
+            run_step(mode, warm, executor, sample_seconds)
+        steps = []
+        for rate in rates:
+            schedule = arrival_schedule(rate, max(int(round(rate * duration)), 1), documents, mix, arrival, rng)
+            step = run_step(mode, schedule, executor, sample_seconds)
+            step["rate"] = rate
+            step["saturated"] = ((step["throughput"] or 0) < SATURATION_THROUGHPUT * (step["offered_rate"] or rate) or
+                                 bool(step["failed"]))
+            steps.append(step)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+            gc.unfreeze()
+    sustained = [step["rate"] for step in steps if not step["saturated"]]
+    return {"mode": mode, "workers": workers if mode == "pool" else 1, "cpu_count": os.cpu_count(),
+            "arrival": arrival, "duration_seconds": duration, "seed": seed,
+            "mix": mix, "documents": {kind: [name for name, _ in docs] for kind, docs in documents.items()},
+            "max_sustained_rate": max(sustained) if sustained else None, "steps": steps}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offer extract_outline open-loop load at increasing rates and report throughput, "
+                    "latency percentiles, CPU utilisation and RSS over time")
+    parser.add_argument("--mode", choices=MODES, default="inprocess",
+                        help="drive extract_outline in this process or through a pool of forked workers")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="pool workers (pool mode)")
+    parser.add_argument("--rates", type=float, nargs="+", default=[1.0, 2.0, 4.0],
+                        help="offered requests per second, one step each")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of arrivals per step")
+    parser.add_argument("--arrival", choices=("poisson", "uniform"), default="poisson",
+                        help="exponential (poisson) or even gaps between arrivals")
+    parser.add_argument("--sample-weight", type=float, default=3.0, help="weight of the sample PDFs in the mix")
+    parser.add_argument("--synthetic-weight", type=float, default=1.0,
+                        help="weight of the synthetic PDFs in the mix")
+    parser.add_argument("--synthetic-pages", type=int, default=50, help="pages of the long synthetic document")
+    parser.add_argument("--pdf-dir", default=DEFAULT_PDF_DIR, help="sample PDFs (default: the sample dataset)")
+    parser.add_argument("--sample-interval", type=float, default=0.25,
+                        help="seconds between CPU and RSS samples")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the arrivals and the document picks")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    documents = build_documents(args.pdf_dir, args.synthetic_pages)
+    mix = {"sample": args.sample_weight, "synthetic": args.synthetic_weight}
+    report = run_load_test(args.mode, args.rates, args.duration, documents, mix, workers=args.workers,
+                           arrival=args.arrival, seed=args.seed, sample_seconds=args.sample_interval)
+
+    print(f"{report['mode']} ({report['workers']} worker(s), {report['cpu_count']} CPU(s)), "
+          f"{report['arrival']} arrivals, {args.duration:g}s per step")
+    for step in report["steps"]:
+        latency = step["latency_ms"]
+        print(f"{step['rate']:>7.2f} req/s offered ({step['offered_rate'] or 0:.2f} drawn): "
+              f"{step['throughput'] or 0:>7.2f} req/s done, "
+              f"{step['completed']}/{step['requests']} ok, {step['failed']} failed; latency p50 "
+              f"{latency.get('p50')} ms, p99 {latency.get('p99')} ms; CPU {step['mean_cpu_percent']}%, "
+              f"peak RSS {step['peak_rss_kb']} KB{' (saturated)' if step['saturated'] else ''}")
+    print(f"Highest rate sustained: {report['max_sustained_rate']} req/s")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
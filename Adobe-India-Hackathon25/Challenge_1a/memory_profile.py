@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+import tracemalloc
+
+try:
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+# Interval of the background peak-RSS sampler
+RSS_SAMPLE_SECONDS = 0.002
+# Allocation sites listed per stage in a memory report
+TOP_ALLOCATIONS = 3
+# The profiler's own allocations (snapshots, sampler thread) are not reported
+PROFILER_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, threading.__file__),
+)
+
+
+def current_rss_kb():
+    """
+    Return the resident set size of this process in KB
+    Reads /proc/self/statm; elsewhere returns 0, which disables the memory
+    budget (the peak RSS of getrusage cannot tell how much a document grew it)
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE // 1024
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class MemoryProfiler:
+    """
+    Stage hook recording memory per stage of one extraction
+
+    Call start(), pass the profiler as the stage hook (it is called with the
+    name of each stage as that stage ends), then stop() and report(). Every
+    stage gets a tracemalloc snapshot (current and peak traced memory, and the
+    allocation sites that grew most since the previous stage) and the RSS;
+    a background thread samples the RSS meanwhile to catch its peak.
+    """
+
+    def __init__(self, top_allocations=TOP_ALLOCATIONS):
+        self.top_allocations = top_allocations
+        self.stages = []
+        self.peak_rss_kb = 0
+        self._snapshot = None
+        self._last = None
+        self._sampling = None
+        self._sampler = None
+
+    def start(self):
+        """Start tracing allocations and sampling the RSS"""
+        self._stop_tracing = not tracemalloc.is_tracing()
+        if self._stop_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._snapshot = tracemalloc.take_snapshot().filter_traces(PROFILER_FILTERS)
+        self.start_rss_kb = self.peak_rss_kb = current_rss_kb()
+        self._sampling = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        self._sampler.start()
+        self._last = time.perf_counter()
+
+    def _sample_rss(self):
+        while not self._sampling.wait(RSS_SAMPLE_SECONDS):
+            rss = current_rss_kb()
+            if rss > self.peak_rss_kb:
+                self.peak_rss_kb = rss
+
+    def __call__(self, stage):
+        now = time.perf_counter()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        snapshot = tracemalloc.take_snapshot().filter_traces(PROFILER_FILTERS)
+        growth = snapshot.compare_to(self._snapshot, "lineno")[:self.top_allocations]
+        self._snapshot = snapshot
+        rss = current_rss_kb()
+        if rss > self.peak_rss_kb:
+            self.peak_rss_kb = rss
+        self.stages.append({
+            "stage": stage,
+            "seconds": round(now - self._last, 4),
+            "traced_current_kb": current // 1024,
+            "traced_peak_kb": peak // 1024,
+            "rss_kb": rss,
+            "top_allocations": [{"site": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                                 "size_diff_kb": stat.size_diff // 1024}
+                                for stat in growth],
+        })
+        # Snapshots are not free: keep them out of the next stage's timing
+        self._last = time.perf_counter()
+
+    def stop(self):
+        """Stop sampling and tracing"""
+        self._sampling.set()
+        self._sampler.join()
+        if self._stop_tracing:
+            tracemalloc.stop()
+        self._snapshot = None
+
+    def report(self):
+        """
+        Return the memory report: the stages in order, the peak traced memory over
+        all stages and the peak RSS (absolute and above the RSS at start)
+        """
+        return {
+            "stages": self.stages,
+            "peak_traced_kb": max((stage["traced_peak_kb"] for stage in self.stages), default=0),
+            "start_rss_kb": self.start_rss_kb,
+            "peak_rss_kb": self.peak_rss_kb,
+            "peak_rss_growth_kb": self.peak_rss_kb - self.start_rss_kb,
+        }
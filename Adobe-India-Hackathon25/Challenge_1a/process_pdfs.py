@@ -1,55 +1,108 @@
 import fitz  # PyMuPDF
 import os
+import gc
+import hashlib
+import shutil
 import json
 import re
-from collections import Counter
+import sys
+import time
+import argparse
+import contextlib
+import math
+from collections import Counter, deque
+
+from batch_metrics import BatchMetrics, StageRecorder, TraceWriter
+from batch_runner import append_checkpoint, load_checkpoint, quarantine, run_supervised
+from corpus_frequency import CorpusFrequencyModel, corpus_line_key
+from font_styles import BOLD_FLAG, BOLD_WEIGHT, FONT_NAME_WEIGHTS, ITALIC_FLAG, font_style
+from heading_classifier import HeadingClassifier
+from memory_profile import MemoryProfiler, current_rss_kb
+from shared_artifacts import ArtifactHandle, ArtifactStore
+from span_cache import SpanCache
+
+try:
+    import ahocorasick  # optional: pyahocorasick, used for keyword matching when installed
+except ImportError:
+    ahocorasick = None
+
+# Character replacements applied by normalize_unicode_characters. Only entries
+# that change the text are listed (em dash, en dash, bullet and middle dot are
+# already canonical). ASCII double and single quotes have always ended up as
+# the right-hand quotation marks, so that behaviour is kept.
+UNICODE_REPLACEMENTS = {
+    '-': '\u2013',          # hyphen-minus to en dash
+    '"': '\u201D',          # double quote to right double quotation mark
+    "'": '\u2019',          # apostrophe to right single quotation mark
+    '`': '\u2018',          # grave accent to left single quotation mark
+    '...': '\u2026',        # horizontal ellipsis
+    '(TM)': '\u2122',       # trade mark sign
+    '(tm)': '\u2122',       # trade mark sign
+    '(R)': '\u00AE',        # registered sign
+    '(r)': '\u00AE',        # registered sign
+    '(C)': '\u00A9',        # copyright sign
+    '(c)': '\u00A9',        # copyright sign
+}
+
+# Characters written as \x{XXXX} escapes in the final output
+HEX_ESCAPES = {
+    char: '\\x{%04X}' % ord(char)
+    for char in (
+        '\u2013',  # en dash
+        '\u2014',  # em dash
+        '\u201C',  # left double quotation mark
+        '\u201D',  # right double quotation mark
+        '\u2018',  # left single quotation mark
+        '\u2019',  # right single quotation mark
+        '\u2026',  # horizontal ellipsis
+        '\u2022',  # bullet
+        '\u00B7',  # middle dot
+        '\u2122',  # trade mark sign
+        '\u00AE',  # registered sign
+        '\u00A9',  # copyright sign
+    )
+}
+
+def compile_replacement_pattern(replacements):
+    """
+    Compile the keys of a replacement table into one alternation (longest first)
+    Returns a regex that finds every replaceable token in a single scan
+    """
+    tokens = sorted(replacements, key=len, reverse=True)
+    return re.compile("|".join(re.escape(token) for token in tokens))
+
+UNICODE_REPLACEMENT_PATTERN = compile_replacement_pattern(UNICODE_REPLACEMENTS)
+HEX_ESCAPE_PATTERN = compile_replacement_pattern(HEX_ESCAPES)
+
+# Patterns shared by the title and outline passes, compiled once at import
+NUMBERING_PREFIX_PATTERN = re.compile(r"^[0-9.\-\u2013\u2014\)\(©®™]+\s*")  # numbering, bullets, (c)(r)(tm)
+TITLE_NUMBERING_PREFIX_PATTERN = re.compile(r"^[0-9.\-\u2013\u2014\)\(]+\s*")  # numbering and bullets only
+# Section number at the start of a text, tokenized by parse_numbering: a number,
+# roman numeral or letter (the latter two only before "." or ")"), further
+# dot-separated numbers, and an optional "." or ")" terminator
+SECTION_NUMBER_TOKEN_PATTERN = re.compile(
+    r"([0-9]+|[IVXLCDM]+(?=[.)])|[ivxlcdm]+(?=[.)])|[A-Za-z](?=[.)]))((?:\.[0-9]+)*)([.)]?)")
+# A well-formed roman numeral (any case), so "IIII." or "VX." has no value
+ROMAN_NUMERAL_PATTERN = re.compile(r"M{0,3}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})", re.IGNORECASE)
+ROMAN_DIGITS = {"I": 1, "V": 5, "X": 10, "L": 50, "C": 100, "D": 500, "M": 1000}
+REPEATED_LETTERS_PATTERN = re.compile(r'([a-zA-Z])\1{2,}')
+WHITESPACE_RUN_PATTERN = re.compile(r'\s+')
+DECORATIVE_RULE_PATTERN = re.compile(r'^[-_=]+$')  # "---", "___"
+PURE_SYMBOLS_PATTERN = re.compile(r'^[-_=!@#$%^&*()]+$')
+LONG_NUMBER_PATTERN = re.compile(r'\d{5,}')  # 5 or more consecutive digits
+SENTENCE_SPLIT_PATTERN = re.compile(r'[.!?]+')
+DIGITS_ONLY_PATTERN = re.compile(r'^[0-9]+$')
+SINGLE_LETTER_PATTERN = re.compile(r'^[a-z]$')
 
 def normalize_unicode_characters(text):
     """
     Normalize special characters to their proper Unicode representations
+    All replacements are made in one pass over the text
     """
     if not text:
         return text
     
-    # Define character replacements
-    unicode_replacements = {
-        # Replace various dash characters with en dash (U+2013)
-        '-': '\u2013',          # hyphen-minus to en dash
-        '—': '\u2014',          # em dash (keep as em dash)
-        '–': '\u2013',          # en dash (already correct)
-        
-        # Replace various quote characters
-        '"': '\u201C',          # left double quotation mark
-        '"': '\u201D',          # right double quotation mark
-        "'": '\u2018',          # left single quotation mark
-        "'": '\u2019',          # right single quotation mark
-        '`': '\u2018',          # grave accent to left single quotation mark
-        
-        # Replace various apostrophes
-        "'": '\u2019',          # apostrophe to right single quotation mark
-        
-        # Replace ellipsis
-        '...': '\u2026',        # horizontal ellipsis
-        
-        # Replace bullet points
-        '•': '\u2022',          # bullet (already correct)
-        '·': '\u00B7',          # middle dot
-        
-        # Replace trademark and copyright symbols
-        '(TM)': '\u2122',       # trade mark sign
-        '(tm)': '\u2122',       # trade mark sign
-        '(R)': '\u00AE',        # registered sign
-        '(r)': '\u00AE',        # registered sign
-        '(C)': '\u00A9',        # copyright sign
-        '(c)': '\u00A9',        # copyright sign
-    }
-    
-    # Apply replacements
-    normalized_text = text
-    for old_char, new_char in unicode_replacements.items():
-        normalized_text = normalized_text.replace(old_char, new_char)
-    
-    return normalized_text
+    return UNICODE_REPLACEMENT_PATTERN.sub(lambda match: UNICODE_REPLACEMENTS[match.group()], text)
 
 def convert_special_chars_to_hex(text):
     """
@@ -58,28 +111,71 @@ def convert_special_chars_to_hex(text):
     if not text:
         return text
     
-    # Define which characters should be converted to hex
-    special_chars_to_convert = {
-        '\u2013': '\\x{2013}',  # en dash
-        '\u2014': '\\x{2014}',  # em dash
-        '\u201C': '\\x{201C}',  # left double quotation mark
-        '\u201D': '\\x{201D}',  # right double quotation mark
-        '\u2018': '\\x{2018}',  # left single quotation mark
-        '\u2019': '\\x{2019}',  # right single quotation mark
-        '\u2026': '\\x{2026}',  # horizontal ellipsis
-        '\u2022': '\\x{2022}',  # bullet
-        '\u00B7': '\\x{00B7}',  # middle dot
-        '\u2122': '\\x{2122}',  # trade mark sign
-        '\u00AE': '\\x{00AE}',  # registered sign
-        '\u00A9': '\\x{00A9}',  # copyright sign
+    return HEX_ESCAPE_PATTERN.sub(lambda match: HEX_ESCAPES[match.group()], text)
+
+# Keyword rules live in heuristic_rules.json so they can be tuned per customer
+# without code edits; they are compiled once into frozensets and matchers
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "heuristic_rules.json")
+
+def compile_substring_matcher(words):
+    """
+    Compile keywords into a function that tells whether any of them occurs in a text
+    Uses an Aho-Corasick automaton when pyahocorasick is installed; otherwise a
+    prebuilt tuple scanned with the C-level `in` operator, which beats a regex
+    alternation of literals in CPython's re module
+    """
+    words = tuple(dict.fromkeys(words))
+    if not words:
+        return lambda text: False
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for word in words:
+            automaton.add_word(word, word)
+        automaton.make_automaton()
+        return lambda text: next(automaton.iter(text), None) is not None
+    return lambda text: any(word in text for word in words)
+
+def compile_rule_set(raw_rules):
+    """
+    Compile a rule set loaded from JSON into the lookup structures the heuristics use
+    Lists used for substring checks become matchers, lists used for whole-word
+    checks become frozensets; form-field terms may be grouped by category
+    """
+    form_fields = raw_rules["form_fields_and_generic_terms"]
+    if isinstance(form_fields, dict):
+        form_fields = [term for terms in form_fields.values() for term in terms]
+    return {
+        "body_text_words": compile_substring_matcher(raw_rules["body_text_words"]),
+        "sentence_indicators": compile_substring_matcher(raw_rules["sentence_indicators"]),
+        "incomplete_endings": frozenset(raw_rules["incomplete_endings"]),
+        "body_text_indicators": tuple(f" {word} " for word in raw_rules["body_text_indicators"]),
+        "web_phrase_exceptions": compile_substring_matcher(raw_rules["web_phrase_exceptions"]),
+        "decorative_url_markers": compile_substring_matcher(raw_rules["decorative_url_markers"]),
+        "structured_document_keywords": compile_substring_matcher(raw_rules["structured_document_keywords"]),
+        "main_section_keywords": compile_substring_matcher(raw_rules["main_section_keywords"]),
+        "form_fields_and_generic_terms": frozenset(form_fields),
+        # Identifies the rule set in saved state that depends on it
+        "fingerprint": hashlib.sha256(json.dumps(raw_rules, sort_keys=True).encode("utf-8")).hexdigest()[:16],
     }
-    
-    # Apply hex conversion
-    hex_text = text
-    for unicode_char, hex_repr in special_chars_to_convert.items():
-        hex_text = hex_text.replace(unicode_char, hex_repr)
-    
-    return hex_text
+
+def load_rule_set(path=DEFAULT_RULES_PATH):
+    """
+    Load and compile a heuristic rule set from a JSON file
+    """
+    with open(path, encoding="utf-8") as f:
+        return compile_rule_set(json.load(f))
+
+RULES = load_rule_set()
+
+def use_rule_set(rule_set):
+    """
+    Make rule_set the active rule set for all following extractions
+    Returns the previously active rule set so a batch can restore it afterwards
+    """
+    global RULES
+    previous = RULES
+    RULES = rule_set
+    return previous
 
 def is_mixed_with_body_text(current_text_element, all_text_elements, threshold_distance=30):
     """
@@ -89,7 +185,7 @@ def is_mixed_with_body_text(current_text_element, all_text_elements, threshold_d
     current_page = current_text_element["page"]
     current_x = current_text_element.get("x_position", 0)
     current_y = current_text_element.get("y_position", 0)
-    current_size = current_text_element["size"]
+    current_size = current_text_element["size_class"]
     current_text = current_text_element["text"].strip()
     
     # Don't apply this check to very short headings (they're likely legitimate)
@@ -115,7 +211,7 @@ def is_mixed_with_body_text(current_text_element, all_text_elements, threshold_d
             continue
             
         element_text = element["text"].strip()
-        element_size = element["size"]
+        element_size = element["size_class"]
         element_x = element.get("x_position", 0)
         element_y = element.get("y_position", 0)
         
@@ -132,13 +228,7 @@ def is_mixed_with_body_text(current_text_element, all_text_elements, threshold_d
             len(element_text.split()) > 20 and  # Very long text
             (element_text.count(',') >= 3 or    # Multiple commas
              element_text.count('.') >= 2) and  # Multiple periods
-            any(word in element_text.lower() for word in [
-                'students', 'provide', 'ensure', 'develop', 'create', 'establish',
-                'implement', 'support', 'enhance', 'improve', 'maintain', 'continue',
-                'experience', 'understanding', 'knowledge', 'skills', 'opportunity',
-                'through', 'within', 'including', 'between', 'during', 'various',
-                'concentrate', 'required', 'beyond', 'areas', 'science', 'mathematics'
-            ])
+            RULES["body_text_words"](element_text.lower())
         )
         
         # If we found clear body text very close to our potential heading
@@ -161,6 +251,35 @@ def is_mixed_with_body_text(current_text_element, all_text_elements, threshold_d
     
     return nearby_body_text_found
 
+# Decorative character and layout patterns used by is_decorative_text
+DECORATIVE_PATTERNS = [re.compile(pattern) for pattern in (
+    # Repeated decorative characters
+    r'[▪▫■□●○★☆♦♠♣♥]+',
+    r'[═══]+',
+    r'[───]+',
+    r'[^^]+',
+    r'~+',
+    r'[***]+',
+    r'[+++]+',
+    r'[###]+',
+    r'&+',
+
+    # Decorative Unicode characters
+    r'[◆◇◈◉◎●○◐◑◒◓◔◕◖◗◘◙◚◛◜◝◞◟◠◡◢◣◤◥◦◧◨◩◪◫◬◭◮◯]+',
+    r'[★☆✦✧✩✪✫✬✭✮✯✰✱✲✳✴✵✶✷✸✹✺✻✼✽✾✿❀❁❂❃❄❅❆❇❈❉❊❋]+',
+    r'[♠♣♥♦♤♧♢♡♠♣♥♦]+',
+
+    # Stylized text with excessive punctuation or symbols
+    r'^[^\w\s]*[\w\s]+[^\w\s]*$',  # Text surrounded by non-word characters
+
+    # Text with decorative spacing or formatting
+    r'^\s*[A-Z]\s+[A-Z]\s+[A-Z]',  # Spaced out letters like "T O P"
+    r'^[A-Z]+\s*[\-_]+\s*[A-Z]+',  # Text with decorative separators
+
+    # Artistic/stylized font indicators (if font info available)
+    # This would need actual font analysis from PDF
+)]
+
 def is_decorative_text(text, font_info=None):
     """
     Detect if text is decorative (stylized, artistic, or ornamental)
@@ -171,38 +290,9 @@ def is_decorative_text(text, font_info=None):
     
     text_clean = text.strip()
     
-    # Check for decorative character patterns
-    decorative_patterns = [
-        # Repeated decorative characters
-        r'[▪▫■□●○★☆♦♠♣♥]+',
-        r'[═══]+',
-        r'[───]+',
-        r'[^^^]+',
-        r'[~~~]+',
-        r'[***]+',
-        r'[+++]+',
-        r'[###]+',
-        r'[&&&]+',
-        
-        # Decorative Unicode characters
-        r'[◆◇◈◉◎●○◐◑◒◓◔◕◖◗◘◙◚◛◜◝◞◟◠◡◢◣◤◥◦◧◨◩◪◫◬◭◮◯]+',
-        r'[★☆✦✧✩✪✫✬✭✮✯✰✱✲✳✴✵✶✷✸✹✺✻✼✽✾✿❀❁❂❃❄❅❆❇❈❉❊❋]+',
-        r'[♠♣♥♦♤♧♢♡♠♣♥♦]+',
-        
-        # Stylized text with excessive punctuation or symbols
-        r'^[^\w\s]*[\w\s]+[^\w\s]*$',  # Text surrounded by non-word characters
-        
-        # Text with decorative spacing or formatting
-        r'^\s*[A-Z]\s+[A-Z]\s+[A-Z]',  # Spaced out letters like "T O P"
-        r'^[A-Z]+\s*[\-_]+\s*[A-Z]+',  # Text with decorative separators
-        
-        # Artistic/stylized font indicators (if font info available)
-        # This would need actual font analysis from PDF
-    ]
-    
     # Check for decorative patterns
-    for pattern in decorative_patterns:
-        if re.search(pattern, text_clean):
+    for pattern in DECORATIVE_PATTERNS:
+        if pattern.search(text_clean):
             return True
     
     # Check for artistic repetition or stylization
@@ -275,6 +365,30 @@ def find_nearby_heading_words(decorative_element, all_text_elements, max_distanc
     
     return nearby_elements
 
+# URL, e-mail and domain patterns used by contains_urls
+WEB_REFERENCE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    # HTTP/HTTPS URLs
+    r'https?://[^\s]+',
+
+    # Domain names (with common TLDs)
+    r'\b[a-zA-Z0-9-]+\.(com|org|net|edu|gov|mil|int|co|uk|ca|de|fr|jp|au|br|in|cn|ru|it|es|nl|se|no|dk|fi|be|ch|at|pl|cz|hu|ro|bg|hr|si|sk|ee|lv|lt|lu|mt|cy|ie|pt|gr|tr|il|za|eg|ma|ng|ke|gh|tz|ug|zw|bw|mw|zm|ao|mz|mg|mu|sc|re|yt|km|dj|so|et|er|sd|ss|td|cf|cm|gq|ga|cg|cd|st|cv|gw|gn|sl|lr|ci|bf|ml|ne|mr|sn|gm|gw|lr|sl|gn|ci|gh|tg|bj|ng|ne|bf|ml|mr|sn|gm)\b',
+
+    # Email addresses
+    r'\b[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}\b',
+
+    # IP addresses
+    r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b',
+
+    # www. patterns
+    r'\bwww\.[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}\b',
+
+    # ftp patterns
+    r'\bftp://[^\s]+',
+
+    # Common URL-like patterns without protocol
+    r'\b[a-zA-Z0-9-]+\.(com|org|net|edu|gov)[/\w]*\b',
+)]
+
 def contains_urls(text):
     """
     Check if text contains URLs, email addresses, or web-related patterns
@@ -286,33 +400,9 @@ def contains_urls(text):
     # Convert to lowercase for case-insensitive matching
     text_lower = text.lower().strip()
     
-    # URL patterns to detect
-    url_patterns = [
-        # HTTP/HTTPS URLs
-        r'https?://[^\s]+',
-        
-        # Domain names (with common TLDs)
-        r'\b[a-zA-Z0-9-]+\.(com|org|net|edu|gov|mil|int|co|uk|ca|de|fr|jp|au|br|in|cn|ru|it|es|nl|se|no|dk|fi|be|ch|at|pl|cz|hu|ro|bg|hr|si|sk|ee|lv|lt|lu|mt|cy|ie|pt|gr|tr|il|za|eg|ma|ng|ke|gh|tz|ug|zw|bw|mw|zm|ao|mz|mg|mu|sc|re|yt|km|dj|so|et|er|sd|ss|td|cf|cm|gq|ga|cg|cd|st|cv|gw|gn|sl|lr|ci|bf|ml|ne|mr|sn|gm|gw|lr|sl|gn|ci|gh|tg|bj|ng|ne|bf|ml|mr|sn|gm)\b',
-        
-        # Email addresses
-        r'\b[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}\b',
-        
-        # IP addresses
-        r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b',
-        
-        # www. patterns
-        r'\bwww\.[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}\b',
-        
-        # ftp patterns
-        r'\bftp://[^\s]+',
-        
-        # Common URL-like patterns without protocol
-        r'\b[a-zA-Z0-9-]+\.(com|org|net|edu|gov)[/\w]*\b',
-    ]
-    
     # Check each pattern
-    for pattern in url_patterns:
-        if re.search(pattern, text, re.IGNORECASE):
+    for pattern in WEB_REFERENCE_PATTERNS:
+        if pattern.search(text):
             return True
     
     # Additional check for URL-like text structures
@@ -320,7 +410,7 @@ def contains_urls(text):
     if (('www.' in text_lower or '.com' in text_lower or '.org' in text_lower or 
          '.net' in text_lower or '.edu' in text_lower or 'http' in text_lower or
          '@' in text_lower) and 
-        not any(word in text_lower for word in ['web sites', 'websites', 'documents and web sites', 'web documents'])):
+        not RULES["web_phrase_exceptions"](text_lower)):
         return True
     
     return False
@@ -334,8 +424,7 @@ def has_long_numbers(text):
         return False
     
     # Find all number sequences in the text
-    number_pattern = r'\d{5,}'  # 5 or more consecutive digits
-    numbers = re.findall(number_pattern, text)
+    numbers = LONG_NUMBER_PATTERN.findall(text)
     
     if not numbers:
         return False
@@ -343,12 +432,41 @@ def has_long_numbers(text):
     # Check if any long number is NOT a hex Unicode representation
     for number in numbers:
         # Check if it's part of a hex Unicode pattern like \x{1234} or \\x{1234}
-        hex_unicode_pattern = r'\\x\{' + re.escape(number) + r'\}'
-        if not re.search(hex_unicode_pattern, text):
+        if '\\x{' + number + '}' not in text:
             return True  # Found a long number that's not hex Unicode
     
     return False
 
+# URL and web address patterns used by contains_url
+URL_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    # Standard HTTP/HTTPS URLs
+    r'https?://[^\s]+',
+
+    # FTP URLs
+    r'ftp://[^\s]+',
+
+    # URLs without protocol
+    r'www\.[^\s]+',
+
+    # Domain patterns (like example.com)
+    r'\b[a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?\.([a-zA-Z]{2,})\b',
+
+    # Email addresses (often found with URLs)
+    r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
+
+    # IP addresses
+    r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b',
+
+    # File extensions commonly associated with web content
+    r'\b[^\s]+\.(html?|php|asp|jsp|css|js)\b',
+
+    # Common URL-like patterns
+    r'\b[^\s]*://[^\s]*',
+
+    # Domain-like patterns with common TLDs
+    r'\b[^\s]+\.(com|org|net|edu|gov|mil|int|co|uk|de|fr|jp|cn|au|ca|in|br|mx|ru|za|it|es|nl|se|no|dk|fi|be|at|ch|pl|cz|hu|gr|pt|ie|il|kr|tw|hk|sg|th|my|id|ph|vn|pk|bd|lk|np|mm|kh|la|mn|uz|kz|kg|tj|tm|af|ir|iq|sa|ae|om|ye|jo|lb|sy|tr|cy|ge|az|am|by|ua|md|ro|bg|rs|hr|si|sk|lt|lv|ee|is|fo|gl|ad|sm|va|mc|li|lu|mt|al|mk|ba|me|xk|gg|je|im|gi|mq|gp|re|yt|nc|pf|wf|pm|bl|mf|sx|cw|aw|tc|ky|bm|vg|ai|ms|ag|bb|dm|gd|kn|lc|vc|tt|jm|ht|do|cu|bs|pr|vi|as|gu|mp|pw|fm|mh|ki|nr|tv|to|ws|vu|sb|fj|pg|nc|nf|ck|nu|tk|pn|gs|io|tf|bv|sj|um|aq)\b',
+)]
+
 def contains_url(text):
     """
     Check if text contains URLs or web addresses
@@ -357,39 +475,9 @@ def contains_url(text):
     if not text:
         return False
     
-    # Define URL patterns
-    url_patterns = [
-        # Standard HTTP/HTTPS URLs
-        r'https?://[^\s]+',
-        
-        # FTP URLs
-        r'ftp://[^\s]+',
-        
-        # URLs without protocol
-        r'www\.[^\s]+',
-        
-        # Domain patterns (like example.com)
-        r'\b[a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?\.([a-zA-Z]{2,})\b',
-        
-        # Email addresses (often found with URLs)
-        r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
-        
-        # IP addresses
-        r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b',
-        
-        # File extensions commonly associated with web content
-        r'\b[^\s]+\.(html?|php|asp|jsp|css|js)\b',
-        
-        # Common URL-like patterns
-        r'\b[^\s]*://[^\s]*',
-        
-        # Domain-like patterns with common TLDs
-        r'\b[^\s]+\.(com|org|net|edu|gov|mil|int|co|uk|de|fr|jp|cn|au|ca|in|br|mx|ru|za|it|es|nl|se|no|dk|fi|be|at|ch|pl|cz|hu|gr|pt|ie|il|kr|tw|hk|sg|th|my|id|ph|vn|pk|bd|lk|np|mm|kh|la|mn|uz|kz|kg|tj|tm|af|ir|iq|sa|ae|om|ye|jo|lb|sy|tr|cy|ge|az|am|by|ua|md|ro|bg|rs|hr|si|sk|lt|lv|ee|is|fo|gl|ad|sm|va|mc|li|lu|mt|al|mk|ba|me|xk|gg|je|im|gi|mq|gp|re|yt|nc|pf|wf|pm|bl|mf|sx|cw|aw|tc|ky|bm|vg|ai|ms|ag|bb|dm|gd|kn|lc|vc|tt|jm|ht|do|cu|bs|pr|vi|as|gu|mp|pw|fm|mh|ki|nr|tv|to|ws|vu|sb|fj|pg|nc|nf|ck|nu|tk|pn|gs|io|tf|bv|sj|um|aq)\b',
-    ]
-    
     # Check if any URL pattern matches the text
-    for pattern in url_patterns:
-        if re.search(pattern, text, re.IGNORECASE):
+    for pattern in URL_PATTERNS:
+        if pattern.search(text):
             return True
     
     return False
@@ -397,65 +485,99 @@ def contains_url(text):
 def group_text_by_lines(text_elements):
     """
     Group text elements that appear on the same line
+    Elements carry the visual line they belong to ("line", assigned per page by
+    extract_page_elements from PyMuPDF's own lines); elements without one are
+    grouped by their exact top coordinate
     Returns a list of line groups, where each group contains text elements on the same line
     """
-    # Group by page and approximate y-position (allowing small variations for same line)
     line_groups = {}
-    
     for element in text_elements:
-        page = element["page"]
-        y_pos = element.get("y_position", 0)
-        
-        # Round y-position to group elements on approximately the same line
-        # Allow 5 pixel tolerance for elements on the same line
-        line_key = (page, round(y_pos / 5) * 5)
-        
-        if line_key not in line_groups:
-            line_groups[line_key] = []
-        line_groups[line_key].append(element)
-    
+        line = element.get("line")
+        line_key = ((element["page"], line) if line is not None
+                    else (element["page"], None, element.get("y_position", 0)))
+        group = line_groups.get(line_key)
+        if group is None:
+            line_groups[line_key] = [element]
+        else:
+            group.append(element)
+
     # Sort elements within each line by x-position (left to right)
-    for line_key in line_groups:
-        line_groups[line_key].sort(key=lambda x: x.get("x_position", 0))
-    
+    for group in line_groups.values():
+        if len(group) > 1:
+            group.sort(key=lambda x: x.get("x_position", 0))
+
     return list(line_groups.values())
 
-def is_valid_heading_line(line_elements, heading_levels, all_text_frequency, title_components):
+def line_features(line_elements, heading_levels):
+    """
+    Derive what the heading checks read from a line, once per line: the stripped
+    texts of its non-empty elements ("parts"), their joined "text", the text
+    cleaned of numbering, bullets and symbols ("clean_text"), its lowercase form
+    and words, the number of elements and of heading-sized ones, the largest
+    heading size class and the fraction of bold elements
+    Returns the feature record, or None when no non-empty element of the line is
+    heading-sized (such a line is never a heading, and nothing more is derived)
+    """
+    parts = []
+    heading_elements = 0
+    for element in line_elements:
+        text = element["text"].strip()
+        if text:
+            parts.append(text)
+            if element["size_class"] in heading_levels:
+                heading_elements += 1
+    if not heading_elements:
+        return None
+    # Most lines stop above; the few heading-sized ones get a second look
+    heading_size_class = None
+    bold_elements = 0
+    for element in line_elements:
+        text = element["text"]
+        if text and not text.isspace():
+            if element["is_bold"]:
+                bold_elements += 1
+            size_class = element["size_class"]
+            if size_class in heading_levels and (heading_size_class is None or size_class > heading_size_class):
+                heading_size_class = size_class
+    text = " ".join(parts)
+    clean_text = NUMBERING_PREFIX_PATTERN.sub("", text).strip()
+    return {
+        "parts": parts,
+        "text": text,
+        "clean_text": clean_text,
+        "lower": text.lower(),
+        "words": text.split(),
+        "clean_word_count": len(clean_text.split()),
+        "elements": len(parts),
+        "heading_elements": heading_elements,
+        "heading_size_class": heading_size_class,
+        "bold_fraction": bold_elements / len(parts),
+    }
+
+# A line whose text occurs more often than this in a document is a running
+# header, footer or label, not a heading (extract_outline_incremental redoes
+# the pages of texts that cross it)
+MAX_HEADING_REPEATS = 5
+
+def is_valid_heading_line(line, all_text_frequency, title_components):
     """
     Check if an entire line can be considered a valid heading
     Line-based logic: If 2 words lie in the same line, they should be treated as one sentence
     A heading is considered valid if the complete line meets heading criteria as a unit
+    line is the line's feature record (see line_features)
     """
-    if not line_elements:
+    # Lines without a heading-sized word have no feature record
+    if line is None:
         return False
     
-    # Combine all text in the line to form the complete sentence
-    line_text_parts = []
-    heading_size_count = 0
-    total_elements = 0
-    
-    for element in line_elements:
-        text = element["text"].strip()
-        if text:
-            line_text_parts.append(text)
-            total_elements += 1
-            # Count elements with heading-level font size
-            if element["size"] in heading_levels:
-                heading_size_count += 1
-    
-    # Require at least some elements to have heading-level font size
-    # But be more flexible - if most words are heading size, accept the line
-    if heading_size_count == 0:
-        return False  # Must have at least one heading-sized word
-    
-    # Form the complete line text for validation
-    complete_line_text = " ".join(line_text_parts)
-    clean_line_text = re.sub(r"^[0-9.\-\u2013\u2014\)\(©®™]+\s*", "", complete_line_text).strip()
+    # The complete line (parts already stripped) and its cleaned form
+    complete_line_text = line["text"]
+    clean_line_text = line["clean_text"]
     
     # Apply validation to the complete line as a unit (implementing your line-based requirement)
     
     # Check basic length
-    if len(complete_line_text.strip()) < 3:
+    if len(complete_line_text) < 3:
         return False
     
     # Skip empty or title component lines
@@ -463,19 +585,19 @@ def is_valid_heading_line(line_elements, heading_levels, all_text_frequency, tit
         return False
     
     # Check frequency of the complete line text (not individual words)
-    if all_text_frequency.get(clean_line_text, 0) > 5:
+    if all_text_frequency.get(clean_line_text, 0) > MAX_HEADING_REPEATS:
         return False
     
-    # Check if the complete line contains dates
-    if contains_date(complete_line_text) or contains_date(clean_line_text):
+    # Check if the complete line contains dates (the cleaned text only when it differs)
+    if contains_date(complete_line_text) or (clean_line_text != complete_line_text and contains_date(clean_line_text)):
         return False
     
     # Check if the complete line contains mixed content
-    if contains_mixed_content(complete_line_text):
+    if contains_mixed_content(complete_line_text, line["words"], line["lower"]):
         return False
     
     # Check if the complete line ends with punctuation
-    if complete_line_text.strip().endswith((':', '.', ';', ':-', '!', '?')):
+    if complete_line_text.endswith((':', '.', ';', ':-', '!', '?')):
         return False
     
     # Check if the complete line has long numbers
@@ -483,11 +605,12 @@ def is_valid_heading_line(line_elements, heading_levels, all_text_frequency, tit
         return False
     
     # Check if the complete line contains URLs
-    if contains_url(complete_line_text) or contains_url(clean_line_text):
+    if ((contains_url(complete_line_text) and not is_deep_section_number(complete_line_text)) or
+            (clean_line_text != complete_line_text and contains_url(clean_line_text))):
         return False
     
     # Check word count for the complete line
-    word_count = len(clean_line_text.split())
+    word_count = line["clean_word_count"]
     if word_count > 20:
         return False
     
@@ -500,44 +623,50 @@ def is_valid_heading_line(line_elements, heading_levels, all_text_frequency, tit
     
     # Additional line-based validation: check for common non-heading patterns
     # Skip lines that look like body text even if they have some heading-sized words
-    line_lower = complete_line_text.lower()
+    line_lower = line["lower"]
     
     # Skip lines with too many body text indicators (implementing your sentence-based logic)
-    body_text_indicators = ['the', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by']
-    indicator_count = sum(1 for indicator in body_text_indicators if f' {indicator} ' in f' {line_lower} ')
+    padded_line = f' {line_lower} '
+    indicator_count = sum(1 for indicator in RULES["body_text_indicators"] if indicator in padded_line)
     
     # If the line has many body text indicators, be more strict about heading size requirement
     if indicator_count > 0:
         # For lines with common words, require higher proportion of heading-sized elements
         required_proportion = 0.7  # 70% must be heading-sized
-        if (heading_size_count / total_elements) < required_proportion:
+        if (line["heading_elements"] / line["elements"]) < required_proportion:
             return False
     
     # If we get here, the complete line passed all heading criteria
     return True
 
-def contains_mixed_content(text):
+# Heading patterns followed by explanatory text, used by contains_mixed_content
+HEADING_WITH_EXPLANATION_PATTERNS = [re.compile(pattern) for pattern in (
+    r'^[A-Z][A-Za-z\s]+:\s+[a-z]',  # "Title: explanation"
+    r'^[A-Z\s]+\.\s+[A-Z][a-z]',   # "HEADING. Explanation"
+    r'^\d+\.\s*[A-Z][A-Za-z\s]+\.\s+[A-Z][a-z]',  # "1. Title. Explanation"
+)]
+
+def contains_mixed_content(text, words=None, text_lower=None):
     """
     Check if text contains mixed content (heading-style text mixed with normal paragraph text)
+    words and text_lower, the words and lowercase form of the stripped text, are
+    taken from the line's feature record when given
     Returns True if the text appears to contain both heading-style and paragraph-style content
     """
-    if not text or len(text.strip()) < 10:
+    if words is None:
+        if not text:
+            return False
+        text = text.strip()
+        words = text.split()
+        text_lower = text.lower()
+    if len(text) < 10:
         return False
     
-    text = text.strip()
-    
     # Check for incomplete sentences (typical of paragraph fragments mixed in)
-    # Text ending with prepositions, articles, or incomplete phrases
-    incomplete_endings = [
-        'to', 'and', 'or', 'of', 'in', 'for', 'with', 'at', 'by', 'from', 'on', 'as',
-        'the', 'a', 'an', 'this', 'that', 'these', 'those', 'will', 'would', 'should',
-        'can', 'could', 'may', 'might', 'must', 'shall', 'about', 'after', 'before',
-        'during', 'through', 'within', 'without', 'under', 'over', 'between', 'among'
-    ]
-    
-    # Check if text ends with incomplete words (suggests it's part of a larger sentence)
-    last_word = text.split()[-1].lower().rstrip('.,!?;:')
-    if last_word in incomplete_endings:
+    # Check if text ends with a preposition, article or other incomplete word
+    # (suggests it's part of a larger sentence)
+    last_word = words[-1].lower().rstrip('.,!?;:')
+    if last_word in RULES["incomplete_endings"]:
         return True
     
     # Check if text ends with a comma (indicates it's part of a larger sentence)
@@ -546,18 +675,9 @@ def contains_mixed_content(text):
     
     # Check for paragraph-style characteristics
     # Long sentences with multiple clauses
-    if len(text.split()) > 8 and (',' in text or 'and' in text.lower()):
+    if len(words) > 8 and (',' in text or 'and' in text_lower):
         # Check if it reads like a sentence rather than a heading
-        sentence_indicators = [
-            'students', 'provide', 'ensure', 'develop', 'create', 'establish',
-            'implement', 'support', 'enhance', 'improve', 'maintain', 'continue',
-            'opportunity', 'experience', 'understanding', 'knowledge', 'skills',
-            'concentrate', 'required', 'beyond', 'areas', 'science', 'technology',
-            'engineering', 'mathematics', 'expose', 'relevant', 'real', 'world'
-        ]
-        
-        text_lower = text.lower()
-        if any(indicator in text_lower for indicator in sentence_indicators):
+        if RULES["sentence_indicators"](text_lower):
             return True
     
     # Check for text that starts with lowercase (likely continuation of previous sentence)
@@ -566,11 +686,11 @@ def contains_mixed_content(text):
     
     # Check for comma-separated clauses (typical of paragraph text)
     comma_count = text.count(',')
-    if comma_count >= 2 and len(text.split()) > 10:
+    if comma_count >= 2 and len(words) > 10:
         return True
     
     # Split by sentences (periods, exclamation marks, question marks)
-    sentences = re.split(r'[.!?]+', text)
+    sentences = SENTENCE_SPLIT_PATTERN.split(text)
     
     # Remove empty sentences
     sentences = [s.strip() for s in sentences if s.strip()]
@@ -599,18 +719,11 @@ def contains_mixed_content(text):
     # 3. Bold/capitalized start followed by normal text
     
     # Check for heading patterns followed by explanatory text
-    heading_patterns = [
-        r'^[A-Z][A-Za-z\s]+:\s+[a-z]',  # "Title: explanation"
-        r'^[A-Z\s]+\.\s+[A-Z][a-z]',   # "HEADING. Explanation"
-        r'^\d+\.\s*[A-Z][A-Za-z\s]+\.\s+[A-Z][a-z]',  # "1. Title. Explanation"
-    ]
-    
-    for pattern in heading_patterns:
-        if re.search(pattern, text):
+    for pattern in HEADING_WITH_EXPLANATION_PATTERNS:
+        if pattern.search(text):
             return True
     
     # Check for sudden change in capitalization style (heading + normal text)
-    words = text.split()
     if len(words) > 10:
         # Check if first part is all caps/title case and later part is sentence case
         first_half = ' '.join(words[:len(words)//2])
@@ -625,6 +738,95 @@ def contains_mixed_content(text):
     
     return False
 
+# Section numbering that must NOT be read as a date (used by contains_date)
+SECTION_NUMBER_PATTERNS = [re.compile(pattern) for pattern in (
+    r'^\d+(\.\d+)*\s+[A-Za-z]',  # e.g., "2.1 Introduction", "3.2.1 Overview"
+    r'^[A-Za-z]+\s+\d+(\.\d+)*\s+[A-Za-z]',  # e.g., "Section 2.1 Introduction"
+    r'^\d+(\.\d+)*\.\s*$',  # Just numbers with dots, e.g., "2.1."
+)]
+
+# Date formats (excluding version numbers that might be section numbers) used by contains_date
+DATE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    # Full month names with day and year
+    r'\b(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2}(?:st|nd|rd|th)?,?\s+\d{4}\b',
+
+    # Abbreviated month names with day and year
+    r'\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\.?\s+\d{1,2}(?:st|nd|rd|th)?,?\s+\d{4}\b',
+
+    # Month/Day/Year formats (with various separators) - but only if it looks like a pure date
+    r'^\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}$',
+
+    # Year/Month/Day formats (ISO style) - but only if it looks like a pure date
+    r'^\d{4}[\/\-\.]\d{1,2}[\/\-\.]\d{1,2}$',
+
+    # Year-Month-Day (ISO 8601) - but only if it looks like a pure date
+    r'^\d{4}-\d{2}-\d{2}$',
+
+    # Month Day, Year (American style)
+    r'\b(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},\s+\d{4}\b',
+    r'\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\.?\s+\d{1,2},\s+\d{4}\b',
+
+    # Day Month Year (British style)
+    r'\b\d{1,2}(?:st|nd|rd|th)?\s+(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{4}\b',
+    r'\b\d{1,2}(?:st|nd|rd|th)?\s+(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\.?\s+\d{4}\b',
+
+    # Year only (4 digits) - but only if it's the entire text or clearly a year reference
+    r'^\d{4}$',
+    r'\byear\s+\d{4}\b',
+    r'\bin\s+\d{4}\b',
+
+    # Month/Year combinations - but be more specific
+    r'^\b(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{4}$',
+    r'^\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\.?\s+\d{4}$',
+
+    # Quarters
+    r'\bQ[1-4]\s+\d{4}\b',
+    r'\b(First|Second|Third|Fourth)\s+Quarter\s+\d{4}\b',
+
+    # Seasons with year
+    r'\b(Spring|Summer|Fall|Autumn|Winter)\s+\d{4}\b',
+
+    # Week formats
+    r'\bWeek\s+\d{1,2},?\s+\d{4}\b',
+    r'\bWeek\s+of\s+.*\d{4}\b',
+
+    # Time stamps (hours:minutes)
+    r'\b\d{1,2}:\d{2}(?::\d{2})?\s*(AM|PM|am|pm)\b',
+
+    # Relative dates
+    r'^\b(Today|Yesterday|Tomorrow)$',
+    r'^\b(Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday)$',
+
+    # Additional numeric date patterns
+    r'\b\d{1,2}(?:st|nd|rd|th)\s+of\s+(January|February|March|April|May|June|July|August|September|October|November|December)\b',
+    r'\b\d{1,2}(?:st|nd|rd|th)\s+of\s+(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\.?\b',
+
+    # Date ranges - but only pure date ranges
+    r'^\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}\s*[-–—]\s*\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}$',
+
+    # European date format dd.mm.yyyy - but only if it's the entire text
+    r'^\d{1,2}\.\d{1,2}\.\d{4}$',
+
+    # Academic year format (e.g., "2023-24", "2023-2024") - but only if it's the entire text
+    r'^\d{4}[-–—]\d{2,4}$',
+
+    # Financial year quarters
+    r'\bFY\s*\d{4}[-–—]?\d{0,4}\b',
+
+    # Revision dates with explicit date context
+    r'\bRev\.?\s*\d+(?:\.\d+)*\s+(January|February|March|April|May|June|July|August|September|October|November|December|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\.?\s+\d{4}\b',
+
+    # Publication dates
+    r'\bPublished:?\s+.*\d{4}\b',
+    r'\bUpdated:?\s+.*\d{4}\b',
+    r'\bModified:?\s+.*\d{4}\b',
+    r'\bDate:?\s+.*\d{4}\b',
+
+    # Copyright years
+    r'\b©\s*\d{4}\b',
+    r'\bCopyright\s+\d{4}\b',
+)]
+
 def contains_date(text):
     """
     Comprehensive date detection function that checks if text contains any date format
@@ -639,102 +841,13 @@ def contains_date(text):
     
     # First, exclude section numbering patterns that should NOT be considered dates
     # These are legitimate heading patterns that contain numbers but aren't dates
-    section_patterns = [
-        r'^\d+(\.\d+)*\s+[A-Za-z]',  # e.g., "2.1 Introduction", "3.2.1 Overview"
-        r'^[A-Za-z]+\s+\d+(\.\d+)*\s+[A-Za-z]',  # e.g., "Section 2.1 Introduction"
-        r'^\d+(\.\d+)*\.\s*$',  # Just numbers with dots, e.g., "2.1."
-    ]
-    
-    # If it matches section numbering patterns, it's NOT a date
-    for pattern in section_patterns:
-        if re.match(pattern, text_clean):
+    for pattern in SECTION_NUMBER_PATTERNS:
+        if pattern.match(text_clean):
             return False
     
-    # Define comprehensive date patterns (excluding version numbers that might be section numbers)
-    date_patterns = [
-        # Full month names with day and year
-        r'\b(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2}(?:st|nd|rd|th)?,?\s+\d{4}\b',
-        
-        # Abbreviated month names with day and year
-        r'\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\.?\s+\d{1,2}(?:st|nd|rd|th)?,?\s+\d{4}\b',
-        
-        # Month/Day/Year formats (with various separators) - but only if it looks like a pure date
-        r'^\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}$',
-        
-        # Year/Month/Day formats (ISO style) - but only if it looks like a pure date
-        r'^\d{4}[\/\-\.]\d{1,2}[\/\-\.]\d{1,2}$',
-        
-        # Year-Month-Day (ISO 8601) - but only if it looks like a pure date
-        r'^\d{4}-\d{2}-\d{2}$',
-        
-        # Month Day, Year (American style)
-        r'\b(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},\s+\d{4}\b',
-        r'\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\.?\s+\d{1,2},\s+\d{4}\b',
-        
-        # Day Month Year (British style)
-        r'\b\d{1,2}(?:st|nd|rd|th)?\s+(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{4}\b',
-        r'\b\d{1,2}(?:st|nd|rd|th)?\s+(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\.?\s+\d{4}\b',
-        
-        # Year only (4 digits) - but only if it's the entire text or clearly a year reference
-        r'^\d{4}$',
-        r'\byear\s+\d{4}\b',
-        r'\bin\s+\d{4}\b',
-        
-        # Month/Year combinations - but be more specific
-        r'^\b(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{4}$',
-        r'^\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\.?\s+\d{4}$',
-        
-        # Quarters
-        r'\bQ[1-4]\s+\d{4}\b',
-        r'\b(First|Second|Third|Fourth)\s+Quarter\s+\d{4}\b',
-        
-        # Seasons with year
-        r'\b(Spring|Summer|Fall|Autumn|Winter)\s+\d{4}\b',
-        
-        # Week formats
-        r'\bWeek\s+\d{1,2},?\s+\d{4}\b',
-        r'\bWeek\s+of\s+.*\d{4}\b',
-        
-        # Time stamps (hours:minutes)
-        r'\b\d{1,2}:\d{2}(?::\d{2})?\s*(AM|PM|am|pm)\b',
-        
-        # Relative dates
-        r'^\b(Today|Yesterday|Tomorrow)$',
-        r'^\b(Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday)$',
-        
-        # Additional numeric date patterns
-        r'\b\d{1,2}(?:st|nd|rd|th)\s+of\s+(January|February|March|April|May|June|July|August|September|October|November|December)\b',
-        r'\b\d{1,2}(?:st|nd|rd|th)\s+of\s+(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\.?\b',
-        
-        # Date ranges - but only pure date ranges
-        r'^\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}\s*[-–—]\s*\d{1,2}[\/\-\.]\d{1,2}[\/\-\.]\d{2,4}$',
-        
-        # European date format dd.mm.yyyy - but only if it's the entire text
-        r'^\d{1,2}\.\d{1,2}\.\d{4}$',
-        
-        # Academic year format (e.g., "2023-24", "2023-2024") - but only if it's the entire text
-        r'^\d{4}[-–—]\d{2,4}$',
-        
-        # Financial year quarters
-        r'\bFY\s*\d{4}[-–—]?\d{0,4}\b',
-        
-        # Revision dates with explicit date context
-        r'\bRev\.?\s*\d+(?:\.\d+)*\s+(January|February|March|April|May|June|July|August|September|October|November|December|Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\.?\s+\d{4}\b',
-        
-        # Publication dates
-        r'\bPublished:?\s+.*\d{4}\b',
-        r'\bUpdated:?\s+.*\d{4}\b',
-        r'\bModified:?\s+.*\d{4}\b',
-        r'\bDate:?\s+.*\d{4}\b',
-        
-        # Copyright years
-        r'\b©\s*\d{4}\b',
-        r'\bCopyright\s+\d{4}\b',
-    ]
-    
     # Check if any date pattern matches the text
-    for pattern in date_patterns:
-        if re.search(pattern, text_clean, re.IGNORECASE):
+    for pattern in DATE_PATTERNS:
+        if pattern.search(text_clean):
             return True
     
     return False
@@ -750,140 +863,1276 @@ def is_form_field_or_generic_term(text):
     # Clean the text
     clean_text = text.strip().lower()
     
-    # Single words that are typically form fields or generic terms
-    form_fields_and_generic_terms = {
-        # Common form fields
-        'name', 'date', 'address', 'phone', 'email', 'signature', 'title', 'position',
-        'department', 'company', 'organization', 'city', 'state', 'country', 'zip',
-        'zipcode', 'postal', 'code', 'number', 'amount', 'total', 'subtotal',
-        'quantity', 'price', 'cost', 'fee', 'tax', 'discount', 'balance',
-        
-        # Document metadata terms
-        'page', 'pages', 'version', 'draft', 'final', 'copy',
-        'original', 'duplicate', 'file', 'document', 'form', 'application',
-        
-        # Generic descriptive words
-        'yes', 'no', 'true', 'false', 'male', 'female', 'other', 'none',
-        'optional', 'required', 'mandatory', 'notes', 'comments', 'information', 'data',
-        
-        # Time-related single words
-        'time', 'hour', 'minute', 'second', 'day', 'week', 'month', 'year',
-        'today', 'yesterday', 'tomorrow', 'morning', 'afternoon', 'evening',
-        'night', 'am', 'pm',
-        
-        # Status/action words
-        'approved', 'rejected', 'pending', 'completed', 'incomplete', 'draft',
-        'submitted', 'received', 'processed', 'cancelled', 'active', 'inactive',
-        
-        # Common single letter or number labels
-        'a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm',
-        'n', 'o', 'p', 'q', 'r', 's', 't', 'u', 'v', 'w', 'x', 'y', 'z',
-        '1', '2', '3', '4', '5', '6', '7', '8', '9', '0',
-        
-        # Units and measurements
-        'kg', 'lb', 'oz', 'cm', 'mm', 'inch', 'ft', 'meter', 'mile', 'km',
-        'percent', '%', 'dollar', '$', 'euro', '€', 'pound', '£',
-        
-        # Checkbox/radio button labels
-        'check', 'select', 'choose', 'pick', 'mark', 'tick', 'cross',
-        
-        # Common abbreviations
-        'etc', 'inc', 'corp', 'ltd', 'llc', 'co', 'dept', 'div', 'mgr',
-        'dir', 'vp', 'ceo', 'cfo', 'hr', 'it', 'pr', 'qa',
-        
-        # Educational/certification terms
-        'grade', 'score', 'rank', 'level', 'class', 'course', 'subject',
-        'test', 'exam', 'quiz', 'homework',
-        
-        # Medical/health form terms
-        'age', 'weight', 'height', 'gender', 'race',
+    # Check if it's a single word and in our exclusion list
+    if ' ' not in clean_text and clean_text in RULES["form_fields_and_generic_terms"]:
+        return True
+    
+    # Also exclude very short single words (1-2 characters) that are likely labels
+    if len(clean_text) <= 2 and ' ' not in clean_text:
+        return True
+    
+    # Exclude words that are just numbers or simple patterns
+    if DIGITS_ONLY_PATTERN.match(clean_text):  # Just numbers
+        return True
+    
+    if SINGLE_LETTER_PATTERN.match(clean_text):  # Single letters
+        return True
+    
+    return False
+
+# Called with the name of each extraction stage as it ends ("start" when an
+# extraction begins); used by the memory profiler. None when nothing listens
+STAGE_HOOK = None
+
+def use_stage_hook(stage_hook):
+    """
+    Make stage_hook (a callable taking the stage name, or None) the stage hook
+    Returns the previous hook
+    """
+    global STAGE_HOOK
+    previous = STAGE_HOOK
+    STAGE_HOOK = stage_hook
+    return previous
+
+def mark_stage(stage):
+    """Report the end of an extraction stage to the stage hook, if any"""
+    if STAGE_HOOK is not None:
+        STAGE_HOOK(stage)
+
+def open_pdf(source):
+    """
+    Open a PDF given either a file path or the raw bytes of the document
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=bytes(source), filetype="pdf")
+    return fitz.open(source)
+
+def read_metadata_title(doc):
+    """
+    Return the title stored in the PDF metadata, or "" if it is missing or unreadable
+    """
+    try:
+        return doc.metadata.get("title", "").strip()
+    except Exception:
+        return ""
+
+# Two PyMuPDF lines are treated as one visual line when their vertical
+# extents overlap by at least this share of the shorter line's height
+COLLINEAR_OVERLAP = 0.5
+# Changed whenever extraction splits or groups spans differently, so cached spans
+# (span cache, incremental state) from earlier versions are not reused
+SPAN_EXTRACTION_VERSION = 3
+
+def merge_collinear_lines(line_boxes):
+    """
+    Assign visual line numbers to the PyMuPDF lines of one page
+    line_boxes holds the (top, bottom) of each line; lines are swept top to
+    bottom and merged only when they overlap vertically by COLLINEAR_OVERLAP of
+    the shorter height (table cells or columns PyMuPDF put in separate blocks)
+    A line is compared with the band all lines of the visual line share, so a
+    tall line (a large heading or drop cap in another column) next to two
+    stacked body lines does not chain them into one
+    Returns the visual line number of each line, in the order of line_boxes
+    """
+    visual_lines = [0] * len(line_boxes)
+    current_top = current_bottom = None
+    visual_line = -1
+    for index in sorted(range(len(line_boxes)), key=line_boxes.__getitem__):
+        top, bottom = line_boxes[index]
+        if current_top is not None:
+            overlap = min(bottom, current_bottom) - max(top, current_top)
+            if overlap > 0 and overlap >= COLLINEAR_OVERLAP * min(bottom - top, current_bottom - current_top):
+                current_top, current_bottom = max(top, current_top), min(bottom, current_bottom)
+                visual_lines[index] = visual_line
+                continue
+        visual_line += 1
+        current_top, current_bottom = top, bottom
+        visual_lines[index] = visual_line
+    return visual_lines
+
+# A page with at most this many non-empty spans whose images cover at least
+# this share of its area is treated as scanned (no usable text layer)
+SCANNED_PAGE_MAX_SPANS = 3
+SCANNED_PAGE_MIN_IMAGE_COVERAGE = 0.5
+
+def classify_page(blocks, page_rect, span_count):
+    """
+    Classify a page as "text", "scanned" or "empty" from its non-empty span count
+    and, only for pages with (almost) no text, the share of it covered by the
+    image blocks of its get_text("dict") output
+    """
+    if span_count > SCANNED_PAGE_MAX_SPANS:
+        return "text"
+    page_area = page_rect.width * page_rect.height
+    covered = 0.0
+    for b in blocks:
+        if b.get("type") != 1:
+            continue
+        image_rect = fitz.Rect(b["bbox"]) & page_rect
+        if not image_rect.is_empty:
+            covered += image_rect.width * image_rect.height
+    if page_area > 0 and covered / page_area >= SCANNED_PAGE_MIN_IMAGE_COVERAGE:
+        return "scanned"
+    return "text" if span_count else "empty"
+
+# get_text("dict") flags of the low-memory path: image blocks (which carry a
+# copy of the image data) are left out; their boxes come from get_image_info()
+LOW_MEMORY_TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+def extract_page_elements(page, page_index, include_color=False, page_kinds=None, textpage=None,
+                          low_memory=False):
+    """
+    Collect the text spans of one page with font sizes and position information
+    Returns a list of text element dicts in PyMuPDF reading order
+    The span colour is only kept when include_color is set (for the analysis report)
+    If page_kinds is a dict, the page's classify_page() kind is stored under page_index
+    textpage lets an OCR backend pass in an OCR text page instead of the text layer
+    low_memory reads the page without image data (spans behind images may be
+    split differently)
+    """
+    text_elements = []
+    page_height = page.rect.height
+    page_width = page.rect.width
+    if low_memory:
+        blocks = page.get_text("dict", flags=LOW_MEMORY_TEXT_FLAGS, textpage=textpage)["blocks"]
+    else:
+        blocks = page.get_text("dict", textpage=textpage)["blocks"]
+    line_boxes = []
+    line_starts = []
+    for b in blocks:
+        if "lines" in b:
+            for l in b["lines"]:
+                line_boxes.append((l["bbox"][1], l["bbox"][3]))
+                line_starts.append(len(text_elements))
+                for s in l["spans"]:
+                    # Apply Unicode normalization to the text
+                    raw_text = s["text"].strip()
+                    normalized_text = normalize_unicode_characters(raw_text)
+                    # Calculate relative position on page (0.0 = top, 1.0 = bottom)
+                    y_position = s["bbox"][1]  # Top Y coordinate of the text
+                    relative_y = y_position / page_height
+                    # Calculate horizontal position (0.0 = left, 1.0 = right)
+                    x_position = s["bbox"][0]  # Left X coordinate of the text
+                    relative_x = x_position / page_width
+                    # Bold or italic by the span flags or by the font name
+                    # ("Arial-Black" carries no bold flag)
+                    flags = s["flags"]
+                    font = sys.intern(s.get("font", ""))
+                    style = font_style(font)
+
+                    text_elements.append({
+                        "text": normalized_text,
+                        "size": round(s["size"], 1),
+                        "flags": flags,
+                        "is_bold": bool(flags & BOLD_FLAG) or style[0],
+                        "is_italic": bool(flags & ITALIC_FLAG) or style[1],
+                        "font": font,
+                        "page": page_index,  # Zero-indexed page number
+                        "y_position": y_position,
+                        "relative_y": relative_y,
+                        "x_position": x_position,
+                        "relative_x": relative_x
+                    })
+                    if include_color:
+                        text_elements[-1]["color"] = s.get("color", 0)
+
+    # Record the visual line of every span for group_text_by_lines
+    line_starts.append(len(text_elements))
+    for index, visual_line in enumerate(merge_collinear_lines(line_boxes)):
+        for element_index in range(line_starts[index], line_starts[index + 1]):
+            text_elements[element_index]["line"] = visual_line
+
+    if page_kinds is not None:
+        if low_memory:
+            blocks = [{"type": 1, "bbox": image["bbox"]} for image in page.get_image_info()]
+        page_kinds[page_index] = classify_page(blocks, page.rect, sum(1 for t in text_elements if t["text"]))
+    return text_elements
+
+# Resolution scanned pages are rendered at for OCR
+OCR_DPI = 300
+
+def tesseract_ocr_backend(page, page_index, include_color=False):
+    """
+    OCR backend using Tesseract through PyMuPDF's OCR text page
+    Returns the text elements of the page, like extract_page_elements
+    """
+    textpage = page.get_textpage_ocr(dpi=OCR_DPI, full=True)
+    return extract_page_elements(page, page_index, include_color, textpage=textpage)
+
+def default_ocr_backend():
+    """
+    Return the OCR backend to use when none is configured: Tesseract if the
+    tesseract binary is installed, otherwise None (scanned pages are then only counted)
+    """
+    return tesseract_ocr_backend if shutil.which("tesseract") else None
+
+# Backend the OCR queue of process_pdfs hands scanned documents to: a callable
+# (page, page_index, include_color) returning text elements, or None
+OCR_BACKEND = default_ocr_backend()
+
+def use_ocr_backend(ocr_backend):
+    """
+    Make ocr_backend the backend used for scanned pages (None disables OCR)
+    Returns the previously active backend
+    """
+    global OCR_BACKEND
+    previous = OCR_BACKEND
+    OCR_BACKEND = ocr_backend
+    return previous
+
+def read_page(doc, page_index, include_color, page_kinds, ocr_backend=None, low_memory=False):
+    """
+    Extract one page, recording its kind in page_kinds; with an ocr_backend,
+    scanned pages are read through it instead of their (missing) text layer
+    """
+    page = doc[page_index]
+    text_elements = extract_page_elements(page, page_index, include_color, page_kinds, low_memory=low_memory)
+    if ocr_backend is not None and page_kinds[page_index] == "scanned":
+        text_elements = ocr_backend(page, page_index, include_color)
+    return text_elements
+
+# The title is only ever taken from these (zero-indexed) pages
+TITLE_PAGES = range(0, 3)
+# Pages outside the requested range whose spans feed the font-size and
+# repetition statistics when only part of a document is extracted
+DEFAULT_STATISTICS_SAMPLE_PAGES = 8
+# First window of pages analysed when max_headings asks for an early stop;
+# the window doubles until enough headings are found
+EARLY_STOP_INITIAL_PAGES = 4
+
+def page_text_size(page):
+    """
+    Return the largest font size of any visible text on a page, or None
+    Read without images and whitespace handling, which is much cheaper than
+    read_page, and rounded as read_page rounds span sizes, so it is never below
+    the size read_page reports for any text of the page
+    """
+    return max((round(span["size"], 1) for block in page.get_text("dict", flags=0)["blocks"]
+                for line in block.get("lines", ()) for span in line["spans"] if span["text"].strip()),
+               default=None)
+
+def select_sample_pages(page_count, skip_pages, sample_count):
+    """
+    Pick up to sample_count pages spread evenly over the document, skipping pages already extracted
+    """
+    candidates = [p for p in range(page_count) if p not in skip_pages]
+    if len(candidates) <= sample_count:
+        return candidates
+    step = len(candidates) / sample_count
+    return [candidates[int(i * step)] for i in range(sample_count)]
+
+# Corpus-level frequency model used to drop running headers, footers and form
+# labels shared across documents; None disables the corpus prefilter
+CORPUS_MODEL = None
+
+def use_corpus_model(corpus_model):
+    """
+    Make corpus_model (a CorpusFrequencyModel or None) the active corpus model
+    Returns the previously active model
+    """
+    global CORPUS_MODEL
+    previous = CORPUS_MODEL
+    CORPUS_MODEL = corpus_model
+    return previous
+
+# Per-document memory budget: once reading a document has grown the RSS by more
+# than this many MB, its remaining pages are read on the low-memory path.
+# None disables the check
+MEMORY_BUDGET_MB = None
+
+def page_reader(doc, include_color, page_kinds, ocr_backend=None):
+    """
+    Return a function reading one page of an open document with read_page (given
+    its index, returning its text elements) that switches to the low-memory path
+    for the pages read after the document exceeds MEMORY_BUDGET_MB
+    """
+    budget_kb = MEMORY_BUDGET_MB * 1024 if MEMORY_BUDGET_MB else None
+    start_rss_kb = current_rss_kb() if budget_kb else 0
+    low_memory = False
+
+    def read(page_index):
+        nonlocal low_memory
+        elements = read_page(doc, page_index, include_color, page_kinds, ocr_backend, low_memory)
+        if budget_kb and not low_memory and current_rss_kb() - start_rss_kb > budget_kb:
+            low_memory = True
+            mark_stage("low_memory")
+        return elements
+    return read
+
+def read_pages(doc, page_indexes, include_color, page_kinds, ocr_backend=None):
+    """
+    Extract the given pages of an open document with read_page, switching to the
+    low-memory path when the document exceeds MEMORY_BUDGET_MB
+    Returns their text elements in page order
+    """
+    read = page_reader(doc, include_color, page_kinds, ocr_backend)
+    text_elements = []
+    for page_index in page_indexes:
+        text_elements.extend(read(page_index))
+    mark_stage("extract_pages")
+    return text_elements
+
+# Span cache consulted by full extractions of PDF files (see use_span_cache)
+SPAN_CACHE = None
+
+def use_span_cache(span_cache):
+    """
+    Make span_cache (a span_cache.SpanCache, or None) the cache full extractions
+    read their spans from and write them to
+    Returns the previously active cache
+    """
+    global SPAN_CACHE
+    previous = SPAN_CACHE
+    SPAN_CACHE = span_cache
+    return previous
+
+def span_cache_fingerprint():
+    """
+    Return what besides the PDF bytes determines the extracted spans: the PyMuPDF
+    version, SPAN_EXTRACTION_VERSION and the extraction settings, so changing
+    any of them invalidates the cache
+    """
+    return json.dumps([fitz.VersionBind, SPAN_EXTRACTION_VERSION, sorted(UNICODE_REPLACEMENTS.items()),
+                       COLLINEAR_OVERLAP, SCANNED_PAGE_MAX_SPANS, SCANNED_PAGE_MIN_IMAGE_COVERAGE])
+
+def finish_outline(text_elements, metadata_title, analysis=False):
+    """
+    Analyse the text elements of a whole document, applying and (when it is
+    learning) updating the active corpus model
+    Returns the extraction result
+    """
+    corpus_model = CORPUS_MODEL
+    corpus_keys = set() if corpus_model is not None else None
+    result = analyze_text_elements(text_elements, metadata_title, analysis=analysis,
+                                   corpus_model=corpus_model, corpus_keys=corpus_keys)
+    if corpus_model is not None:
+        corpus_model.last_document_keys = sorted(corpus_keys)
+        if corpus_model.learning:
+            corpus_model.add_document(corpus_keys)
+    return result
+
+def extract_outline(pdf_path, pages=None, title_only=False, max_headings=None,
+                    sample_pages=DEFAULT_STATISTICS_SAMPLE_PAGES, analysis=False,
+                    page_kinds=None, ocr_backend=None):
+    """
+    Extract the title and heading outline of a PDF (a file path or the PDF bytes)
+
+    pages        -- zero-indexed pages to report headings for (default: all); the
+                    title pages are always read
+    title_only   -- only read the title pages and return an empty outline
+    max_headings -- stop reading further pages once this many headings are found
+    sample_pages -- when part of the document is skipped, this many other pages
+                    are read for the body-size and repetition statistics only
+
+    The title depends on the largest text size of the whole document, so when
+    part of it is skipped, a font-size pass over the skipped pages (see
+    page_text_size) adds every page that may hold larger text than the pages
+    read to the statistics sample; partial modes then give the full title
+    analysis     -- also return a text analysis report under result["analysis"],
+                    built from the same extracted spans (no second pass)
+
+    page_kinds   -- dict that receives the kind ("text", "scanned" or "empty") of
+                    every page read
+    ocr_backend  -- read scanned pages through this OCR backend (see OCR_BACKEND);
+                    by default they contribute no text
+
+    When a corpus model is active (use_corpus_model), lines it knows as corpus
+    boilerplate are skipped, and full extractions are added to a learning model
+    When a span cache is active (use_span_cache), full extractions of PDF files
+    without OCR are served from it when the file was seen before, without opening
+    the PDF, and stored in it otherwise (unless a memory budget is set, as the
+    low-memory path may split spans differently)
+    """
+    mark_stage("start")
+    span_cache = SPAN_CACHE
+    cache_key = None
+    if (span_cache is not None and isinstance(pdf_path, str) and ocr_backend is None and
+            pages is None and not title_only and max_headings is None):
+        cache_key = span_cache.key(pdf_path)
+        cached = span_cache.load(cache_key, include_color=analysis)
+        if cached is not None:
+            text_elements, metadata_title, cached_page_kinds = cached
+            if page_kinds is not None:
+                page_kinds.update(cached_page_kinds)
+            mark_stage("span_cache")
+            return finish_outline(text_elements, metadata_title, analysis)
+    doc = open_pdf(pdf_path)
+    metadata_title = read_metadata_title(doc)
+    page_count = doc.page_count
+    mark_stage("open")
+    corpus_model = CORPUS_MODEL
+    if page_kinds is None:
+        page_kinds = {}
+
+    if pages is None and not title_only and max_headings is None:
+        # Full extraction: every page, no sampling needed
+        text_elements = read_pages(doc, range(page_count), analysis, page_kinds, ocr_backend)
+        doc.close()
+        if cache_key is not None and not MEMORY_BUDGET_MB:
+            span_cache.store(cache_key, text_elements, metadata_title, page_kinds)
+        return finish_outline(text_elements, metadata_title, analysis)
+
+    if title_only:
+        wanted_pages = [p for p in TITLE_PAGES if p < page_count]
+    elif pages is not None:
+        wanted_pages = sorted({p for p in pages if 0 <= p < page_count} |
+                              {p for p in TITLE_PAGES if p < page_count})
+    else:
+        wanted_pages = list(range(page_count))
+
+    if max_headings is None or title_only:
+        windows = [len(wanted_pages)]
+    else:
+        windows = []
+        window = EARLY_STOP_INITIAL_PAGES
+        while window < len(wanted_pages):
+            windows.append(window)
+            window *= 2
+        windows.append(len(wanted_pages))
+
+    # Read the first window and the statistics sample up front so every analysis
+    # below sees the same statistics; pages a window reaches are reused, not re-read
+    read = page_reader(doc, analysis, page_kinds, ocr_backend)
+    sampled = {}
+    for page_index in wanted_pages[:windows[0]]:
+        sampled[page_index] = read(page_index)
+    for page_index in select_sample_pages(page_count, set(sampled), sample_pages):
+        sampled[page_index] = read(page_index)
+    # The largest size class is the title size class: pages that may hold text
+    # larger than any read so far join the sample
+    largest = max((t["size"] for elements in sampled.values() for t in elements if len(t["text"]) > 3),
+                  default=0)
+    for page_index in range(page_count):
+        if page_index not in sampled:
+            size = page_text_size(doc[page_index])
+            if size is not None and size > largest:
+                sampled[page_index] = read(page_index)
+                largest = max([largest] + [t["size"] for t in sampled[page_index] if len(t["text"]) > 3])
+    mark_stage("sample_pages")
+
+    text_elements = []
+    extracted = 0
+    for window in windows:
+        for page_index in wanted_pages[extracted:window]:
+            if page_index in sampled:
+                text_elements.extend(sampled.pop(page_index))
+            else:
+                text_elements.extend(read(page_index))
+        extracted = window
+        mark_stage("extract_pages")
+        sample_elements = [element for elements in sampled.values() for element in elements]
+        result = analyze_text_elements(text_elements, metadata_title,
+                                       statistics_elements=text_elements + sample_elements,
+                                       analysis=analysis, corpus_model=corpus_model)
+        if max_headings is not None and len(result["outline"]) >= max_headings:
+            break
+    doc.close()
+
+    if title_only:
+        result["outline"] = []
+    elif pages is not None:
+        requested = set(pages)
+        result["outline"] = [item for item in result["outline"] if item["page"] in requested]
+    if max_headings is not None:
+        result["outline"] = result["outline"][:max_headings]
+    return result
+
+# Incremental extraction (see extract_outline_incremental): the state of a
+# document is a directory with this file and the spans of each page, stored in
+# a SpanCache under the page's content hash
+INCREMENTAL_STATE_FILE = "pages.json"
+
+# Directory process_pdf_file keeps the incremental state of every document in
+# (<name>.state), or None to extract every document in full
+INCREMENTAL_STATE_DIR = None
+
+def page_content_hashes(doc):
+    """
+    Return the SHA-256 hex digest of every page of an open document, over its page
+    object (resources, boxes, rotation) and its content streams, so a page edited
+    by an incremental save changes hash and the untouched pages keep theirs
+    (a resource object replaced in place under the same number goes unnoticed)
+    """
+    hashes = []
+    for page in doc:
+        digest = hashlib.sha256(doc.xref_object(page.xref, compressed=True).encode("utf-8"))
+        digest.update(page.read_contents())
+        hashes.append(digest.hexdigest())
+    return hashes
+
+def incremental_fingerprint():
+    """
+    Return what besides the page contents the saved per-page state depends on:
+    the span extraction settings, the font style rules, the rule set, the
+    analysis settings (including MAX_HEADING_REPEATS), the stage functions of
+    the active pipeline and the heading classifier
+    """
+    stages = [f"{function.__module__}.{function.__qualname__}" for _, function, _, _ in OUTLINE_PIPELINE.stages]
+    classifier = HEADING_CLASSIFIER.to_dict() if HEADING_CLASSIFIER is not None else None
+    return json.dumps([span_cache_fingerprint(), FONT_NAME_WEIGHTS, BOLD_WEIGHT, RULES.get("fingerprint"),
+                       SIZE_CLASS_TOLERANCE, OUTLINE_DEPTH, CONTEXT_DEPTH, MAX_HEADING_REPEATS, stages, classifier])
+
+def load_incremental_state(state_dir, fingerprint):
+    """
+    Read the per-page state saved in state_dir
+    Returns it, or None when there is none or it was saved with other settings
+    """
+    try:
+        with open(os.path.join(state_dir, INCREMENTAL_STATE_FILE), encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get("fingerprint") != fingerprint:
+        return None
+    for record in state["pages"]:
+        for heading in record["raw_headings"] or ():
+            # JSON has no tuples; restore the parsed numbering
+            if heading["numbering"] is not None:
+                segments, terminator, rest = heading["numbering"]
+                heading["numbering"] = (tuple(segments), terminator, rest)
+    return state
+
+def save_incremental_state(state_dir, state, span_store):
+    """
+    Write the per-page state to state_dir (replaced atomically) and delete the
+    stored spans of pages the document no longer has
+    """
+    path = os.path.join(state_dir, INCREMENTAL_STATE_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        # One json.dumps call (the C encoder), not json.dump's chunked writes
+        f.write(json.dumps(state, ensure_ascii=False))
+    os.replace(tmp_path, path)
+    live = {span_store.digest_key(record["hash"]) + ".spans" for record in state["pages"]}
+    for file in os.listdir(state_dir):
+        if file.endswith(".spans") and file not in live:
+            os.remove(os.path.join(state_dir, file))
+
+def summarize_page(elements, digest, kind):
+    """
+    Return the state record of a newly read page: its hash and kind and the
+    statistics it adds to the document (size counts, largest text size and text
+    frequencies); its heading analysis is filled in by extract_outline_incremental
+    """
+    size_counts, text_size_counts = count_sizes(elements)
+    return {
+        "hash": digest,
+        "kind": kind,
+        "size_counts": list(size_counts.items()),
+        "text_size_counts": list(text_size_counts.items()),
+        "max_text_size": max((t["size"] for t in elements if t["text"]), default=None),
+        "text_frequency": list(count_text_frequency(elements).items()),
+        "candidate_texts": None,
+        "raw_headings": None,
+        "consolidation": None,
+    }
+
+def extract_outline_incremental(pdf_path, state_dir, page_kinds=None, work=None):
+    """
+    Extract the title and outline of a PDF file that changes between runs (e.g.
+    by incremental saves), redoing only what its changed pages affect
+
+    state_dir holds what the previous run learned about every page: its content hash, spans, statistics, heading
+    candidates and consolidated headings. A run hashes every page and
+      - reads only the pages whose hash is new (pages that merely moved, or went
+        back to an earlier version, come from the stored spans),
+      - sums the per-page size and text counts into the document statistics,
+      - re-runs the line and heading stages only on changed pages and on pages
+        whose candidate lines cross the repetition threshold because of them
+        (with a heading classifier active, whose count changed at all; every
+        page when the size model or the title changes),
+      - runs the hierarchy pass over all headings (one linear pass), and
+      - re-consolidates only the pages whose headings changed.
+    The result is the one extract_outline gives for the same file, and the state
+    is updated for the next run. A state saved with other settings (see
+    incremental_fingerprint) is ignored. With a corpus model active, or with a
+    statistics stage other than build_size_model, the document is extracted in
+    full without state
+
+    page_kinds -- dict that receives the kind of every page
+    work       -- dict that receives the pages read, analysed and consolidated
+    Returns the extraction result
+    """
+    stages = {name: function for name, function, _, _ in OUTLINE_PIPELINE.stages}
+    if CORPUS_MODEL is not None or stages["statistics"] is not build_size_model:
+        return extract_outline(pdf_path, page_kinds=page_kinds)
+    mark_stage("start")
+    if page_kinds is None:
+        page_kinds = {}
+    fingerprint = incremental_fingerprint()
+    state = load_incremental_state(state_dir, fingerprint)
+    old_pages = state["pages"] if state is not None else []
+    span_store = SpanCache(state_dir, span_cache_fingerprint())
+    # Elements of the pages read or loaded in this run, by page index
+    page_elements = {}
+
+    doc = open_pdf(pdf_path)
+    try:
+        metadata_title = read_metadata_title(doc)
+        hashes = page_content_hashes(doc)
+        mark_stage("page_hashes")
+        pages = []
+        read = 0
+        for page_index, digest in enumerate(hashes):
+            old = old_pages[page_index] if page_index < len(old_pages) else None
+            if old is not None and old["hash"] == digest:
+                pages.append(old)
+                page_kinds[page_index] = old["kind"]
+                continue
+            key = span_store.digest_key(digest)
+            stored = span_store.load(key)
+            if stored is not None:
+                elements = stored[0]
+                for t in elements:
+                    t["page"] = page_index
+                page_kinds[page_index] = stored[2][0]
+            else:
+                elements = read_page(doc, page_index, False, page_kinds)
+                span_store.store(key, elements, "", {0: page_kinds[page_index]})
+                read += 1
+            page_elements[page_index] = elements
+            pages.append(summarize_page(elements, digest, page_kinds[page_index]))
+        mark_stage("extract_pages")
+    finally:
+        doc.close()
+
+    def elements_of(page_index):
+        if page_index not in page_elements:
+            elements = span_store.load(span_store.digest_key(pages[page_index]["hash"]))[0]
+            for t in elements:
+                t["page"] = page_index
+            page_elements[page_index] = elements
+        return page_elements[page_index]
+
+    # Document statistics, summed in page order as build_size_model counts them
+    size_counts = Counter()
+    text_size_counts = Counter()
+    text_frequency = Counter()
+    max_text_size = None
+    for record in pages:
+        for size, count in record["size_counts"]:
+            size_counts[size] += count
+        for size, count in record["text_size_counts"]:
+            text_size_counts[size] += count
+        for text, count in record["text_frequency"]:
+            text_frequency[text] += count
+        if record["max_text_size"] is not None:
+            max_text_size = max(max_text_size or 0, record["max_text_size"])
+    size_model = size_model_from_counts(size_counts, text_size_counts)
+    mark_stage("statistics")
+
+    analysed = consolidated = 0
+    if size_model is None:
+        title_info = None
+        outline = []
+        for record in pages:
+            record["candidate_texts"] = record["raw_headings"] = record["consolidation"] = None
+        size_signature = title_hashes = context = None
+    else:
+        size_classes = size_model["size_classes"]
+        heading_levels = size_model["heading_levels"]
+        size_signature = hashlib.sha256(json.dumps([
+            sorted(size_classes.items()), size_model["class_sizes"],
+            sorted(size_model["heading_levels"].items())]).encode("utf-8")).hexdigest()
+        changed = [page_index for page_index, record in enumerate(pages) if record["raw_headings"] is None]
+
+        # Title: only the title pages, the size model and the largest text size matter
+        title_pages = [page_index for page_index in TITLE_PAGES if page_index < len(pages)]
+        title_hashes = [pages[page_index]["hash"] for page_index in title_pages]
+        if (state is not None and state["size_signature"] == size_signature and
+                state["max_text_size"] == max_text_size and state["title_hashes"] == title_hashes):
+            title_info = state["title"]
+        else:
+            title_elements = [t for page_index in title_pages for t in elements_of(page_index)]
+            for t in title_elements:
+                t["size_class"] = size_classes[t["size"]]
+            title_info = stages["title"]({"elements": title_elements, "statistics_elements": title_elements,
+                                          "metadata_title": metadata_title, "max_text_size": max_text_size},
+                                         size_model)
+        mark_stage("title")
+
+        # Pages whose line and heading stages must run again
+        context = hashlib.sha256(json.dumps([size_signature, title_info]).encode("utf-8")).hexdigest()
+        if state is None or state.get("context") != context:
+            redo = set(range(len(pages)))
+        else:
+            redo = set(changed)
+            # Texts whose count crossed the repetition threshold of is_valid_heading_line
+            delta = Counter()
+            for page_index in changed:
+                for text, count in pages[page_index]["text_frequency"]:
+                    delta[text] += count
+                if page_index < len(old_pages):
+                    for text, count in old_pages[page_index]["text_frequency"]:
+                        delta[text] -= count
+            for old in old_pages[len(pages):]:
+                for text, count in old["text_frequency"]:
+                    delta[text] -= count
+            if HEADING_CLASSIFIER is not None:
+                # The classifier scores the count itself, so any change can flip a line
+                flipped = {text for text, count in delta.items() if count}
+            else:
+                flipped = {text for text, count in delta.items()
+                           if count and (text_frequency[text] > MAX_HEADING_REPEATS) !=
+                           (text_frequency[text] - count > MAX_HEADING_REPEATS)}
+            if flipped:
+                redo.update(page_index for page_index, record in enumerate(pages)
+                            if record["candidate_texts"] and flipped.intersection(record["candidate_texts"]))
+        for page_index in sorted(redo):
+            elements = elements_of(page_index)
+            for t in elements:
+                t["size_class"] = size_classes[t["size"]]
+            page_spans = {"elements": elements, "statistics_elements": (), "metadata_title": metadata_title}
+            lines = stages["line_groups"](page_spans, size_model, title_info, {})["lines"]
+            record = pages[page_index] = dict(pages[page_index])
+            # The texts whose repetition count decides whether its lines are headings
+            features = [line_features(line, heading_levels) for line, _, _, _ in lines]
+            record["candidate_texts"] = sorted({line["clean_text"] for line in features if line is not None})
+            record["raw_headings"] = stages["heading_candidates"](
+                size_model, title_info, {"lines": lines, "text_frequency": text_frequency})
+        analysed = len(redo)
+        mark_stage("heading_candidates")
+
+        headings = stages["hierarchy"](size_model, [h for record in pages for h in record["raw_headings"]])
+        mark_stage("hierarchy")
+
+        # Consolidation never combines headings of different pages: redo the
+        # pages whose headings, spans or size model changed
+        headings_by_page = {}
+        for heading in headings:
+            headings_by_page.setdefault(heading["page"], []).append(heading)
+        outline = []
+        for page_index, record in enumerate(pages):
+            page_headings = headings_by_page.get(page_index)
+            if not page_headings:
+                record["consolidation"] = None
+                continue
+            signature = hashlib.sha256(json.dumps([size_signature, record["hash"]] + [
+                [h["level"], h["text"], h["y_position"], h["numbering"]] for h in page_headings
+            ]).encode("utf-8")).hexdigest()
+            if record["consolidation"] is None or record["consolidation"]["signature"] != signature:
+                elements = elements_of(page_index)
+                for t in elements:
+                    t["size_class"] = size_classes[t["size"]]
+                page_spans = {"elements": elements, "statistics_elements": elements,
+                              "metadata_title": metadata_title}
+                record["consolidation"] = {"signature": signature,
+                                           "outline": stages["consolidate"](page_spans, size_model, page_headings)}
+                consolidated += 1
+            outline.extend(record["consolidation"]["outline"])
+        mark_stage("consolidate")
+
+    result = stages["outline"]({"elements": [], "statistics_elements": [], "metadata_title": metadata_title},
+                               size_model, title_info, outline, {})
+    mark_stage("outline")
+    save_incremental_state(state_dir, {
+        "fingerprint": fingerprint,
+        "size_signature": size_signature,
+        "max_text_size": max_text_size,
+        "title": title_info,
+        "title_hashes": title_hashes,
+        "context": context,
+        "pages": pages,
+    }, span_store)
+    if work is not None:
+        work.update(pages=len(pages), read_pages=read, analysed_pages=analysed, consolidated_pages=consolidated)
+    return result
+
+def profile_memory(pdf_path, **options):
+    """
+    Run extract_outline on one PDF under a MemoryProfiler (tracemalloc snapshots
+    per stage plus a peak-RSS sampler); options are passed to extract_outline
+    Returns (result, memory report)
+    """
+    profiler = MemoryProfiler()
+    previous = use_stage_hook(profiler)
+    try:
+        profiler.start()
+        result = extract_outline(pdf_path, **options)
+    finally:
+        profiler.stop()
+        use_stage_hook(previous)
+    return result, profiler.report()
+
+# Font sizes that differ by at most this many points from the smallest size of
+# a class are treated as the same size (e.g. 7.2 and 7.4 in file05)
+SIZE_CLASS_TOLERANCE = 0.3
+
+def build_size_classes(sizes, tolerance=None):
+    """
+    Cluster the font sizes of one document (any iterable of sizes, or a Counter
+    of them) into size classes with one sorted sweep
+    Returns (size_classes, class_sizes): size_classes maps every distinct size to
+    a class number (numbers grow with size, so they compare like sizes) and
+    class_sizes[n] is the most frequent size of class n
+    """
+    if tolerance is None:
+        tolerance = SIZE_CLASS_TOLERANCE
+    size_counts = sizes if isinstance(sizes, Counter) else Counter(sizes)
+    size_classes = {}
+    class_sizes = []
+    class_start = None
+    best_count = 0
+    for size in sorted(size_counts):
+        if class_start is None or size - class_start > tolerance:
+            class_start = size
+            class_sizes.append(size)
+            best_count = 0
+        size_classes[size] = len(class_sizes) - 1
+        if size_counts[size] > best_count:
+            class_sizes[-1] = size
+            best_count = size_counts[size]
+    return size_classes, class_sizes
+
+# Width of the font-size buckets in the analysis report, in points
+ANALYSIS_SIZE_BUCKET = 0.5
+
+def size_bucket_key(size):
+    """
+    Return the analysis report key of the size bucket containing size, e.g. "7.0"
+    """
+    return f"{round(size / ANALYSIS_SIZE_BUCKET) * ANALYSIS_SIZE_BUCKET:.1f}"
+
+def build_text_analysis(text_elements, size_counts, title_details):
+    """
+    Build the complete text analysis report from the span store of one extraction
+    text_elements are the statistics elements, which size_counts, the size
+    histogram already built for the body-size statistics (spans longer than 3
+    characters), was counted from, so every distribution covers the same pages
+    (in a partial extraction, the pages read plus the sampled ones); the sizes
+    are folded into ANALYSIS_SIZE_BUCKET wide buckets so the report stays
+    compact however many distinct sizes a document has
+    """
+    size_distribution = Counter()
+    for size, count in size_counts.items():
+        size_distribution[size_bucket_key(size)] += count
+    font_distribution = Counter(t["font"] for t in text_elements)
+    color_distribution = Counter(str(t.get("color", 0)) for t in text_elements)
+
+    return {
+        "total_elements": len(text_elements),
+        "font_size_bucket": ANALYSIS_SIZE_BUCKET,
+        "font_size_distribution": dict(sorted(size_distribution.items(),
+                                              key=lambda item: float(item[0]), reverse=True)),
+        "font_family_distribution": dict(font_distribution.most_common()),
+        "color_distribution": dict(color_distribution.most_common()),
+        "title_detection": title_details,
+    }
+
+# Deepest heading level of the outline: 3 gives the H1-H3 outlines of the output
+# schema, up to MAX_OUTLINE_DEPTH (H6) those of the extended schema
+# (sample_dataset/schema/output_schema_extended.json). Size classes, numbering
+# depths and emphasis below it are not given levels of their own
+OUTLINE_DEPTH = 3
+MAX_OUTLINE_DEPTH = 6
+# Deepest level the context rules of assign_proper_hierarchy reach on their own
+CONTEXT_DEPTH = 3
+
+def parse_numbering(text):
+    """
+    Tokenize the section number a text starts with, once, so the level and the
+    consolidation checks can all be read off the result
+    Numbers ("2.", "2.1 ", "2.1.3 ") are numbering as before; a roman numeral or
+    letter ("IV.", "b)", "A.2 ") only when a terminator or number follows it and
+    then whitespace or the end of the text, so "e.g." or "U.S." are not numbering
+    Returns (segments, terminator, rest) or None: segments are the strings of
+    the section number, terminator is "." / ")" / "" and rest the text after it
+    """
+    match = SECTION_NUMBER_TOKEN_PATTERN.match(text)
+    if match is None:
+        return None
+    first, further, terminator = match.groups()
+    rest = text[match.end():]
+    if not first.isdigit() and not ((further or terminator) and (not rest or rest[0].isspace())):
+        return None
+    return ((first,) + tuple(further[1:].split(".")) if further else (first,)), terminator, rest
+
+def starts_with_section_number(numbering):
+    """
+    True if a parsed numbering marks its text as numbered: a number followed by a
+    dot or whitespace ("2.", "2.1", "2 "), or any roman or letter numbering
+    """
+    if numbering is None:
+        return False
+    segments, terminator, rest = numbering
+    if not segments[0].isdigit():
+        return True
+    return len(segments) > 1 or terminator == "." or (not terminator and rest[:1].isspace())
+
+def is_dotted_section_number(numbering):
+    """True if a parsed numbering has a dot after its first segment ("1.", "2.1", "A.")"""
+    return numbering is not None and (len(numbering[0]) > 1 or numbering[1] == ".")
+
+def is_bare_section_number(numbering):
+    """True if a parsed numbering is all of its text and a single number with a dot ("1.")"""
+    return (numbering is not None and len(numbering[0]) == 1 and numbering[0][0].isdigit() and
+            numbering[1] == "." and not numbering[2])
+
+def numbering_style(numbering):
+    """
+    Return the style of a parsed numbering's first segment: "arabic", "roman",
+    "ROMAN", "letter" or "LETTER"; a lone "I"/"i" is read as a roman one, other
+    single letters as letters
+    """
+    first = numbering[0][0]
+    if first.isdigit():
+        return "arabic"
+    if len(first) == 1 and first not in "Ii":
+        return "LETTER" if first.isupper() else "letter"
+    return "ROMAN" if first.isupper() else "roman"
+
+def numbering_value(numbering):
+    """
+    Return the position in its sequence of a parsed numbering that is a single
+    letter or roman numeral ("C." is 3, "iv)" 4), or None for any other
+    numbering and for malformed roman numerals
+    """
+    segments = numbering[0]
+    if len(segments) > 1 or segments[0].isdigit():
+        return None
+    first = segments[0].upper()
+    if numbering_style(numbering) in ("letter", "LETTER"):
+        return ord(first) - ord("A") + 1
+    if not ROMAN_NUMERAL_PATTERN.fullmatch(first):
+        return None
+    values = [ROMAN_DIGITS[digit] for digit in first]
+    return sum(-value if value < next_value else value
+               for value, next_value in zip(values, values[1:] + [0]))
+
+def confirm_numbering_context(headings):
+    """
+    Drop the numbering of headings numbered by a single letter or roman numeral
+    ("A.", "IV.", "b)") that have no numbering context, so "CD. Player",
+    "MD. Smith" or "A. Smith" are read as unnumbered headings. Such a numbering
+    is kept when a heading of the same style one step before or after it is
+    among the headings ("A." and "B."), or when it starts its sequence ("A.",
+    "I.", "a)") after a numbered heading
+    Returns headings
+    """
+    values = {}
+    for heading in headings:
+        if heading.get("has_numbering", False) and heading["numbering"] is not None:
+            value = numbering_value(heading["numbering"])
+            if value is not None:
+                values.setdefault(numbering_style(heading["numbering"]), set()).add(value)
+    numbered_before = False
+    for heading in headings:
+        if not heading.get("has_numbering", False):
+            continue
+        numbering = heading["numbering"]
+        if numbering is not None and not numbering[0][0].isdigit() and len(numbering[0]) == 1:
+            value = numbering_value(numbering)
+            siblings = values.get(numbering_style(numbering), ())
+            if value is None or not (value - 1 in siblings or value + 1 in siblings or
+                                     (value == 1 and numbered_before)):
+                heading["has_numbering"] = False
+                heading["numbering"] = None
+                continue
+        numbered_before = True
+    return headings
+
+def numbering_depth(numbering):
+    """
+    Return the depth (number of segments) of a parsed numbering when it is
+    followed by whitespace and terminated as a heading number: "1. ", "2.1 ",
+    "2.1.1 " (a dot after a multi-part number, as in "2.1. ", gives no depth);
+    roman and letter numberings may end in "." or ")" at any depth
+    Returns the depth or None
+    """
+    if numbering is None:
+        return None
+    segments, terminator, rest = numbering
+    if not rest[:1].isspace():
+        return None
+    if segments[0].isdigit() and terminator != ("." if len(segments) == 1 else ""):
+        return None
+    return len(segments)
+
+def depth_level(depth):
+    """Return the level name of a heading depth ("H1"...), or None beyond OUTLINE_DEPTH"""
+    return f"H{depth}" if depth and depth <= OUTLINE_DEPTH else None
+
+def is_deep_section_number(text):
+    """
+    True if text starts with a section number deeper than CONTEXT_DEPTH that still
+    maps to a level ("1.1.1.1 Register map" with OUTLINE_DEPTH 4 or more), which
+    contains_url would otherwise take for an IP address
+    """
+    depth = numbering_depth(parse_numbering(text.strip()))
+    return bool(depth) and CONTEXT_DEPTH < depth <= OUTLINE_DEPTH
+
+def get_numbering_level(text):
+    """Determine heading level based on numbering pattern"""
+    return depth_level(numbering_depth(parse_numbering(text.strip())))
+
+def reconstruct_title_from_fragments(fragments):
+    """Merge title fragments in order, dropping the text consecutive fragments share"""
+    if not fragments:
+        return ""
+    
+    # Start with the first fragment
+    result = fragments[0]
+    
+    for fragment in fragments[1:]:
+        merged = False
+        
+        # Try different overlap lengths (prioritize longer overlaps)
+        min_len = min(len(result), len(fragment))
+        for overlap_len in range(min(min_len, 15), 0, -1):  # Increased max overlap check
+            # Check if end of result matches beginning of fragment
+            if (overlap_len > 0 and 
+                result[-overlap_len:].lower().strip() == fragment[:overlap_len].lower().strip()):
+                # Found overlap, merge by removing the duplicate part
+                result = result + fragment[overlap_len:]
+                merged = True
+                break
+        
+        if not merged:
+            # Check if fragment is a substring of result (skip if so)
+            if fragment.lower().strip() in result.lower().strip():
+                continue
+            # Check if result is a substring of fragment (replace if so)
+            elif result.lower().strip() in fragment.lower().strip():
+                result = fragment
+                continue
+            # Check if they share common words that can be merged
+            else:
+                result_words = result.lower().split()
+                fragment_words = fragment.lower().split()
+                
+                # Look for word-level overlap
+                word_merged = False
+                for i in range(1, min(len(result_words), len(fragment_words)) + 1):
+                    if result_words[-i:] == fragment_words[:i]:
+                        # Found word overlap
+                        result_part = ' '.join(result.split()[:-i]) if i < len(result_words) else ""
+                        fragment_part = fragment
+                        result = (result_part + " " + fragment_part).strip()
+                        word_merged = True
+                        break
+                
+                if not word_merged:
+                    # No overlap found, concatenate with space
+                    result = result + " " + fragment
+    
+    return result
+
+def assign_proper_hierarchy(headings, body_text_size):
+    """
+    Assign proper levels (H1 to H<OUTLINE_DEPTH>) ensuring correct hierarchy, in
+    one pass over the headings in reading order: numbered headings take the level
+    of their parsed numbering (when it has one), the others a level from their
+    context
+    Arabic numbers keep their plain depth ("1." is H1, "1.1" H2); a roman or
+    letter numbering nests below the numbered heading it appears under, and a
+    style seen again closes the sections opened inside it, so "I.", "A.", "B.",
+    "II." are H1, H2, H2, H1 and a stray "a)" line before "1." changes nothing;
+    a single letter or roman numeral only counts as numbering in a numbering
+    context (see confirm_numbering_context)
+    With OUTLINE_DEPTH above CONTEXT_DEPTH arabic numbers nest the same way, so
+    in a document numbered "I.", "A.", "1." a "1.1" is four levels deep
+    With OUTLINE_DEPTH above CONTEXT_DEPTH, an unnumbered heading that context
+    puts at H3 is placed by its emphasis (size class, then boldness) against the
+    heading before it: less emphasised nests one level below it, equally
+    emphasised is its sibling
+    A heading is bold when its whole line is ("bold", see find_raw_headings);
+    a large bold one only opens a new H1 when it is as emphasised as the heading
+    that opened the current one
+    """
+    if not headings:
+        return headings
+    confirm_numbering_context(headings)
+    
+    current_level = None
+    # Numbered sections the current heading is in, outermost first: [style,
+    # offset of the style's depths, level depth of its last heading]
+    open_styles = []
+    arabic_anchored = OUTLINE_DEPTH <= CONTEXT_DEPTH
+    previous_depth = None
+    previous_emphasis = None
+    section_emphasis = None
+    
+    for heading in headings:
+        emphasis = (heading.get("size_class", 0), heading.get("bold", False))
+        is_bold = heading.get("bold", False)
+        size = heading.get("size", 0)
+        
+        # Numbered headings: the numbering overrides the font-size level
+        if heading.get("has_numbering", False):
+            depth = numbering_depth(heading["numbering"])
+            if depth:
+                style = numbering_style(heading["numbering"])
+                index = next((i for i, section in enumerate(open_styles) if section[0] == style), None)
+                if index is not None:
+                    offset = open_styles[index][1]
+                    del open_styles[index:]
+                elif style == "arabic" and arabic_anchored:
+                    offset = 0
+                else:
+                    offset = open_styles[-1][2] if open_styles else 0
+                open_styles.append([style, offset, offset + depth])
+                level = depth_level(offset + depth)
+                if level:
+                    heading["level"] = level
+            current_level = heading["level"]
+            previous_depth, previous_emphasis = int(heading["level"][1:]), emphasis
+            if current_level == "H1":
+                section_emphasis = emphasis
+            continue
         
-        # Financial terms
-        'income', 'salary', 'wage', 'bonus', 'commission', 'deduction',
-        'withholding', 'benefits', 'insurance', 'retirement', 'savings',
+        text_lower = heading["text"].lower().strip()
+        
+        # Determine appropriate level
+        # (main section keywords such as "introduction" or "references" -> H1)
+        is_main_section = RULES["main_section_keywords"](text_lower)
+        
+        if is_main_section or (is_bold and size >= body_text_size * 1.1 and
+                               emphasis == section_emphasis):
+            # Main sections and large bold text -> H1
+            heading["level"] = "H1"
+            current_level = "H1"
+        elif current_level == "H1" and (is_bold and size >= body_text_size * 0.9):
+            # Following H1, bold text of reasonable size -> H2
+            heading["level"] = "H2"
+            current_level = "H2"
+        elif current_level == "H2" and (is_bold or size >= body_text_size * 0.8):
+            # Following H2, bold or reasonable size -> H3
+            heading["level"] = "H3"
+        elif current_level is None:
+            # First heading should be H1 if no context
+            heading["level"] = "H1"
+            current_level = "H1"
+        else:
+            # Default based on current context
+            if current_level == "H1":
+                heading["level"] = "H2"
+                current_level = "H2"
+            elif current_level == "H2":
+                heading["level"] = "H3"
+            else:
+                heading["level"] = "H3"
         
-        # Legal terms
-        'lawyer', 'judge', 'court',
-        'case', 'claim', 'settlement', 'contract',
-    }
-    
-    # Check if it's a single word and in our exclusion list
-    if ' ' not in clean_text and clean_text in form_fields_and_generic_terms:
-        return True
+        depth = int(heading["level"][1:])
+        if depth == CONTEXT_DEPTH < OUTLINE_DEPTH and previous_depth and previous_depth >= CONTEXT_DEPTH:
+            if emphasis < previous_emphasis:
+                depth = min(previous_depth + 1, OUTLINE_DEPTH)
+            elif emphasis == previous_emphasis:
+                depth = previous_depth
+        depth = min(depth, OUTLINE_DEPTH)
+        heading["level"] = f"H{depth}"
+        previous_depth, previous_emphasis = depth, emphasis
+        if depth == 1:
+            section_emphasis = emphasis
+    
+    return headings
+
+def has_text_between_headings(heading1, heading2, all_text_elements, heading_levels):
+    """Check if there's body text between two headings"""
+    if heading1["page"] != heading2["page"]:
+        return True  # Different pages, assume there's content between
     
-    # Also exclude very short single words (1-2 characters) that are likely labels
-    if len(clean_text) <= 2 and ' ' not in clean_text:
-        return True
+    # Get y-positions
+    y1 = heading1["y_position"]
+    y2 = heading2["y_position"]
     
-    # Exclude words that are just numbers or simple patterns
-    if re.match(r'^[0-9]+$', clean_text):  # Just numbers
-        return True
+    # Ensure y1 is the upper heading (smaller y value)
+    if y1 > y2:
+        y1, y2 = y2, y1
     
-    if re.match(r'^[a-z]$', clean_text):  # Single letters
-        return True
+    # Check for text elements between these y positions on the same page
+    for element in all_text_elements:
+        if (element["page"] == heading1["page"] and 
+            y1 < element["y_position"] < y2 and
+            element["size_class"] not in heading_levels and  # Not a heading
+            len(element["text"].strip()) > 3):  # Meaningful text
+            return True
     
     return False
 
-def extract_outline(pdf_path):
-    doc = fitz.open(pdf_path)
-    text_elements = []
+def count_sizes(elements):
+    """
+    Count the font sizes of elements: of all of them, and of those with more than
+    3 characters (the body and heading size statistics)
+    Returns (size counts, text size counts), both in order of first occurrence
+    """
+    size_counts = Counter(t["size"] for t in elements)
+    text_size_counts = Counter(t["size"] for t in elements if len(t["text"]) > 3)
+    return size_counts, text_size_counts
 
-    # --- 1. Collect text with font sizes and position information ---
-    for page_num, page in enumerate(doc, start=1):
-        page_height = page.rect.height
-        page_width = page.rect.width
-        blocks = page.get_text("dict")["blocks"]
-        for b in blocks:
-            if "lines" in b:
-                for l in b["lines"]:
-                    for s in l["spans"]:
-                        # Apply Unicode normalization to the text
-                        raw_text = s["text"].strip()
-                        normalized_text = normalize_unicode_characters(raw_text)
-                        # Calculate relative position on page (0.0 = top, 1.0 = bottom)
-                        y_position = s["bbox"][1]  # Top Y coordinate of the text
-                        relative_y = y_position / page_height
-                        # Calculate horizontal position (0.0 = left, 1.0 = right)
-                        x_position = s["bbox"][0]  # Left X coordinate of the text
-                        relative_x = x_position / page_width
-                        
-                        text_elements.append({
-                            "text": normalized_text,
-                            "size": round(s["size"], 1),
-                            "flags": s["flags"],
-                            "is_bold": bool(s["flags"] & 16),  # Flag 16 = bold
-                            "is_italic": bool(s["flags"] & 2),  # Flag 2 = italic
-                            "font": s.get("font", ""),
-                            "page": page_num - 1,  # Subtract 1 from page number as requested
-                            "y_position": y_position,
-                            "relative_y": relative_y,
-                            "x_position": x_position,
-                            "relative_x": relative_x
-                        })
-
-    # --- 2. Determine title & heading levels ---
-    sizes = [t["size"] for t in text_elements if len(t["text"]) > 3]
-    most_common = Counter(sizes).most_common()
-    body_text_size = most_common[0][0]  # most frequent = normal text size
-
-    # Sort unique sizes (largest first)
-    unique_sizes = sorted(set(sizes), reverse=True)
+def build_size_model(spans):
+    """
+    Statistics stage: cluster the font sizes of the statistics elements into size
+    classes and pick the body, title and heading size classes
+    Returns the size model, or None when the document has no usable text
+    """
+    return size_model_from_counts(*count_sizes(spans["statistics_elements"]))
+
+def size_model_from_counts(size_counts, text_size_counts):
+    """
+    Build the size model of build_size_model from the size counts of count_sizes
+    (which may be summed page by page, in page order)
+    Returns the size model, or None when there is no usable text
+    """
+    # Cluster near-identical font sizes once; every later size comparison uses
+    # the integer "size_class" of an element instead of its float size
+    size_classes, class_sizes = build_size_classes(size_counts)
+    class_counts = Counter()
+    for size, count in text_size_counts.items():
+        class_counts[size_classes[size]] += count
+    most_common = class_counts.most_common()
+    if not most_common:
+        # No usable text at all (blank or scanned document without OCR)
+        return None
+    body_text_class = most_common[0][0]  # most frequent = normal text size
+    body_text_size = class_sizes[body_text_class]
+
+    # Sort unique size classes (largest first)
+    unique_classes = sorted(class_counts, reverse=True)
     heading_levels = {}
-    level_names = ["H1", "H2", "H3"]
 
     # Only assign heading levels to sizes that are SIGNIFICANTLY larger than body text
     # and skip the largest size (which is likely the title)
-    title_size = unique_sizes[0] if unique_sizes else body_text_size
+    title_class = unique_classes[0] if unique_classes else body_text_class
+    title_size = class_sizes[title_class]
     
-    heading_candidate_sizes = [sz for sz in unique_sizes[1:] if sz > body_text_size]
+    heading_candidate_classes = [sc for sc in unique_classes[1:] if sc > body_text_class]
     
-    # Initial font-size based level assignment
-    for i, sz in enumerate(heading_candidate_sizes[:3]):
-        heading_levels[sz] = level_names[i]
+    # Initial font-size based level assignment (keyed by size class), one level
+    # per size class down to OUTLINE_DEPTH
+    for i, sc in enumerate(heading_candidate_classes[:OUTLINE_DEPTH]):
+        heading_levels[sc] = f"H{i + 1}"
+    return {
+        "size_classes": size_classes,
+        "class_sizes": class_sizes,
+        "size_histogram": text_size_counts,
+        "body_text_size": body_text_size,
+        "title_class": title_class,
+        "title_size": title_size,
+        "heading_levels": heading_levels,
+    }
+
+def apply_size_classes(spans, size_model):
+    """
+    Store the size class of every statistics element under its "size_class" key
+    The element dicts are updated in place (see OutlinePipeline.run)
+    """
+    size_classes = size_model["size_classes"]
+    for t in spans["statistics_elements"]:
+        t["size_class"] = size_classes[t["size"]]
 
+def detect_title(spans, size_model):
+    """
+    Title stage: build the title from the largest text of the first pages, or
+    from decorative title text when that gives nothing usable
+    Returns the title with its components and the position of its topmost part
+    """
+    if size_model is None:
+        return None
+    text_elements = spans["elements"]
+    title_class = size_model["title_class"]
     title = ""
-    outline = []
     title_components = []  # Store all components that make up the title
+    cleaned_components = []
     
     # First pass: collect potential title components (largest size text on first few pages)
     for t in text_elements:
@@ -892,13 +2141,13 @@ def extract_outline(pdf_path):
             continue
             
         # Clean text by removing numbering/bullets (including Unicode dashes)
-        clean_text = re.sub(r"^[0-9.\-\u2013\u2014\)\(]+\s*", "", text).strip()
+        clean_text = TITLE_NUMBERING_PREFIX_PATTERN.sub("", text).strip()
         
         # Consider text as title component if:
         # 1. It's the largest font size (title_size)
         # 2. It's on the first 2 pages (to catch multi-page titles)
         # 3. Has reasonable length (not too short or too long)
-        if (t["size"] == title_size and 
+        if (t["size_class"] == title_class and 
             t["page"] <= 2 and 
             2 <= len(clean_text) <= 50 and  # Reasonable length bounds
             clean_text):
@@ -907,64 +2156,12 @@ def extract_outline(pdf_path):
     # Construct title from components
     if title_components:
         # Method to reconstruct title by merging overlapping text fragments
-        def reconstruct_title_from_fragments(fragments):
-            if not fragments:
-                return ""
-            
-            # Start with the first fragment
-            result = fragments[0]
-            
-            for fragment in fragments[1:]:
-                merged = False
-                
-                # Try different overlap lengths (prioritize longer overlaps)
-                min_len = min(len(result), len(fragment))
-                for overlap_len in range(min(min_len, 15), 0, -1):  # Increased max overlap check
-                    # Check if end of result matches beginning of fragment
-                    if (overlap_len > 0 and 
-                        result[-overlap_len:].lower().strip() == fragment[:overlap_len].lower().strip()):
-                        # Found overlap, merge by removing the duplicate part
-                        result = result + fragment[overlap_len:]
-                        merged = True
-                        break
-                
-                if not merged:
-                    # Check if fragment is a substring of result (skip if so)
-                    if fragment.lower().strip() in result.lower().strip():
-                        continue
-                    # Check if result is a substring of fragment (replace if so)
-                    elif result.lower().strip() in fragment.lower().strip():
-                        result = fragment
-                        continue
-                    # Check if they share common words that can be merged
-                    else:
-                        result_words = result.lower().split()
-                        fragment_words = fragment.lower().split()
-                        
-                        # Look for word-level overlap
-                        word_merged = False
-                        for i in range(1, min(len(result_words), len(fragment_words)) + 1):
-                            if result_words[-i:] == fragment_words[:i]:
-                                # Found word overlap
-                                result_part = ' '.join(result.split()[:-i]) if i < len(result_words) else ""
-                                fragment_part = fragment
-                                result = (result_part + " " + fragment_part).strip()
-                                word_merged = True
-                                break
-                        
-                        if not word_merged:
-                            # No overlap found, concatenate with space
-                            result = result + " " + fragment
-            
-            return result
-        
         # Clean each component first and remove obvious duplicates, but be less aggressive
         seen_components = set()
-        cleaned_components = []
         for comp in title_components:
             # Remove obvious artifacts and normalize
-            cleaned = re.sub(r'([a-zA-Z])\1{2,}', r'\1', comp)  # Remove repeated letters
-            cleaned = re.sub(r'\s+', ' ', cleaned).strip()  # Normalize whitespace
+            cleaned = REPEATED_LETTERS_PATTERN.sub(r'\1', comp)  # Remove repeated letters
+            cleaned = WHITESPACE_RUN_PATTERN.sub(' ', cleaned).strip()  # Normalize whitespace
             
             # Skip if too short, but don't be too aggressive with substring filtering
             if len(cleaned) > 1 and cleaned.lower() not in seen_components:
@@ -975,8 +2172,8 @@ def extract_outline(pdf_path):
         title = reconstruct_title_from_fragments(cleaned_components)
         
         # Final cleanup
-        title = re.sub(r'\s+', ' ', title).strip()  # Normalize whitespace
-        title = re.sub(r'([a-zA-Z])\1{2,}', r'\1', title)  # Remove any remaining repeated letters
+        title = WHITESPACE_RUN_PATTERN.sub(' ', title).strip()  # Normalize whitespace
+        title = REPEATED_LETTERS_PATTERN.sub(r'\1', title)  # Remove any remaining repeated letters
     
     # DECORATIVE TITLE RECONSTRUCTION for file05-style documents
     # If normal title construction didn't work well, try reconstructing from decorative elements
@@ -986,9 +2183,11 @@ def extract_outline(pdf_path):
         
         # Collect text elements that could be decorative title parts
         # Focus on medium-large sizes (not the absolute largest which might be decorative symbols)
-        all_sizes = [t["size"] for t in text_elements if len(t["text"]) > 0]
-        if all_sizes:
-            max_size = max(all_sizes)
+        # (the largest size of the whole document: spans holding only the title
+        # pages carry it, partial extractions have it in their statistics sample)
+        max_size = spans.get("max_text_size") or max(
+            (t["size"] for t in spans["statistics_elements"] if len(t["text"]) > 0), default=None)
+        if max_size is not None:
             # Focus on text that's 70% or more of the max size, but exclude pure decorative symbols
             min_title_size = max_size * 0.7
             
@@ -999,7 +2198,7 @@ def extract_outline(pdf_path):
                     len(text) >= 1 and  # Accept single characters
                     not contains_urls(text) and  # Exclude URLs from title
                     not contains_date(text) and  # Exclude dates
-                    not re.match(r'^[-_=]+$', text)):  # Exclude pure decorative lines like "---"
+                    not DECORATIVE_RULE_PATTERN.match(text)):  # Exclude pure decorative lines like "---"
                     decorative_title_elements.append({
                         "text": text,
                         "size": t["size"],
@@ -1050,7 +2249,7 @@ def extract_outline(pdf_path):
                     
                     # Skip decorative symbols and pure punctuation
                     if (text and 
-                        not re.match(r'^[-_=!@#$%^&*()]+$', text) and  # Skip pure symbols
+                        not PURE_SYMBOLS_PATTERN.match(text) and  # Skip pure symbols
                         not contains_urls(text)):
                         
                         # Check if this is a single character that might be part of a fragmented word
@@ -1100,7 +2299,7 @@ def extract_outline(pdf_path):
                 decorative_title = title_parts[0]
                 
                 # Clean up the decorative title
-                decorative_title = re.sub(r'\s+', ' ', decorative_title).strip()
+                decorative_title = WHITESPACE_RUN_PATTERN.sub(' ', decorative_title).strip()
                 
                 # If the decorative title looks reasonable, use it
                 if (len(decorative_title) >= 3 and 
@@ -1115,39 +2314,86 @@ def extract_outline(pdf_path):
     
     # Find the earliest (topmost) title component position
     for t in text_elements:
-        if t["size"] == title_size and t["page"] <= 2:
-            clean_text = re.sub(r"^[0-9.\-\u2013\u2014\)\(©®™]+\s*", "", t["text"]).strip()
+        if t["size_class"] == title_class and t["page"] <= 2:
+            clean_text = NUMBERING_PREFIX_PATTERN.sub("", t["text"]).strip()
             if clean_text and any(comp.lower() in clean_text.lower() for comp in cleaned_components):
                 if title_y_position is None or t["y_position"] < title_y_position:
                     title_y_position = t["y_position"]
                     title_page = t["page"]
-    
-    # Second pass: build outline excluding title components and consolidating split headings
-    potential_headings = []
-    
-    # First, collect ALL text in the document and count frequency (including body text)
-    all_text_frequency = Counter()
-    
-    for t in text_elements:
+    return {
+        "title": title,
+        "components": title_components,
+        "cleaned_components": cleaned_components,
+        "page": title_page,
+        "y_position": title_y_position,
+    }
+
+def count_text_frequency(elements):
+    """
+    Count how often every text occurs among elements, cleaned of numbering,
+    bullets and copyright symbols (all text, not just potential headings)
+    Returns a Counter of the cleaned texts
+    """
+    text_frequency = Counter()
+    for t in elements:
         text = t["text"]
         if not text or len(text) < 2:
             continue
-
-        # Clean text by removing numbering/bullets AND copyright symbols (including Unicode dashes)
-        clean_text = re.sub(r"^[0-9.\-\u2013\u2014\)\(©®™]+\s*", "", text).strip()
-        
-        # Count frequency of ALL text in the document (not just potential headings)
+        clean_text = NUMBERING_PREFIX_PATTERN.sub("", text).strip()
         if clean_text:
-            all_text_frequency[clean_text] += 1
+            text_frequency[clean_text] += 1
+    return text_frequency
+
+def find_candidate_lines(spans, size_model, title_info, options):
+    """
+    Line stage: group the spans into visual lines and keep the lines that may be
+    headings: not corpus boilerplate (options["corpus_model"]), not above the
+    title, not on the right of the page; decorative lines are rebuilt from the
+    characters and words around them
+    Returns the candidate lines as (line elements, page, y, x) plus the text
+    frequencies of the whole document
+    """
+    if size_model is None:
+        return None
+    text_elements = spans["elements"]
+    statistics_elements = spans["statistics_elements"]
+    heading_levels = size_model["heading_levels"]
+    class_sizes = size_model["class_sizes"]
+    title_page = title_info["page"]
+    title_y_position = title_info["y_position"]
+    corpus_model = options.get("corpus_model")
+    corpus_keys = options.get("corpus_keys")
+
+    # First, collect ALL text in the document and count frequency (including body text)
+    all_text_frequency = count_text_frequency(statistics_elements)
     
     # Now use line-based heading detection
     # Group text elements by lines
     line_groups = group_text_by_lines(text_elements)
-    
-    # Filter line groups to find valid heading lines
-    valid_heading_lines = []
-    
-    for line_group in line_groups:
+
+    # Corpus keys of the lines with a heading-sized element, and the pages each
+    # key is found on (a running header repeats on several)
+    line_keys = {}
+    key_pages = {}
+    if corpus_model is not None:
+        for index, line_group in enumerate(line_groups):
+            if any(e["size_class"] in heading_levels for e in line_group):
+                first = line_group[0]
+                line_key = line_keys[index] = corpus_line_key(
+                    NUMBERING_PREFIX_PATTERN.sub("", " ".join(e["text"] for e in line_group)).strip(),
+                    first["relative_y"], class_sizes[max(e["size_class"] for e in line_group)])
+                key_pages.setdefault(line_key, set()).add(first["page"])
+        if corpus_keys is not None:
+            corpus_keys.update(line_keys.values())
+
+    candidate_lines = []
+    for index, line_group in enumerate(line_groups):
+        # Corpus prefilter: running headers, footers and form labels repeated
+        # across the corpus are dropped before any of the heading checks
+        line_key = line_keys.get(index)
+        if line_key is not None and corpus_model.is_boilerplate(line_key, len(key_pages[line_key]) > 1):
+            continue
+
         # Check position-based filters for the line
         line_page = line_group[0]["page"] if line_group else 0
         line_y_position = min(elem.get("y_position", 0) for elem in line_group)
@@ -1194,18 +2440,10 @@ def extract_outline(pdf_path):
             # 2. URLs like "WWW.TOPJUMP.COM"
             # 3. Stylized text patterns
             has_single_chars = any(len(elem["text"].strip()) == 1 for elem in line_group)
-            has_url_decorative = any(
-                pattern in line_text.upper() for pattern in 
-                ['WWW.', 'HTTP', '.COM', '.NET', '.ORG', 'TOPJUMP']
-            )
+            has_url_decorative = RULES["decorative_url_markers"](line_text.upper())
             
             # Don't apply to well-structured documents (PDF01, PDF02)
-            is_structured_doc = any(
-                word in line_text.lower() for word in 
-                ['foundation', 'extension', 'agile', 'tester', 'syllabus', 'overview',
-                 'acknowledgements', 'references', 'revision', 'history', 'business',
-                 'application', 'form', 'grant', 'advance', 'ltc']
-            )
+            is_structured_doc = RULES["structured_document_keywords"](line_text.lower())
             
             # Enable enhancement for file05-style decorative content
             should_enhance = (has_single_chars or has_url_decorative) and not is_structured_doc
@@ -1276,157 +2514,140 @@ def extract_outline(pdf_path):
             
             # Use the enhanced line group
             line_group = enhanced_line_group
-        
-        # Check if this entire line can be considered a valid heading
-        if is_valid_heading_line(line_group, heading_levels, all_text_frequency, title_components):
-            # Combine all text elements in the line to form the complete heading
-            line_text_parts = []
+
+        candidate_lines.append((line_group, line_page, line_y_position, line_x_position))
+    return {"lines": candidate_lines, "text_frequency": all_text_frequency}
+
+# Learned classifier deciding the clear-cut candidate lines before the rule
+# chain (see use_heading_classifier); None runs the rule chain on every line
+HEADING_CLASSIFIER = None
+
+def use_heading_classifier(heading_classifier):
+    """
+    Make heading_classifier (a heading_classifier.HeadingClassifier, or None) the
+    classifier the heading stage consults before is_valid_heading_line
+    Returns the previously active classifier
+    """
+    global HEADING_CLASSIFIER
+    previous = HEADING_CLASSIFIER
+    HEADING_CLASSIFIER = heading_classifier
+    return previous
+
+def heading_line_vector(line, line_elements, size_model, all_text_frequency):
+    """
+    Return the feature vector (heading_classifier.FEATURES) of a heading-sized
+    candidate line from its feature record and elements
+    """
+    text = line["text"]
+    letters = sum(1 for c in text if c.isalpha())
+    return [
+        size_model["class_sizes"][line["heading_size_class"]] / size_model["body_text_size"],
+        line["heading_elements"] / line["elements"],
+        line["bold_fraction"],
+        min(element.get("relative_x", 0) for element in line_elements),
+        min(element.get("relative_y", 0) for element in line_elements),
+        math.log1p(line["clean_word_count"]),
+        1.0 if starts_with_section_number(parse_numbering(line["parts"][0])) else 0.0,
+        1.0 if text.endswith((':', '.', ';', '!', '?', ',')) else 0.0,
+        1.0 if text[0].islower() else 0.0,
+        sum(1 for c in text if c.isupper()) / letters if letters else 0.0,
+        sum(1 for c in text if c.isdigit()) / len(text),
+        math.log1p(all_text_frequency.get(line["clean_text"], 0)),
+    ]
+
+def is_classifiable_line(line, title_components):
+    """
+    Return True if a candidate line may be a heading at all, so it is worth
+    scoring: heading-sized, at least 3 characters, not only numbering or
+    symbols and not part of the title (the rule chain rejects all others)
+    """
+    return (line is not None and len(line["text"]) >= 3 and bool(line["clean_text"]) and
+            line["clean_text"] not in title_components)
+
+def find_raw_headings(size_model, title_info, candidate_lines):
+    """
+    Heading stage: keep the candidate lines that pass is_valid_heading_line and
+    turn each into a heading with its font-size level
+    With a heading classifier active, the lines it is confident about are
+    decided by it and only the others by the rule chain (see
+    heading_classifier.calibrate for thresholds that never overrule it)
+    Returns the raw headings in line order
+    """
+    if size_model is None:
+        return []
+    heading_levels = size_model["heading_levels"]
+    class_sizes = size_model["class_sizes"]
+    all_text_frequency = candidate_lines["text_frequency"]
+    title_components = title_info["components"]
+    # Derive every line's text and counts once for all the checks below
+    lines = [(line_group, line_page, line_y_position, line_x_position, line_features(line_group, heading_levels))
+             for line_group, line_page, line_y_position, line_x_position in candidate_lines["lines"]]
+    decisions = {}
+    classifier = HEADING_CLASSIFIER
+    if classifier is not None:
+        scored = [index for index, (_, _, _, _, line) in enumerate(lines) if is_classifiable_line(line, title_components)]
+        vectors = [heading_line_vector(lines[index][4], lines[index][0], size_model, all_text_frequency)
+                   for index in scored]
+        decisions = dict(zip(scored, classifier.decide(vectors)))
+    potential_headings = []
+    for index, (line_group, line_page, line_y_position, line_x_position, line) in enumerate(lines):
+        decision = decisions.get(index)
+        if decision is None:
+            # Check if this entire line can be considered a valid heading
+            decision = line is not None and is_valid_heading_line(line, all_text_frequency, title_components)
+        if decision:
+            # Check if any element has numbering
             has_numbering = False
-            heading_size = None
-            
-            for element in line_group:
-                text = element["text"].strip()
-                if text:
-                    line_text_parts.append(text)
-                    
-                    # Check if any element has numbering
-                    if re.match(r"^[0-9]+(\.[0-9]+)*[\.\s]", text):
-                        has_numbering = True
-                    
-                    # Get the heading size (use the largest size in the line)
-                    if element["size"] in heading_levels:
-                        if heading_size is None or element["size"] > heading_size:
-                            heading_size = element["size"]
+            for text in line["parts"]:
+                numbered_text, numbering = text, parse_numbering(text)
+                has_numbering = starts_with_section_number(numbering)
+                if has_numbering:
+                    break
             
-            if line_text_parts and heading_size is not None:
-                complete_line_text = " ".join(line_text_parts)
-                
-                # Clean the complete text
-                clean_line_text = re.sub(r"^[0-9.\-\u2013\u2014\)\(©®™]+\s*", "", complete_line_text).strip()
-                
-                potential_headings.append({
-                    "level": heading_levels[heading_size],
-                    "text": complete_line_text.strip() if has_numbering else clean_line_text,
-                    "page": line_page,
-                    "size": heading_size,
-                    "original_text": complete_line_text.strip(),
-                    "has_numbering": has_numbering,
-                    "y_position": line_y_position,
-                    "x_position": line_x_position
-                })
-    
-    # Reassign heading levels based on numbering hierarchy (overrides font-size levels)
-    def get_numbering_level(text):
-        """Determine heading level based on numbering pattern"""
-        text = text.strip()
-        
-        # Match patterns like "1.", "2.", "3.", "4." (main sections)
-        if re.match(r"^[0-9]+\.\s", text):
-            return "H1"
-        
-        # Match patterns like "2.1", "2.2", "3.1", "4.2" (subsections)
-        if re.match(r"^[0-9]+\.[0-9]+\s", text):
-            return "H2"
-        
-        # Match patterns like "2.1.1", "3.2.1" (sub-subsections)
-        if re.match(r"^[0-9]+\.[0-9]+\.[0-9]+\s", text):
-            return "H3"
-        
-        return None
-    
-    # Apply numbering-based levels to numbered headings
-    for heading in potential_headings:
-        if heading["has_numbering"]:
-            numbering_level = get_numbering_level(heading["text"])
-            if numbering_level:
-                heading["level"] = numbering_level
-    
+            # The heading size is the largest heading size class in the line
+            heading_size = line["heading_size_class"]
+            complete_line_text = line["text"]
+            heading_text = complete_line_text if has_numbering else line["clean_text"]
+            potential_headings.append({
+                "level": heading_levels[heading_size],
+                "text": heading_text,
+                "page": line_page,
+                "size": class_sizes[heading_size],
+                "size_class": heading_size,
+                "original_text": complete_line_text,
+                "has_numbering": has_numbering,
+                "numbering": numbering if heading_text == numbered_text else parse_numbering(heading_text),
+                "bold": line["bold_fraction"] == 1.0,
+                "y_position": line_y_position,
+                "x_position": line_x_position
+            })
+    return potential_headings
+
+def assign_heading_levels(size_model, raw_headings):
+    """
+    Hierarchy stage: give numbered headings the level of their numbering and the
+    others a level that fits the headings around them
+    Returns new heading dicts sorted by page and position
+    """
+    if size_model is None:
+        return []
+    potential_headings = [dict(heading) for heading in raw_headings]
     # Sort headings by page and position for proper hierarchy assignment
     potential_headings.sort(key=lambda h: (h["page"], h.get("y_position", 0)))
-    
-    # Assign proper hierarchical levels for non-numbered headings
-    def assign_proper_hierarchy(headings):
-        """Assign proper H1/H2/H3 levels ensuring correct hierarchy"""
-        if not headings:
-            return headings
-        
-        # Main section keywords that should be H1
-        main_section_keywords = [
-            'introduction', 'conclusion', 'summary', 'overview', 'background',
-            'methodology', 'results', 'discussion', 'recommendations', 'appendix',
-            'references', 'bibliography', 'acknowledgements', 'abstract',
-            'table of contents', 'contents', 'syllabus', 'revision history'
-        ]
-        
-        current_level = None
-        
-        for heading in headings:
-            text_lower = heading["text"].lower().strip()
-            is_bold = heading.get("is_bold", False)
-            size = heading.get("size", 0)
-            
-            # Skip numbered headings (they already have correct levels)
-            if heading.get("has_numbering", False):
-                current_level = heading["level"]
-                continue
-            
-            # Determine appropriate level
-            is_main_section = any(keyword in text_lower for keyword in main_section_keywords)
-            
-            if is_main_section or (is_bold and size >= body_text_size * 1.1):
-                # Main sections and large bold text -> H1
-                heading["level"] = "H1"
-                current_level = "H1"
-            elif current_level == "H1" and (is_bold and size >= body_text_size * 0.9):
-                # Following H1, bold text of reasonable size -> H2
-                heading["level"] = "H2"
-                current_level = "H2"
-            elif current_level == "H2" and (is_bold or size >= body_text_size * 0.8):
-                # Following H2, bold or reasonable size -> H3
-                heading["level"] = "H3"
-            elif current_level is None:
-                # First heading should be H1 if no context
-                heading["level"] = "H1"
-                current_level = "H1"
-            else:
-                # Default based on current context
-                if current_level == "H1":
-                    heading["level"] = "H2"
-                    current_level = "H2"
-                elif current_level == "H2":
-                    heading["level"] = "H3"
-                else:
-                    heading["level"] = "H3"
-        
-        return headings
-    
-    # Apply proper hierarchy
-    potential_headings = assign_proper_hierarchy(potential_headings)
-    
-    # Helper function to check if there's text between two headings
-    def has_text_between_headings(heading1, heading2, all_text_elements):
-        """Check if there's body text between two headings"""
-        if heading1["page"] != heading2["page"]:
-            return True  # Different pages, assume there's content between
-        
-        # Get y-positions
-        y1 = heading1["y_position"]
-        y2 = heading2["y_position"]
-        
-        # Ensure y1 is the upper heading (smaller y value)
-        if y1 > y2:
-            y1, y2 = y2, y1
-        
-        # Check for text elements between these y positions on the same page
-        for element in all_text_elements:
-            if (element["page"] == heading1["page"] and 
-                y1 < element["y_position"] < y2 and
-                element["size"] not in heading_levels and  # Not a heading
-                len(element["text"].strip()) > 3):  # Meaningful text
-                return True
-        
-        return False
-    
+    return assign_proper_hierarchy(potential_headings, size_model["body_text_size"])
+
+def consolidate_headings(spans, size_model, headings):
+    """
+    Consolidation stage: combine consecutive headings of the same level on the same
+    page and split numbered sections (e.g. "1." + "Introduction to..."), dropping
+    fragments and over-long headings
+    Returns the outline items (level, text, page)
+    """
+    if size_model is None:
+        return []
+    text_elements = spans["elements"]
+    heading_levels = size_model["heading_levels"]
+    potential_headings = [dict(heading) for heading in headings]
     # Consolidate consecutive headings of the same level on the same page
     # and combine split numbered sections (e.g., "1." + "Introduction to...")
     consolidated_headings = []
@@ -1438,7 +2659,7 @@ def extract_outline(pdf_path):
         
         # Special handling for numbered sections that might be split
         # If current text is just a number (like "1.", "2.", etc.), look for the next heading on same page
-        if re.match(r"^[0-9]+\.$", current["text"].strip()):
+        if is_bare_section_number(current["numbering"]):
             # Look for the next heading on the same page to combine
             j = i + 1
             while (j < len(potential_headings) and 
@@ -1448,8 +2669,8 @@ def extract_outline(pdf_path):
                 # Only combine if:
                 # 1. The next text doesn't start with a number (likely the continuation)
                 # 2. There's no text between the number and the heading text
-                if (not re.match(r"^[0-9]+[\.\s]", next_heading["text"]) and
-                    not has_text_between_headings(current, next_heading, text_elements)):
+                if (not starts_with_section_number(next_heading["numbering"]) and
+                    not has_text_between_headings(current, next_heading, text_elements, heading_levels)):
                     combined_text = current["text"] + " " + next_heading["text"]
                     # Use H1 for main numbered sections
                     current["level"] = "H1"
@@ -1467,11 +2688,11 @@ def extract_outline(pdf_path):
                 next_heading = potential_headings[j]
                 
                 # NEW LOGIC: Don't merge if next heading starts with a number
-                if re.match(r'^\d+\.', next_heading["text"]):
+                if is_dotted_section_number(next_heading["numbering"]):
                     break  # Don't merge headings that start with numbers
                 
                 # NEW LOGIC: Don't merge if there's text between the headings
-                if has_text_between_headings(current, next_heading, text_elements):
+                if has_text_between_headings(current, next_heading, text_elements, heading_levels):
                     break  # Don't merge if there's content between headings
                 
                 # More intelligent combination logic:
@@ -1518,50 +2739,59 @@ def extract_outline(pdf_path):
         i = j if j > i + 1 else i + 1
     
     outline = consolidated_headings
+    return outline
+
+def build_outline_result(spans, size_model, title_info, outline, options):
+    """
+    Outline stage: merge the first H1 and page 0 headings matching the metadata
+    title into the title and escape special characters
+    Returns the extraction result, with the text analysis report (of the
+    statistics elements, see build_text_analysis) when options["analysis"] is set
+    """
+    metadata_title = spans["metadata_title"]
+    analysis = options.get("analysis", False)
+    if size_model is None:
+        result = {
+            "title": convert_special_chars_to_hex(metadata_title or "Untitled Document"),
+            "outline": []
+        }
+        if analysis:
+            result["analysis"] = build_text_analysis(spans["statistics_elements"], Counter(), {
+                "detected_title": result["title"],
+                "title_components": [],
+                "title_position": None,
+                "heading_levels": {},
+                "body_text_size": None,
+                "title_size": None,
+            })
+        return result
+    title = title_info["title"]
 
     # Check if first H1 matches with title from metadata and merge if so
     if outline and outline[0]["level"] == "H1":
-        # Get the metadata to check the title
-        try:
-            # Extract metadata from PDF
-            doc = fitz.open(pdf_path)
-            metadata_title = doc.metadata.get("title", "").strip()
-            doc.close()
+        # Compare H1 text with metadata title (case-insensitive, normalized)
+        h1_text = outline[0]["text"].strip().lower()
+        metadata_title_lower = metadata_title.strip().lower()
+        
+        # If they match or H1 is contained in metadata title, merge them
+        if (h1_text and metadata_title_lower and 
+            (h1_text == metadata_title_lower or h1_text in metadata_title_lower)):
+            # Merge the original title with H1 text and remove H1 from outline
+            original_title = title if title else ""
+            h1_title = outline[0]["text"]
             
-            # Compare H1 text with metadata title (case-insensitive, normalized)
-            h1_text = outline[0]["text"].strip().lower()
-            metadata_title_lower = metadata_title.strip().lower()
-            
-            # If they match or H1 is contained in metadata title, merge them
-            if (h1_text and metadata_title_lower and 
-                (h1_text == metadata_title_lower or h1_text in metadata_title_lower)):
-                # Merge the original title with H1 text and remove H1 from outline
-                original_title = title if title else ""
-                h1_title = outline[0]["text"]
+            # Combine titles: if original title exists, use "original_title: h1_title", otherwise just h1_title
+            if original_title and original_title.strip():
+                title = f"{original_title}: {h1_title}"
+            else:
+                title = h1_title
                 
-                # Combine titles: if original title exists, use "original_title: h1_title", otherwise just h1_title
-                if original_title and original_title.strip():
-                    title = f"{original_title}: {h1_title}"
-                else:
-                    title = h1_title
-                    
-                outline = outline[1:]  # Remove the first H1 from outline
-        except:
-            # If there's any error reading metadata, continue with original logic
-            pass
+            outline = outline[1:]  # Remove the first H1 from outline
 
     # Check page 0 content and only merge with title if it matches metadata title
     page_0_content = []
     remaining_outline = []
     
-    # Get metadata title for comparison
-    try:
-        doc = fitz.open(pdf_path)
-        metadata_title = doc.metadata.get("title", "").strip()
-        doc.close()
-    except:
-        metadata_title = ""
-    
     for item in outline:
         if item["page"] == 0:
             # Check if page 0 content matches metadata title
@@ -1607,25 +2837,748 @@ def extract_outline(pdf_path):
             "page": item["page"]
         })
 
-    return {
+    result = {
         "title": final_title,
         "outline": final_outline
     }
+    if analysis:
+        class_sizes = size_model["class_sizes"]
+        title_details = {
+            "detected_title": final_title,
+            "title_components": title_info["components"],
+            "title_position": ({"page": title_info["page"], "y_position": title_info["y_position"]}
+                               if title_info["y_position"] is not None else None),
+            "heading_levels": {str(class_sizes[sc]): level for sc, level in size_model["heading_levels"].items()},
+            "body_text_size": size_model["body_text_size"],
+            "title_size": size_model["title_size"],
+        }
+        result["analysis"] = build_text_analysis(spans["statistics_elements"], size_model["size_histogram"],
+                                                 title_details)
+    return result
+
+# The analysis stages of an extraction: (name, function, artifacts it takes,
+# artifact it produces); "spans" and "options" are the pipeline's inputs
+OUTLINE_STAGES = (
+    ("statistics", build_size_model, ("spans",), "size_model"),
+    ("title", detect_title, ("spans", "size_model"), "title"),
+    ("line_groups", find_candidate_lines, ("spans", "size_model", "title", "options"), "candidate_lines"),
+    ("heading_candidates", find_raw_headings, ("size_model", "title", "candidate_lines"), "raw_headings"),
+    ("hierarchy", assign_heading_levels, ("size_model", "raw_headings"), "headings"),
+    ("consolidate", consolidate_headings, ("spans", "size_model", "headings"), "outline"),
+    ("outline", build_outline_result, ("spans", "size_model", "title", "outline", "options"), "result"),
+)
+
+class OutlinePipeline:
+    """
+    The analysis of an extraction as explicit stages with named artifacts
+
+    Artifacts: "spans" (the span table: elements, statistics_elements and
+    metadata_title), "size_model", "title", "candidate_lines", "raw_headings",
+    "headings", "outline" (consolidated) and "result". Every stage is a plain
+    function of the artifacts it names, so stages can be replaced one at a time
+    (replace_stage), run partially (stop_after) or have their artifacts cached
+    per document (stage_cache, any mapping keyed by (document_key, stage name)).
+    Each finished stage is reported to the stage hook, which makes every stage
+    timeable (see batch_metrics.StageRecorder). Caching a stage is up to the
+    caller's key: it must change with anything the stage depends on, and the
+    line stage's corpus keys are only collected when it actually runs.
+    """
+
+    def __init__(self, stages=OUTLINE_STAGES, stage_cache=None):
+        self.stages = tuple(stages)
+        self.stage_cache = stage_cache
+
+    def replace_stage(self, name, function):
+        """Return a copy of the pipeline with the function of stage name replaced"""
+        if name not in [stage[0] for stage in self.stages]:
+            raise KeyError(f"no stage named {name}")
+        stages = tuple((stage_name, function if stage_name == name else stage_function, inputs, output)
+                       for stage_name, stage_function, inputs, output in self.stages)
+        return OutlinePipeline(stages, self.stage_cache)
+
+    def run(self, spans, options=None, document_key=None, stop_after=None):
+        """
+        Run the stages over a span table (dict with elements, statistics_elements
+        and metadata_title); options holds analysis, corpus_model and corpus_keys
+        Once the size model is built, the "size_class" key of every statistics
+        element (elements are among them) is set in place, replacing what an
+        earlier run stored there: element lists shared between runs are
+        reclassified by each run before any stage reads them
+        Returns all artifacts by name, up to stop_after when it names a stage
+        """
+        artifacts = {"spans": spans, "options": options or {}}
+        use_cache = self.stage_cache is not None and document_key is not None
+        for name, function, inputs, output in self.stages:
+            cache_key = (document_key, name)
+            if use_cache and cache_key in self.stage_cache:
+                artifacts[output] = self.stage_cache[cache_key]
+            else:
+                artifacts[output] = function(*[artifacts[artifact] for artifact in inputs])
+                if use_cache:
+                    self.stage_cache[cache_key] = artifacts[output]
+            if output == "size_model" and artifacts[output] is not None:
+                # Later stages read the size class off the elements, cached model or not
+                apply_size_classes(spans, artifacts[output])
+            mark_stage(name)
+            if name == stop_after:
+                break
+        return artifacts
+
+# Pipeline analyze_text_elements runs (see use_outline_pipeline)
+OUTLINE_PIPELINE = OutlinePipeline()
+
+def use_outline_pipeline(pipeline):
+    """
+    Make pipeline the OutlinePipeline every extraction's analysis runs through
+    Returns the previously active pipeline
+    """
+    global OUTLINE_PIPELINE
+    previous = OUTLINE_PIPELINE
+    OUTLINE_PIPELINE = pipeline
+    return previous
+
+def analyze_text_elements(text_elements, metadata_title="", statistics_elements=None, analysis=False,
+                          corpus_model=None, corpus_keys=None):
+    """
+    Build the title and outline from extracted text elements
+    statistics_elements (default: text_elements) is what the body-size, heading
+    size and repetition statistics are computed from, so partial extractions can
+    add sampled pages there without those pages producing headings
+    With analysis set, the result also carries the text analysis report
+    With corpus_model set, lines the model reports as corpus boilerplate are
+    dropped before the heading checks; the keys of all candidate lines (lines
+    with a heading-sized element) are added to corpus_keys if it is a set
+    The elements are annotated in place with their "size_class" (see
+    OutlinePipeline.run); their other keys are not modified
+    """
+    if statistics_elements is None:
+        statistics_elements = text_elements
+    spans = {"elements": text_elements, "statistics_elements": statistics_elements,
+             "metadata_title": metadata_title}
+    options = {"analysis": analysis, "corpus_model": corpus_model, "corpus_keys": corpus_keys}
+    return OUTLINE_PIPELINE.run(spans, options)["result"]
+
+def build_warm_up_pdf():
+    """
+    Build a small in-memory PDF that exercises the title, heading, date, URL
+    and decorative paths of extract_outline
+    """
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Warm-up Document Title", fontsize=22)
+    page.insert_text((72, 110), "1. Introduction", fontsize=16)
+    page.insert_text((72, 140), "Body text written on March 3, 2024 and published at www.example.com, "
+                     "with reference 123456.", fontsize=10)
+    page.insert_text((72, 170), "2.1 Background", fontsize=14)
+    page.insert_text((72, 200), "H O P E", fontsize=14)
+    page.insert_text((72, 230), "Name", fontsize=14)
+    for line in range(8):
+        page.insert_text((72, 260 + line * 14), "More body text for the warm-up document - it's short...",
+                         fontsize=10)
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+def warm_up():
+    """
+    Prepare a worker process before it handles its first real document
+    The pattern families and lookup tables are built at import; this also runs a
+    synthetic document through extract_outline so PyMuPDF loads its fonts and
+    every code path has been executed once. Returns the seconds spent.
+    """
+    start = time.perf_counter()
+    # The synthetic document must not be counted by a learning corpus model
+    learning = CORPUS_MODEL is not None and CORPUS_MODEL.learning
+    if learning:
+        CORPUS_MODEL.learning = False
+    try:
+        extract_outline(build_warm_up_pdf())
+    finally:
+        if learning:
+            CORPUS_MODEL.learning = True
+    return time.perf_counter() - start
+
+def process_pdf_file(pdf_path, output_path, analysis=False, page_kinds=None, ocr_backend=None):
+    """
+    Extract one PDF and write its JSON result
+    With analysis set, the text analysis report is written next to it as
+    <name>_complete_text_analysis.json
+    page_kinds and ocr_backend are passed on to extract_outline
+    With INCREMENTAL_STATE_DIR set, documents without analysis or OCR are
+    extracted by extract_outline_incremental with their state kept there
+    """
+    if INCREMENTAL_STATE_DIR is not None and not analysis and ocr_backend is None:
+        state_dir = os.path.join(INCREMENTAL_STATE_DIR, os.path.splitext(os.path.basename(output_path))[0] + ".state")
+        result = extract_outline_incremental(pdf_path, state_dir, page_kinds=page_kinds)
+    else:
+        result = extract_outline(pdf_path, analysis=analysis, page_kinds=page_kinds, ocr_backend=ocr_backend)
+    return write_result(result, output_path)
 
-def process_pdfs(input_dir, output_dir):
+def write_result(result, output_path):
+    """
+    Write an extraction result as JSON; its analysis report, if any, goes next to
+    it as <name>_complete_text_analysis.json
+    """
+    if "analysis" in result:
+        analysis_path = output_path[:-len(".json")] + "_complete_text_analysis.json"
+        with open(analysis_path, "w", encoding="utf-8") as f:
+            json.dump(result.pop("analysis"), f, ensure_ascii=False, indent=2)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return output_path
+
+# With several workers, documents of more than SPLIT_MIN_PAGES pages are read as
+# page ranges of SPLIT_CHUNK_PAGES pages by separate subtasks
+SPLIT_MIN_PAGES = 100
+SPLIT_CHUNK_PAGES = 50
+
+def estimate_pdf_cost(pdf_path):
+    """
+    Cheaply estimate the extraction cost of a PDF by its page count, read from the
+    xref without extracting any text (sampling the spans of even two pages per
+    document made the estimate cost more than the better order saved)
+    Returns (cost, page_count); both are 0 when the file cannot be opened, so
+    such a file (which fails at once) is dispatched last
+    """
+    try:
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+    except Exception:
+        return 0, 0
+    return page_count, page_count
+
+def schedule_tasks(tasks, workers):
+    """
+    Order tasks longest-first by estimated cost, splitting documents longer than
+    SPLIT_MIN_PAGES into page-range subtasks when several workers share the batch
+    Returns (scheduled_tasks, parts): parts maps a split document's file name to
+    its number of subtasks
+    """
+    costed = []
+    parts = {}
+    for task in tasks:
+        file, pdf_path, output_path, analysis, _ = task
+        cost, page_count = estimate_pdf_cost(pdf_path)
+        # (documents with incremental state are re-read a page at a time already)
+        if workers > 1 and page_count > SPLIT_MIN_PAGES and INCREMENTAL_STATE_DIR is None:
+            ranges = [(start, min(start + SPLIT_CHUNK_PAGES, page_count))
+                      for start in range(0, page_count, SPLIT_CHUNK_PAGES)]
+            parts[file] = len(ranges)
+            for start, stop in ranges:
+                costed.append((cost * (stop - start) / page_count,
+                               (file, pdf_path, output_path, analysis, (start, stop))))
+        else:
+            costed.append((cost, task))
+    costed.sort(key=lambda item: item[0], reverse=True)
+    return [task for _, task in costed], parts
+
+# Store through which split-document subtasks hand their spans on to the task
+# that analyses the document (see use_artifact_store); None pickles them
+# through the parent
+ARTIFACT_STORE = None
+
+def use_artifact_store(artifact_store):
+    """
+    Make artifact_store (a shared_artifacts.ArtifactStore, or None) the store
+    page-range subtasks put their spans in; set it before the workers fork
+    Returns the previously active store
+    """
+    global ARTIFACT_STORE
+    previous = ARTIFACT_STORE
+    ARTIFACT_STORE = artifact_store
+    return previous
+
+def _process_pdf_task(task):
+    file, pdf_path, output_path, analysis, page_range = task
+    if isinstance(page_range, dict):
+        return finish_split_document(task)
+    page_kinds = {}
+    # Stage timings travel back with the result so the parent can aggregate them
+    recorder = StageRecorder()
+    cache_lookups = (SPAN_CACHE.hits, SPAN_CACHE.misses) if SPAN_CACHE is not None else (0, 0)
+    previous_hook = use_stage_hook(recorder)
+    try:
+        if page_range is not None:
+            # Subtask of a split document: only read its pages, a follow-up task analyses them
+            doc = open_pdf(pdf_path)
+            metadata_title = read_metadata_title(doc)
+            text_elements = read_pages(doc, range(*page_range), analysis, page_kinds)
+            doc.close()
+            if ARTIFACT_STORE is not None:
+                part = ARTIFACT_STORE.put_spans(text_elements, metadata_title)
+            else:
+                part = text_elements, metadata_title
+            return file, page_range, part, page_kinds, recorder.finish()
+        output_path = process_pdf_file(pdf_path, output_path, analysis, page_kinds)
+    finally:
+        use_stage_hook(previous_hook)
+    corpus_keys = CORPUS_MODEL.last_document_keys if CORPUS_MODEL is not None else None
+    timings = recorder.finish()
+    if SPAN_CACHE is not None:
+        timings["cache_hits"] = SPAN_CACHE.hits - cache_lookups[0]
+        timings["cache_misses"] = SPAN_CACHE.misses - cache_lookups[1]
+    return file, output_path, corpus_keys, page_kinds, timings
+
+def _ocr_pdf_task(task):
+    file, pdf_path, output_path, analysis, _ = task
+    return file, process_pdf_file(pdf_path, output_path, analysis, ocr_backend=OCR_BACKEND)
+
+def split_document_task(task, parts, page_kinds, part_timings):
+    """
+    Return the follow-up task that analyses a split document once its page-range
+    subtask task and all the others are in
+    parts maps each page range to its (text elements, metadata title), or to the
+    ArtifactHandle they were put in ARTIFACT_STORE under; page_kinds and
+    part_timings are the subtasks' page kinds and stage timings
+    """
+    return task[:4] + ({"parts": parts, "page_kinds": page_kinds, "timings": part_timings},)
+
+def finish_split_document(task):
+    """
+    Analyse the spans of a split document, read by its page-range subtasks, as one
+    document and write its result (see split_document_task); runs in a worker
+    like any other task. The document's timings span from the first part's start
+    to the end of the analysis here. Artifact files are only discarded once the
+    result is written, so a retry can read them again
+    Returns the result _process_pdf_task returns for a whole document
+    """
+    file, _, output_path, analysis, split = task
+    recorder = StageRecorder()
+    previous_hook = use_stage_hook(recorder)
+    try:
+        parts = {page_range: ARTIFACT_STORE.get(part, discard=False) if isinstance(part, ArtifactHandle) else part
+                 for page_range, part in split["parts"].items()}
+        text_elements = [e for page_range in sorted(parts) for e in parts[page_range][0]]
+        metadata_title = parts[min(parts)][1]
+        output_path = write_result(finish_outline(text_elements, metadata_title, analysis), output_path)
+    finally:
+        use_stage_hook(previous_hook)
+    for part in split["parts"].values():
+        if isinstance(part, ArtifactHandle):
+            ARTIFACT_STORE.discard(part)
+    timings = recorder.finish()
+    for part in split["timings"]:
+        timings["start_ns"] = min(timings["start_ns"], part["start_ns"])
+        timings["stages"] = part["stages"] + timings["stages"]
+    corpus_keys = CORPUS_MODEL.last_document_keys if CORPUS_MODEL is not None else None
+    return file, output_path, corpus_keys, split["page_kinds"], timings
+
+def _set_global(name, value):
+    """Set the module global name to value; returns its previous value"""
+    previous = globals()[name]
+    globals()[name] = value
+    return previous
+
+def use_batch_settings(settings):
+    """
+    Apply the per-batch settings of process_pdfs to this process: settings maps
+    rules_path, heading_classifier_path, memory_budget_mb, outline_depth,
+    incremental_dir, corpus_model_path and span_cache_dir to their values (see
+    process_pdfs); the corpus model is always swapped, to None without a path
+    Returns a contextlib.ExitStack whose close() restores the previous settings;
+    when a setting fails to load, the ones already applied are restored before
+    the error propagates
+    """
+    with contextlib.ExitStack() as stack:
+        if settings.get("rules_path"):
+            stack.callback(use_rule_set, use_rule_set(load_rule_set(settings["rules_path"])))
+        if settings.get("heading_classifier_path"):
+            classifier = HeadingClassifier.load(settings["heading_classifier_path"])
+            stack.callback(use_heading_classifier, use_heading_classifier(classifier))
+        if settings.get("memory_budget_mb") is not None:
+            stack.callback(_set_global, "MEMORY_BUDGET_MB",
+                           _set_global("MEMORY_BUDGET_MB", settings["memory_budget_mb"]))
+        if settings.get("outline_depth") is not None:
+            stack.callback(_set_global, "OUTLINE_DEPTH", _set_global("OUTLINE_DEPTH", settings["outline_depth"]))
+        if settings.get("incremental_dir"):
+            stack.callback(_set_global, "INCREMENTAL_STATE_DIR",
+                           _set_global("INCREMENTAL_STATE_DIR", settings["incremental_dir"]))
+        corpus_model_path = settings.get("corpus_model_path")
+        corpus_model = None
+        if corpus_model_path:
+            if os.path.exists(corpus_model_path):
+                corpus_model = CorpusFrequencyModel.load(corpus_model_path)
+            else:
+                corpus_model = CorpusFrequencyModel()
+        stack.callback(use_corpus_model, use_corpus_model(corpus_model))
+        if settings.get("span_cache_dir"):
+            span_cache = SpanCache(settings["span_cache_dir"], span_cache_fingerprint())
+            stack.callback(use_span_cache, use_span_cache(span_cache))
+        return stack.pop_all()
+
+def _init_batch_worker(settings):
+    """
+    Pool initializer: apply the batch settings in a worker process that did not
+    inherit them (not started by fork); the rule set, classifier and corpus
+    model are loaded from their files, as they were when the batch started
+    """
+    use_batch_settings(settings)
+
+# Errors meaning the PDF itself is unreadable: quarantined without a retry
+PERMANENT_ERRORS = (fitz.FileDataError, fitz.EmptyFileError, FileNotFoundError)
+
+def run_ocr_queue(ocr_tasks, ocr_workers, memory_limit_mb=None, checkpoint=None, metrics=None,
+                  settings=None, isolate=False):
+    """
+    Re-extract the documents with scanned pages through OCR_BACKEND, with at most
+    ocr_workers processes, so slow OCR never holds up the text-layer documents
+    A document whose OCR fails keeps its text-layer result; outcomes are recorded
+    in metrics (a BatchMetrics) when given; settings are the batch settings (see
+    use_batch_settings), applied in workers that do not inherit them; isolate
+    runs OCR in a worker process even with a single OCR worker
+    Returns (processed, failed) document counts
+    """
+    # The text-layer pass already recorded these documents in the corpus model
+    learning = CORPUS_MODEL is not None and CORPUS_MODEL.learning
+    if learning:
+        CORPUS_MODEL.learning = False
+    processed = failed = 0
+    try:
+        for task, status, payload, attempts in run_supervised(
+                _ocr_pdf_task, ocr_tasks, ocr_workers, memory_limit_mb=memory_limit_mb,
+                permanent_errors=PERMANENT_ERRORS, isolate=isolate,
+                initializer=_init_batch_worker if settings else None, initargs=(settings,)):
+            if status == "ok":
+                processed += 1
+                print(f"OCR processed: {task[0]} → {payload[1]}")
+            else:
+                failed += 1
+                print(f"OCR failed: {task[0]} after {attempts} attempt(s): "
+                      f"{payload['error_type']}: {payload['message']}")
+            if metrics is not None:
+                metrics.record_ocr(status)
+            if checkpoint is not None:
+                append_checkpoint(checkpoint, {"file": task[0], "status": "ocr_" + status})
+    finally:
+        if learning:
+            CORPUS_MODEL.learning = True
+    return processed, failed
+
+def _outline_task(task):
+    key, source, options = task
+    return extract_outline(source, **options)
+
+def iter_outlines(sources, workers=1, ordered=True, prefetch=None, memory_limit_mb=None,
+                  return_errors=False, **options):
+    """
+    Extract many PDFs and yield the results as they finish, without writing files
+
+    sources is any iterable (e.g. a generator) of file paths, PDF bytes or
+    (key, source) pairs; it is consumed lazily, no more than prefetch documents
+    (default: two per worker) ahead of the last result yielded, so memory stays
+    flat however many documents there are. A path is its own key, bytes are
+    keyed by their position in sources. options are passed on to extract_outline
+    With workers > 1 the documents run in forked worker processes (warmed up and
+    shared copy-on-write as in process_pdfs), with the retries and crash
+    isolation of batch_runner.run_supervised; with ordered unset, results come
+    in completion order instead of input order
+
+    Yields (key, result); a document that keeps failing raises RuntimeError, or
+    with return_errors is yielded as (key, error details) instead
+    """
+    def tasks():
+        for index, item in enumerate(sources):
+            if isinstance(item, tuple):
+                key, source = item
+            elif isinstance(item, (bytes, bytearray, memoryview)):
+                key, source = index, item
+            else:
+                key, source = item, item
+            if isinstance(source, memoryview):
+                source = bytes(source)  # memoryviews do not pickle to the workers
+            yield key, source, options
+
+    if workers > 1:
+        warm_up()
+        gc.freeze()
+    try:
+        for task, status, payload, attempts in run_supervised(
+                _outline_task, tasks(), workers, memory_limit_mb=memory_limit_mb,
+                permanent_errors=PERMANENT_ERRORS, prefetch=prefetch, ordered=ordered):
+            if status == "ok" or return_errors:
+                yield task[0], payload
+            else:
+                raise RuntimeError(f"{task[0]!r} failed after {attempts} attempt(s): "
+                                   f"{payload['error_type']}: {payload['message']}")
+    finally:
+        if workers > 1:
+            gc.unfreeze()
+
+def process_pdfs(input_dir, output_dir, workers=1, analysis=False, rules_path=None,
+                 corpus_model_path=None, ocr_workers=1, memory_limit_mb=None,
+                 dead_letter_dir=None, checkpoint_path=None, cost_scheduling=True,
+                 memory_budget_mb=None, metrics_path=None, trace_path=None, span_cache_dir=None,
+                 outline_depth=None, incremental_dir=None, heading_classifier_path=None,
+                 shared_artifacts=True, isolate=False):
+    """
+    Process every PDF in input_dir and write one JSON file per PDF to output_dir
+    With workers > 1 the parent warms up first and then forks the workers, so
+    they share the compiled patterns and loaded PyMuPDF state copy-on-write
+    rules_path swaps in a different heuristic rule set for this batch only
+    corpus_model_path enables the corpus boilerplate prefilter: the model is
+    loaded from that file (or started empty), learns from this batch and is
+    saved back when the batch is done
+    Documents with scanned pages are queued while the batch runs and re-extracted
+    afterwards through OCR_BACKEND by ocr_workers processes (skipped when no
+    backend is available)
+
+    Failures are isolated per document (see batch_runner.run_supervised): a PDF
+    that fails is retried with backoff, and one that keeps failing is reported
+    and, with dead_letter_dir, copied there with its error details. With
+    workers > 1, isolate or memory_limit_mb, documents run in worker processes:
+    a crash in the C layer only costs the worker process, and memory_limit_mb
+    caps each worker. Otherwise they run in this process, where a crash ends
+    the batch. With checkpoint_path, finished documents
+    are recorded there as they complete and skipped when the batch is run again
+    (documents that failed, or whose OCR failed, are tried again)
+    With cost_scheduling (the default) and workers > 1, documents are dispatched
+    longest-first by page count and long documents are split into page-range
+    subtasks whose spans are analysed together by a follow-up task in a worker
+    memory_budget_mb sets MEMORY_BUDGET_MB for this batch
+    Batch metrics (see batch_metrics.BatchMetrics) are aggregated from the stage
+    timings every worker returns and, with metrics_path, written there as a
+    Prometheus textfile (.prom) or JSON; trace_path appends the batch's document
+    and stage spans there as OTLP/JSON lines
+    span_cache_dir enables the span cache (see use_span_cache) in that directory,
+    so re-running a batch after changing the heuristics skips span extraction
+    outline_depth sets OUTLINE_DEPTH (1 to MAX_OUTLINE_DEPTH) for this batch
+    incremental_dir sets INCREMENTAL_STATE_DIR for this batch: a document that
+    changed since the last batch only has its changed pages re-extracted
+    heading_classifier_path loads a heading classifier (see
+    train_heading_classifier.py) and uses it for this batch
+    shared_artifacts hands the spans of split documents from the subtasks that
+    read them to the task that analyses the document through an ArtifactStore
+    (shared-memory scratch files) instead of pickling them through the parent
+
+    Returns the batch counts: documents, text/scanned/empty pages, failed,
+    resumed and split documents, and the documents queued for, processed by,
+    failed in and skipped by OCR
+    """
     os.makedirs(output_dir, exist_ok=True)
-    for file in os.listdir(input_dir):
+    checkpoint_records = load_checkpoint(checkpoint_path) if checkpoint_path else {}
+    tasks = []
+    ocr_tasks = []
+    resumed = 0
+    for file in sorted(os.listdir(input_dir)):
         if file.lower().endswith(".pdf"):
             pdf_path = os.path.join(input_dir, file)
             output_path = os.path.join(output_dir, file.replace(".pdf", ".json"))
-            result = extract_outline(pdf_path)
-            with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(result, f, ensure_ascii=False, indent=2)
-            print(f"Processed: {file} → {output_path}")
+            task = (file, pdf_path, output_path, analysis, None)
+            record = checkpoint_records.get(file)
+            # Failed documents are retried: their failure may have been transient
+            if record is None or record["status"] not in ("ok", "ocr_ok", "ocr_failed"):
+                tasks.append(task)
+                continue
+            resumed += 1
+            # A document whose text pass finished but whose OCR did not finish, or
+            # failed, is re-queued for OCR
+            if (record["status"] == "ok" and record.get("scanned_pages")) or record["status"] == "ocr_failed":
+                ocr_tasks.append(task)
+
+    if outline_depth is not None and not 1 <= outline_depth <= MAX_OUTLINE_DEPTH:
+        raise ValueError(f"outline_depth must be between 1 and {MAX_OUTLINE_DEPTH}, not {outline_depth}")
+    settings = {"rules_path": rules_path, "heading_classifier_path": heading_classifier_path,
+                "memory_budget_mb": memory_budget_mb, "outline_depth": outline_depth,
+                "incremental_dir": incremental_dir, "corpus_model_path": corpus_model_path,
+                "span_cache_dir": span_cache_dir}
+    counts = Counter({"documents": 0, "text_pages": 0, "scanned_pages": 0, "empty_pages": 0,
+                      "failed_documents": 0, "resumed_documents": resumed, "split_documents": 0,
+                      "ocr_queued_documents": 0, "ocr_documents": 0, "ocr_failed_documents": 0,
+                      "ocr_skipped_documents": 0})
+    metrics = BatchMetrics()
+    checkpoint = trace = artifact_store = corpus_model = None
+    previous_artifact_store = ARTIFACT_STORE
+    pool_workers = workers if len(tasks) > 1 else 1
+    # Documents run in worker processes (not in this one)
+    in_workers = pool_workers > 1 or isolate or bool(memory_limit_mb)
+    # Every batch setting is applied here and restored in the finally block below
+    batch_settings = use_batch_settings(settings)
+    try:
+        if corpus_model_path:
+            corpus_model = CORPUS_MODEL
+        checkpoint = open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else None
+        trace = TraceWriter(trace_path) if trace_path else None
+        parts = {}
+        # One worker runs the tasks back to back: their order cannot shorten the
+        # batch, so the documents are not opened just to estimate their cost
+        if cost_scheduling and pool_workers > 1:
+            tasks, parts = schedule_tasks(tasks, pool_workers)
+            counts["split_documents"] = len(parts)
+        # Spans read so far for each split document: file -> {page range: (elements, metadata title)}
+        split_parts = {file: {} for file in parts}
+        # Split documents whose parts are all in, analysed by a follow-up task
+        followups = deque()
+        split_page_kinds = {file: {} for file in parts}
+        split_timings = {file: [] for file in parts}
+        artifact_store = ArtifactStore() if shared_artifacts and parts and pool_workers > 1 else None
+        if artifact_store is not None:
+            use_artifact_store(artifact_store)
+        if pool_workers > 1:
+            warm_up()
+            # Move everything allocated so far out of the GC's reach so collections in
+            # the children do not touch (and therefore copy) the shared pages
+            gc.freeze()
+        for task, status, payload, attempts in run_supervised(
+                _process_pdf_task, tasks, pool_workers,
+                memory_limit_mb=memory_limit_mb, permanent_errors=PERMANENT_ERRORS, isolate=isolate,
+                initializer=_init_batch_worker, initargs=(settings,), followups=followups):
+            file = task[0]
+            if isinstance(task[4], tuple):
+                # Subtask of a split document: analyse the document once every part is in
+                if file not in split_parts:
+                    # an earlier part failed and the document was reported
+                    if status == "ok" and isinstance(payload[2], ArtifactHandle):
+                        artifact_store.discard(payload[2])
+                    continue
+                if status == "ok":
+                    _, page_range, part, page_kinds, timings = payload
+                    split_parts[file][page_range] = part
+                    split_page_kinds[file].update(page_kinds)
+                    split_timings[file].append(timings)
+                    if len(split_parts[file]) < parts[file]:
+                        continue
+                    followups.append(split_document_task(task, split_parts.pop(file),
+                                                         split_page_kinds.pop(file), split_timings.pop(file)))
+                    continue
+                for part in split_parts.pop(file).values():
+                    if isinstance(part, ArtifactHandle):
+                        artifact_store.discard(part)
+                del split_page_kinds[file]
+                del split_timings[file]
+            elif isinstance(task[4], dict) and status != "ok":
+                for part in task[4]["parts"].values():
+                    if isinstance(part, ArtifactHandle):
+                        artifact_store.discard(part)
+            # From here on a split document is reported (and queued for OCR) as a whole
+            task = task[:4] + (None,)
+            record = {"file": file, "status": status, "attempts": attempts}
+            if status == "ok":
+                _, output_path, corpus_keys, page_kinds, timings = payload
+                # Workers learn into their own forked copy; the parent's model
+                # is the one that is saved
+                if (in_workers and corpus_keys is not None and
+                        corpus_model is not None and corpus_model.learning):
+                    corpus_model.add_document(corpus_keys)
+                counts["documents"] += 1
+                for kind in page_kinds.values():
+                    counts[kind + "_pages"] += 1
+                record["scanned_pages"] = sum(1 for kind in page_kinds.values() if kind == "scanned")
+                if record["scanned_pages"]:
+                    ocr_tasks.append(task)
+                metrics.record_document("ok", attempts, timings, page_kinds)
+                if trace is not None:
+                    trace.document(file, "ok", attempts, timings, attributes={"pages": len(page_kinds)})
+                print(f"Processed: {file} → {output_path}")
+            else:
+                counts["failed_documents"] += 1
+                metrics.record_document("failed", attempts, error_type=payload["error_type"])
+                if trace is not None:
+                    trace.document(file, "failed", attempts,
+                                   error=f"{payload['error_type']}: {payload['message']}")
+                if dead_letter_dir:
+                    quarantine(file, task[1], payload, attempts, dead_letter_dir)
+                print(f"Failed: {file} after {attempts} attempt(s): "
+                      f"{payload['error_type']}: {payload['message']}")
+            if checkpoint is not None:
+                append_checkpoint(checkpoint, record)
+
+        # Deferred OCR queue: documents with scanned pages, throttled separately
+        counts["ocr_queued_documents"] = len(ocr_tasks)
+        if ocr_tasks and OCR_BACKEND is None:
+            counts["ocr_skipped_documents"] = len(ocr_tasks)
+            print(f"No OCR backend available: {len(ocr_tasks)} document(s) with scanned pages "
+                  f"keep their text-layer result")
+        elif ocr_tasks:
+            counts["ocr_documents"], counts["ocr_failed_documents"] = run_ocr_queue(
+                ocr_tasks, ocr_workers, memory_limit_mb, checkpoint, metrics, settings, isolate)
+    finally:
+        if pool_workers > 1:
+            gc.unfreeze()
+        if artifact_store is not None:
+            use_artifact_store(previous_artifact_store)
+            artifact_store.close()
+        metrics.finish()
+        if checkpoint is not None:
+            checkpoint.close()
+        if metrics_path:
+            metrics.write(metrics_path)
+        if trace is not None:
+            trace.close({"workers": pool_workers})
+        batch_settings.close()
+        if corpus_model is not None:
+            corpus_model.save(corpus_model_path)
+
+    print(f"Batch: {counts['documents']} documents, {counts['text_pages']} text pages, "
+          f"{counts['scanned_pages']} scanned pages, {counts['empty_pages']} empty pages, "
+          f"{counts['failed_documents']} failed, {counts['resumed_documents']} already done; "
+          f"OCR: {counts['ocr_documents']} processed, {counts['ocr_failed_documents']} failed, "
+          f"{counts['ocr_skipped_documents']} skipped; "
+          f"{metrics.summary()['pages_per_second']} pages/s")
+    return dict(counts)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract titles and outlines from PDFs")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of pre-forked worker processes (default: 1)")
+    parser.add_argument("--analysis", action="store_true",
+                        help="also write a <name>_complete_text_analysis.json report per PDF")
+    parser.add_argument("--rules", dest="rules_path",
+                        help="heuristic rule set JSON to use instead of heuristic_rules.json")
+    parser.add_argument("--corpus-model", dest="corpus_model_path",
+                        help="corpus frequency model file used to drop lines repeated across "
+                             "documents; created if missing and updated after the batch")
+    parser.add_argument("--ocr-workers", type=int, default=1,
+                        help="number of processes for the deferred OCR queue of scanned documents "
+                             "(default: 1)")
+    parser.add_argument("--memory-limit-mb", type=int,
+                        help="address-space limit for each worker process (documents run in worker "
+                             "processes when it is set)")
+    parser.add_argument("--isolate", action="store_true",
+                        help="run documents in a worker process even with --workers 1, so a crash "
+                             "in the C layer only loses that document")
+    parser.add_argument("--dead-letter-dir",
+                        help="copy PDFs that keep failing here, with a <name>.error.json report")
+    parser.add_argument("--checkpoint",
+                        help="record finished documents in this file and skip them when rerun")
+    parser.add_argument("--memory-budget-mb", type=int,
+                        help="per-document RSS growth after which the remaining pages are read "
+                             "on the low-memory path")
+    parser.add_argument("--no-cost-scheduling", action="store_true",
+                        help="process documents in name order instead of longest-first, without "
+                             "splitting long documents")
+    parser.add_argument("--span-cache",
+                        help="directory caching the extracted spans of each PDF, so reruns with "
+                             "changed heuristics skip extraction")
+    parser.add_argument("--metrics",
+                        help="write batch metrics to this file: Prometheus textfile format for "
+                             "a .prom file, JSON otherwise")
+    parser.add_argument("--outline-depth", type=int,
+                        help=f"deepest heading level to extract, 1 to {MAX_OUTLINE_DEPTH} (default: "
+                             f"{OUTLINE_DEPTH}, the H1-H3 of the output schema)")
+    parser.add_argument("--incremental",
+                        help="keep per-page state of every document in this directory and, when a "
+                             "document changed since the last run, re-extract only its changed pages")
+    parser.add_argument("--heading-classifier", dest="heading_classifier_path",
+                        help="heading classifier model (from train_heading_classifier.py) deciding "
+                             "clear-cut lines before the heuristic checks")
+    parser.add_argument("--no-shared-artifacts", action="store_true",
+                        help="pickle the spans of split documents through the parent instead of "
+                             "handing them over in shared-memory scratch files")
+    parser.add_argument("--trace",
+                        help="append per-document and per-stage trace spans to this file as "
+                             "OTLP/JSON lines")
+    args = parser.parse_args()
+
     # Use relative paths for local execution, absolute paths for Docker
     script_dir = os.path.dirname(os.path.abspath(__file__))
     INPUT_DIR = os.path.join(script_dir, "sample_dataset", "pdfs")
     OUTPUT_DIR = os.path.join(script_dir, "sample_dataset", "outputs")
-    process_pdfs(INPUT_DIR, OUTPUT_DIR)
\ No newline at end of file
+    process_pdfs(INPUT_DIR, OUTPUT_DIR, workers=args.workers, analysis=args.analysis,
+                 rules_path=args.rules_path, corpus_model_path=args.corpus_model_path,
+                 ocr_workers=args.ocr_workers, memory_limit_mb=args.memory_limit_mb,
+                 dead_letter_dir=args.dead_letter_dir, checkpoint_path=args.checkpoint,
+                 cost_scheduling=not args.no_cost_scheduling, memory_budget_mb=args.memory_budget_mb,
+                 metrics_path=args.metrics, trace_path=args.trace, span_cache_dir=args.span_cache,
+                 outline_depth=args.outline_depth, incremental_dir=args.incremental,
+                 heading_classifier_path=args.heading_classifier_path,
+                 shared_artifacts=not args.no_shared_artifacts, isolate=args.isolate)
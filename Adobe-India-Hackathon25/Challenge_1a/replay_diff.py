@@ -0,0 +1,270 @@
+import argparse
+import difflib
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS_DIR = os.path.join(SCRIPT_DIR, "sample_dataset", "pdfs")
+
+# Engine module of the worker process (see _load_engine)
+ENGINE = None
+
+
+def checkout_engine(revision, target_dir):
+    """
+    Write this directory as of a git revision (commit, tag or branch) into
+    target_dir, so an older engine can be run next to the working tree
+    Returns target_dir
+    """
+    archive = subprocess.run(["git", "archive", "--format=tar", revision, "."],
+                             cwd=SCRIPT_DIR, capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(target_dir)
+    return target_dir
+
+
+def parse_overrides(assignments):
+    """
+    Parse NAME=VALUE settings; values are read as JSON where they parse
+    (numbers, booleans, null, lists) and kept as strings otherwise
+    """
+    overrides = {}
+    for assignment in assignments or ():
+        name, separator, value = assignment.partition("=")
+        if not separator:
+            raise ValueError(f"setting {assignment!r} is not NAME=VALUE")
+        try:
+            overrides[name] = json.loads(value)
+        except ValueError:
+            overrides[name] = value
+    return overrides
+
+
+def _load_engine(engine_dir, overrides, rules_path, span_cache_dir):
+    """
+    Worker initializer: import process_pdfs from engine_dir and configure it
+    Module settings are overridden by name; rules and the span cache are only
+    applied when the engine supports them
+    """
+    global ENGINE
+    sys.path.insert(0, engine_dir)
+    sys.modules.pop("process_pdfs", None)
+    engine = importlib.import_module("process_pdfs")
+    for name, value in overrides.items():
+        if not hasattr(engine, name):
+            raise AttributeError(f"engine in {engine_dir} has no setting {name}")
+        setattr(engine, name, value)
+    if rules_path:
+        engine.use_rule_set(engine.load_rule_set(rules_path))
+    if span_cache_dir and hasattr(engine, "use_span_cache"):
+        span_cache = importlib.import_module("span_cache")
+        engine.use_span_cache(span_cache.SpanCache(span_cache_dir, engine.span_cache_fingerprint()))
+    if hasattr(engine, "warm_up"):
+        engine.warm_up()
+    ENGINE = engine
+
+
+def _replay_document(call):
+    """Extract one PDF with the worker's engine; returns (file, seconds, result, error)"""
+    pdf_path, repeats = call
+    best = None
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = ENGINE.extract_outline(pdf_path)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    except Exception as e:
+        return os.path.basename(pdf_path), None, None, f"{type(e).__name__}: {e}"
+    return os.path.basename(pdf_path), best, result, None
+
+
+def run_engine(engine_dir, pdf_paths, workers=1, overrides=None, rules_path=None, span_cache_dir=None,
+               repeats=1):
+    """
+    Run extract_outline of the engine in engine_dir over pdf_paths in worker processes
+    Returns {file: (seconds, result, error)}; seconds are the best of repeats runs
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    runs = {}
+    with ProcessPoolExecutor(max(workers, 1), mp_context=context, initializer=_load_engine,
+                             initargs=(engine_dir, overrides or {}, rules_path, span_cache_dir)) as executor:
+        for file, seconds, result, error in executor.map(_replay_document,
+                                                         [(path, repeats) for path in pdf_paths]):
+            runs[file] = (seconds, result, error)
+    return runs
+
+
+def diff_outlines(outline_a, outline_b):
+    """
+    Structurally diff two outlines (lists of {"level", "text", "page"})
+    Headings are matched by (text, page); a matched heading whose level differs
+    counts as relevelled, unmatched ones as removed (only in a) or added (only in b)
+    Returns the counts and the differing headings
+    """
+    keys_a = [(item["text"], item["page"]) for item in outline_a]
+    keys_b = [(item["text"], item["page"]) for item in outline_b]
+    diff = {"removed": [], "added": [], "relevelled": [], "reordered": False}
+    matcher = difflib.SequenceMatcher(None, keys_a, keys_b, autojunk=False)
+    matched_a = set()
+    matched_b = set()
+    for block in matcher.get_matching_blocks():
+        for offset in range(block.size):
+            index_a, index_b = block.a + offset, block.b + offset
+            matched_a.add(index_a)
+            matched_b.add(index_b)
+            if outline_a[index_a]["level"] != outline_b[index_b]["level"]:
+                diff["relevelled"].append({"text": outline_a[index_a]["text"], "page": outline_a[index_a]["page"],
+                                           "level_a": outline_a[index_a]["level"],
+                                           "level_b": outline_b[index_b]["level"]})
+    removed = [outline_a[i] for i in range(len(outline_a)) if i not in matched_a]
+    added = [outline_b[i] for i in range(len(outline_b)) if i not in matched_b]
+    # Headings present in both but matched out of order are moves, not changes
+    moved = {(item["text"], item["page"]) for item in removed} & {(item["text"], item["page"]) for item in added}
+    diff["removed"] = [item for item in removed if (item["text"], item["page"]) not in moved]
+    diff["added"] = [item for item in added if (item["text"], item["page"]) not in moved]
+    diff["reordered"] = bool(moved)
+    return diff
+
+
+def compare_runs(runs_a, runs_b):
+    """
+    Compare the results of two engines document by document
+    Returns the report: per-document differences plus divergence rates and timings
+    """
+    documents = []
+    for file in sorted(set(runs_a) | set(runs_b)):
+        seconds_a, result_a, error_a = runs_a.get(file, (None, None, "missing"))
+        seconds_b, result_b, error_b = runs_b.get(file, (None, None, "missing"))
+        row = {"file": file, "seconds_a": seconds_a, "seconds_b": seconds_b}
+        if error_a or error_b:
+            row.update(error_a=error_a, error_b=error_b, diverged=error_a != error_b)
+        else:
+            outline_diff = diff_outlines(result_a["outline"], result_b["outline"])
+            row["title_a"] = result_a["title"]
+            row["title_b"] = result_b["title"]
+            row["title_changed"] = result_a["title"] != result_b["title"]
+            row["headings_a"] = len(result_a["outline"])
+            row["headings_b"] = len(result_b["outline"])
+            row.update(outline_diff)
+            row["diverged"] = result_a != result_b
+        documents.append(row)
+
+    compared = [row for row in documents if "title_changed" in row]
+    timed = [row for row in documents if row["seconds_a"] and row["seconds_b"]]
+    headings_a = sum(row["headings_a"] for row in compared)
+    changed_headings = sum(len(row["removed"]) + len(row["added"]) + len(row["relevelled"]) for row in compared)
+    total_a = sum(row["seconds_a"] for row in timed)
+    total_b = sum(row["seconds_b"] for row in timed)
+    return {
+        "documents": len(documents),
+        "diverged_documents": sum(1 for row in documents if row["diverged"]),
+        "divergence_rate": round(sum(1 for row in documents if row["diverged"]) / len(documents), 4) if documents else 0.0,
+        "title_changes": sum(1 for row in compared if row["title_changed"]),
+        "heading_change_rate": round(changed_headings / headings_a, 4) if headings_a else 0.0,
+        "errors_a": sum(1 for row in documents if row.get("error_a")),
+        "errors_b": sum(1 for row in documents if row.get("error_b")),
+        "seconds_a": round(total_a, 4),
+        "seconds_b": round(total_b, 4),
+        "speedup": round(total_a / total_b, 3) if total_b else None,
+        "median_document_speedup": round(statistics.median(row["seconds_a"] / row["seconds_b"] for row in timed), 3)
+                                   if timed else None,
+        "by_document": documents,
+    }
+
+
+def resolve_engine(spec, work_dir):
+    """
+    Return the directory of an engine spec: a directory holding process_pdfs.py,
+    or git:<revision> for this directory at that revision
+    """
+    if spec.startswith("git:"):
+        return checkout_engine(spec[len("git:"):], tempfile.mkdtemp(dir=work_dir))
+    return os.path.abspath(spec)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run two outline engines (or one engine with two configurations) over a corpus "
+                    "and report how their titles and outlines diverge next to the speedup")
+    parser.add_argument("corpus", nargs="?", default=DEFAULT_CORPUS_DIR,
+                        help="directory of PDFs (default: the sample dataset)")
+    parser.add_argument("--engine-a", default=SCRIPT_DIR,
+                        help="baseline engine: a directory with process_pdfs.py or git:<revision> "
+                             "(default: this directory)")
+    parser.add_argument("--engine-b", default=SCRIPT_DIR,
+                        help="candidate engine, as --engine-a (default: this directory)")
+    parser.add_argument("--set-a", action="append", metavar="NAME=VALUE",
+                        help="override a module setting of engine A (repeatable)")
+    parser.add_argument("--set-b", action="append", metavar="NAME=VALUE",
+                        help="override a module setting of engine B (repeatable)")
+    parser.add_argument("--rules-a", help="heuristic rule set for engine A")
+    parser.add_argument("--rules-b", help="heuristic rule set for engine B")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes per engine (default: CPU count)")
+    parser.add_argument("--repeats", type=int, default=1,
+                        help="time each document as the best of this many runs")
+    parser.add_argument("--span-cache",
+                        help="span cache directory shared by both engines (where supported); "
+                             "warm it first so neither engine pays for the extraction")
+    parser.add_argument("--json", dest="json_path", help="also write the full report to this file")
+    parser.add_argument("--fail-on-divergence", action="store_true",
+                        help="exit with status 1 if any document diverges")
+    args = parser.parse_args()
+
+    pdf_paths = [os.path.join(args.corpus, file) for file in sorted(os.listdir(args.corpus))
+                 if file.lower().endswith(".pdf")]
+    with tempfile.TemporaryDirectory() as work_dir:
+        runs = []
+        for spec, assignments, rules_path in ((args.engine_a, args.set_a, args.rules_a),
+                                              (args.engine_b, args.set_b, args.rules_b)):
+            runs.append(run_engine(resolve_engine(spec, work_dir), pdf_paths, args.workers,
+                                   parse_overrides(assignments), rules_path, args.span_cache, args.repeats))
+    report = compare_runs(*runs)
+    report["engine_a"] = {"engine": args.engine_a, "settings": args.set_a or [], "rules": args.rules_a}
+    report["engine_b"] = {"engine": args.engine_b, "settings": args.set_b or [], "rules": args.rules_b}
+
+    for row in report["by_document"]:
+        if not row["diverged"]:
+            continue
+        if "title_changed" not in row:
+            print(f"{row['file']}: A {row['error_a'] or 'ok'} / B {row['error_b'] or 'ok'}")
+            continue
+        print(f"{row['file']}: {len(row['removed'])} removed, {len(row['added'])} added, "
+              f"{len(row['relevelled'])} relevelled{', reordered' if row['reordered'] else ''}"
+              f"{', title changed' if row['title_changed'] else ''}")
+        if row["title_changed"]:
+            print(f"  title A: {row['title_a']!r}")
+            print(f"  title B: {row['title_b']!r}")
+        for item in row["removed"]:
+            print(f"  - {item['level']} p{item['page']} {item['text']!r}")
+        for item in row["added"]:
+            print(f"  + {item['level']} p{item['page']} {item['text']!r}")
+        for item in row["relevelled"]:
+            print(f"  ~ {item['level_a']}->{item['level_b']} p{item['page']} {item['text']!r}")
+    print(f"{report['diverged_documents']}/{report['documents']} documents diverged "
+          f"({report['divergence_rate']:.1%}), {report['title_changes']} title changes, "
+          f"heading change rate {report['heading_change_rate']:.1%}, errors A/B "
+          f"{report['errors_a']}/{report['errors_b']}")
+    print(f"Time A {report['seconds_a']:.3f}s, B {report['seconds_b']:.3f}s: speedup {report['speedup']}x "
+          f"(median per document {report['median_document_speedup']}x)")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if args.fail_on_divergence and report["diverged_documents"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import itertools
+import mmap
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+from span_cache import read_span_table, write_span_table
+
+# Scratch files live in shared memory (tmpfs) where there is one, so writing and
+# mapping them never touches a disk
+ARTIFACT_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# What a worker returns in place of a span table: the file holding it and its
+# size in bytes
+ArtifactHandle = namedtuple("ArtifactHandle", "path size")
+
+
+class ArtifactStore:
+    """
+    Scratch space through which forked workers hand the span tables of
+    page-range subtasks on to the task that analyses the whole document
+
+    The parent creates the store before forking, so every worker inherits it. A
+    worker writes a span table to its own file, in the compact columnar layout
+    of the span cache, and returns the small handle from put_spans(); only the
+    handle is pickled through the result pipe, and on to the follow-up task.
+    That task memory-maps the file in get(), which decodes the table and removes
+    the file (or leaves it for discard(), so a retry can read it again). close()
+    removes whatever was never collected (e.g. parts of a failed document).
+    """
+
+    def __init__(self, directory=None):
+        self.directory = tempfile.mkdtemp(prefix="outline-artifacts-", dir=directory or ARTIFACT_DIR)
+        self._sequence = itertools.count()
+        self.received = 0
+        self.received_bytes = 0
+
+    def _new_path(self, suffix):
+        # Workers share the counter's starting value, so the pid keeps names apart
+        return os.path.join(self.directory, f"{os.getpid()}-{next(self._sequence)}{suffix}")
+
+    def put_spans(self, text_elements, metadata_title):
+        """Store a span table (text elements and the document's metadata title); returns its handle"""
+        path = self._new_path(".spans")
+        write_span_table(path, text_elements, {"metadata_title": metadata_title})
+        return ArtifactHandle(path, os.path.getsize(path))
+
+    def get(self, handle, discard=True):
+        """
+        Read the span table behind handle and, with discard set, remove its file
+        Returns (text_elements, metadata_title) as given to put_spans()
+        """
+        try:
+            with open(handle.path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                text_elements, meta = read_span_table(data)
+                value = text_elements, meta["metadata_title"]
+            finally:
+                data.close()
+        finally:
+            if discard:
+                self.discard(handle)
+        self.received += 1
+        self.received_bytes += handle.size
+        return value
+
+    def discard(self, handle):
+        """Remove the file behind a handle that will not be read"""
+        try:
+            os.remove(handle.path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
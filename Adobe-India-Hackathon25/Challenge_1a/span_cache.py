@@ -0,0 +1,202 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from itertools import accumulate
+from operator import itemgetter
+
+from font_styles import BOLD_FLAG, ITALIC_FLAG, font_style
+
+# File layout: header, JSON metadata, then one fixed-width column per numeric
+# span field and the UTF-8 text of all spans; every section starts 8-aligned
+FILE_MAGIC = b"SPC1"
+FILE_HEADER = struct.Struct("<4sIII")  # magic, spans, metadata bytes, text bytes
+# (element key, array typecode) of the numeric columns, in file order
+FLOAT_COLUMNS = (("size", "d"), ("y_position", "d"), ("relative_y", "d"),
+                 ("x_position", "d"), ("relative_x", "d"))
+INT_COLUMNS = (("page", "I"), ("line", "I"), ("flags", "I"), ("color", "I"))
+# Columns not taken from the elements: font table index and end offset of the text
+FONT_COLUMN = "I"
+TEXT_END_COLUMN = "I"
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def _aligned(offset):
+    return (offset + 7) & ~7
+
+
+def content_hash(pdf_path):
+    """Return the SHA-256 hex digest of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_span_table(path, text_elements, meta):
+    """
+    Write text elements in the columnar layout to path, with meta (a JSON-able
+    dict) stored alongside; replaced atomically
+    """
+    count = len(text_elements)
+    texts = list(map(itemgetter("text"), text_elements))
+    font_names = list(map(itemgetter("font"), text_elements))
+    fonts = {font: index for index, font in enumerate(dict.fromkeys(font_names))}
+    color = all("color" in t for t in text_elements)
+    meta = json.dumps(dict(meta, fonts=list(fonts), color=color), ensure_ascii=False).encode("utf-8")
+    text = "".join(texts).encode("utf-8")
+
+    columns = [struct.pack(f"<{count}{typecode}", *map(itemgetter(name), text_elements))
+               for name, typecode in FLOAT_COLUMNS]
+    for name, typecode in INT_COLUMNS:
+        if name == "color" and not color:
+            columns.append(bytes(count * struct.calcsize(typecode)))
+        else:
+            columns.append(struct.pack(f"<{count}{typecode}", *map(itemgetter(name), text_elements)))
+    columns.append(struct.pack(f"<{count}{FONT_COLUMN}", *map(fonts.__getitem__, font_names)))
+    columns.append(struct.pack(f"<{count}{TEXT_END_COLUMN}", *accumulate(map(len, texts))))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        for section in [FILE_HEADER.pack(FILE_MAGIC, len(text_elements), len(meta), len(text)), meta] + columns:
+            f.write(section)
+            f.write(bytes(_aligned(f.tell()) - f.tell()))
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def read_span_table(data, include_color=None):
+    """
+    Decode the text elements of a buffer (e.g. a memory map) written by write_span_table
+    include_color asks for the span colours (None: whatever was stored)
+    Returns (text_elements, meta), or None for a buffer of another format or
+    one stored without the colours asked for
+    """
+    view = memoryview(data)
+    try:
+        magic, count, meta_bytes, text_bytes = FILE_HEADER.unpack_from(data)
+        if magic != FILE_MAGIC:
+            return None
+        offset = FILE_HEADER.size
+        meta = json.loads(bytes(view[offset:offset + meta_bytes]))
+        if include_color is None:
+            include_color = meta["color"]
+        elif include_color and not meta["color"]:
+            return None
+        offset = _aligned(offset + meta_bytes)
+        columns = {}
+        for name, typecode in FLOAT_COLUMNS + INT_COLUMNS + (("font", FONT_COLUMN), ("text_end", TEXT_END_COLUMN)):
+            size = count * struct.calcsize(typecode)
+            columns[name] = view[offset:offset + size].cast(typecode).tolist()
+            offset = _aligned(offset + size)
+        text = str(view[offset:offset + text_bytes], "utf-8")
+    finally:
+        view.release()
+
+    fonts = [sys.intern(font) for font in meta["fonts"]]
+    # Bold and italic by flags or font name, the names parsed once per font
+    styles = [font_style(font) for font in fonts]
+    font_bold = [bold for bold, _ in styles]
+    font_italic = [italic for _, italic in styles]
+    ends = columns["text_end"]
+    rows = zip([0] + ends[:-1], ends, columns["size"], columns["flags"], columns["font"], columns["page"],
+               columns["y_position"], columns["relative_y"], columns["x_position"], columns["relative_x"],
+               columns["color"], columns["line"])
+    # One comprehension building the dicts (key order as extract_page_elements)
+    if include_color:
+        text_elements = [{"text": text[start:end], "size": size, "flags": flags,
+                          "is_bold": bool(flags & BOLD_FLAG) or font_bold[font],
+                          "is_italic": bool(flags & ITALIC_FLAG) or font_italic[font], "font": fonts[font], "page": page,
+                          "y_position": y_position, "relative_y": relative_y, "x_position": x_position,
+                          "relative_x": relative_x, "color": color, "line": line}
+                         for start, end, size, flags, font, page, y_position, relative_y, x_position, relative_x,
+                         color, line in rows]
+    else:
+        text_elements = [{"text": text[start:end], "size": size, "flags": flags,
+                          "is_bold": bool(flags & BOLD_FLAG) or font_bold[font],
+                          "is_italic": bool(flags & ITALIC_FLAG) or font_italic[font], "font": fonts[font], "page": page,
+                          "y_position": y_position, "relative_y": relative_y, "x_position": x_position,
+                          "relative_x": relative_x, "line": line}
+                         for start, end, size, flags, font, page, y_position, relative_y, x_position, relative_x,
+                         _, line in rows]
+    return text_elements, meta
+
+
+class SpanCache:
+    """
+    On-disk cache of the span table extracted from each PDF
+
+    Entries are keyed by the hash of the PDF's bytes plus fingerprint (the
+    PyMuPDF version and whatever else shapes the extracted spans), so a changed
+    file or PyMuPDF upgrade is simply a miss. Each entry is one file in a compact
+    columnar layout that is memory-mapped when read: a cached document is turned
+    back into its text elements without opening the PDF.
+    """
+
+    def __init__(self, directory, fingerprint=""):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fingerprint = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, pdf_path):
+        """Return the cache key of the PDF at pdf_path"""
+        return self.digest_key(content_hash(pdf_path))
+
+    def digest_key(self, digest):
+        """Return the cache key of content with the given hex digest (e.g. one page's)"""
+        return f"{digest}-{self.fingerprint}"
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".spans")
+
+    def load(self, key, include_color=False):
+        """
+        Read the entry stored under key
+        Returns (text_elements, metadata_title, page_kinds), or None on a miss (no
+        entry, an unreadable one, or one stored without the colours asked for)
+        """
+        try:
+            f = open(self.path(key), "rb")
+        except OSError:
+            self.misses += 1
+            return None
+        with f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                self.misses += 1
+                return None
+        try:
+            entry = self._decode(data, include_color)
+        except (ValueError, struct.error, KeyError):
+            entry = None
+        finally:
+            data.close()
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def _decode(self, data, include_color):
+        table = read_span_table(data, include_color)
+        if table is None:
+            return None
+        text_elements, meta = table
+        page_kinds = {page_index: kind for page_index, kind in enumerate(meta["page_kinds"])}
+        return text_elements, meta["metadata_title"], page_kinds
+
+    def store(self, key, text_elements, metadata_title, page_kinds):
+        """
+        Write the text elements of a whole document (with the page kinds of all
+        its pages) under key; replaced atomically
+        """
+        write_span_table(self.path(key), text_elements, {
+            "metadata_title": metadata_title,
+            "page_kinds": [page_kinds[page_index] for page_index in range(len(page_kinds))],
+        })
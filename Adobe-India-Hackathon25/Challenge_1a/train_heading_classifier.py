@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import process_pdfs
+from heading_classifier import DEFAULT_ACCEPT, DEFAULT_REJECT, calibrate, train
+from replay_diff import diff_outlines
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PDF_DIR = os.path.join(SCRIPT_DIR, "sample_dataset", "pdfs")
+DEFAULT_OUTPUT_DIR = os.path.join(SCRIPT_DIR, "sample_dataset", "outputs")
+
+
+def candidate_lines(pdf_path):
+    """
+    Run the stages up to the line stage over one PDF
+    Returns (size_model, title, candidate lines), or None for a document without usable text
+    """
+    doc = process_pdfs.open_pdf(pdf_path)
+    metadata_title = process_pdfs.read_metadata_title(doc)
+    elements = process_pdfs.read_pages(doc, range(doc.page_count), False, {})
+    doc.close()
+    spans = {"elements": elements, "statistics_elements": elements, "metadata_title": metadata_title}
+    artifacts = process_pdfs.OUTLINE_PIPELINE.run(spans, stop_after="line_groups")
+    if artifacts["size_model"] is None:
+        return None
+    return artifacts["size_model"], artifacts["title"], artifacts["candidate_lines"]
+
+
+def is_outline_line(line, page, outline):
+    """
+    Return True if a candidate line ends up in the outline: an outline item on
+    its page is its heading text, or contains it (consolidated headings)
+    """
+    heading_text = line["clean_text"]
+    if process_pdfs.starts_with_section_number(process_pdfs.parse_numbering(line["parts"][0])):
+        heading_text = line["text"]
+    heading_text = process_pdfs.convert_special_chars_to_hex(heading_text)
+    return any(item["page"] == page and heading_text in item["text"] for item in outline)
+
+
+def labelled_lines(pdf_path, expected):
+    """
+    Collect the classifiable candidate lines of one PDF (see is_classifiable_line)
+    Returns a list of (feature vector, label, rule chain decision)
+    """
+    stages = candidate_lines(pdf_path)
+    if stages is None:
+        return []
+    size_model, title_info, lines = stages
+    heading_levels = size_model["heading_levels"]
+    text_frequency = lines["text_frequency"]
+    rows = []
+    for line_group, page, _, _ in lines["lines"]:
+        line = process_pdfs.line_features(line_group, heading_levels)
+        if not process_pdfs.is_classifiable_line(line, title_info["components"]):
+            continue
+        rows.append((process_pdfs.heading_line_vector(line, line_group, size_model, text_frequency),
+                     is_outline_line(line, page, expected["outline"]),
+                     process_pdfs.is_valid_heading_line(line, text_frequency, title_info["components"])))
+    return rows
+
+
+def load_corpus(corpora):
+    """
+    Read the labelled documents of (PDF directory, output directory) pairs
+    A PDF whose output is missing is labelled by the current rule chain
+    Returns {pdf path: (expected result, labelled lines)} and the number of
+    documents labelled by the rule chain
+    """
+    documents = {}
+    engine_labelled = 0
+    for pdf_dir, output_dir in corpora:
+        for file in sorted(os.listdir(pdf_dir)):
+            if not file.lower().endswith(".pdf"):
+                continue
+            pdf_path = os.path.join(pdf_dir, file)
+            output_path = os.path.join(output_dir, file[:-len(".pdf")] + ".json")
+            if os.path.exists(output_path):
+                with open(output_path, encoding="utf-8") as f:
+                    expected = json.load(f)
+            else:
+                expected = process_pdfs.extract_outline(pdf_path)
+                engine_labelled += 1
+            documents[pdf_path] = (expected, labelled_lines(pdf_path, expected))
+    return documents, engine_labelled
+
+
+def fit(rows, accept=DEFAULT_ACCEPT, reject=DEFAULT_REJECT):
+    """
+    Train a classifier on labelled lines and calibrate its thresholds on their
+    rule chain decisions, so on these lines it only decides what the rule chain
+    would (see heading_classifier.calibrate)
+    Returns the classifier
+    """
+    vectors = [vector for vector, _, _ in rows]
+    classifier = train(vectors, [label for _, label, _ in rows], accept=accept, reject=reject)
+    return calibrate(classifier, vectors, [rule_decision for _, _, rule_decision in rows])
+
+
+def evaluate(classifier, rows):
+    """
+    Score labelled lines with classifier, falling back to the rule chain for
+    the lines it leaves undecided
+    Returns the counts: lines, decided by the model, correct among those,
+    correct overall, and correct for the rule chain alone
+    """
+    decisions = classifier.decide([vector for vector, _, _ in rows])
+    counts = {"lines": len(rows), "decided": 0, "decided_correct": 0, "correct": 0, "rule_chain_correct": 0}
+    for decision, (_, label, rule_decision) in zip(decisions, rows):
+        if decision is not None:
+            counts["decided"] += 1
+            counts["decided_correct"] += decision == label
+        counts["correct"] += (rule_decision if decision is None else decision) == label
+        counts["rule_chain_correct"] += rule_decision == label
+    return counts
+
+
+def time_heading_stage(pdf_paths, classifier, repeats):
+    """Return the best total seconds of the heading stage over pdf_paths with classifier active (or None)"""
+    stages = [stage for stage in map(candidate_lines, pdf_paths) if stage is not None]
+    previous = process_pdfs.use_heading_classifier(classifier)
+    try:
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for size_model, title_info, lines in stages:
+                process_pdfs.find_raw_headings(size_model, title_info, lines)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        process_pdfs.use_heading_classifier(previous)
+    return best
+
+
+def cross_validate(documents, accept, reject):
+    """
+    Leave one document out: train on the others, evaluate on it (lines and the
+    full outline against the expected result)
+    Returns one row per document
+    """
+    report = []
+    for pdf_path, (expected, rows) in documents.items():
+        training = [row for other, (_, other_rows) in documents.items() if other != pdf_path for row in other_rows]
+        if len({label for _, label, _ in training}) < 2:
+            continue
+        classifier = fit(training, accept, reject)
+        previous = process_pdfs.use_heading_classifier(classifier)
+        try:
+            result = process_pdfs.extract_outline(pdf_path)
+        finally:
+            process_pdfs.use_heading_classifier(previous)
+        outline_diff = diff_outlines(expected["outline"], result["outline"])
+        row = {"file": os.path.basename(pdf_path), **evaluate(classifier, rows),
+               "outline_matches": result == expected,
+               "headings_removed": len(outline_diff["removed"]), "headings_added": len(outline_diff["added"]),
+               "headings_relevelled": len(outline_diff["relevelled"])}
+        report.append(row)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Train the heading classifier on labelled outputs and report its accuracy "
+                    "(leave one document out) and the speed of the heading stage with it")
+    parser.add_argument("--corpus", nargs=2, action="append", metavar=("PDF_DIR", "OUTPUT_DIR"),
+                        help="PDFs and their expected JSON outputs (repeatable; default: the sample "
+                             "dataset); PDFs without an output are labelled by the rule chain")
+    parser.add_argument("--output", default="heading_classifier.json",
+                        help="where to write the model trained on all documents")
+    parser.add_argument("--accept", type=float, default=DEFAULT_ACCEPT,
+                        help="probability from which a line is a heading without the rule chain "
+                             "(raised where the training lines need it)")
+    parser.add_argument("--reject", type=float, default=DEFAULT_REJECT,
+                        help="probability up to which a line is not a heading without the rule chain "
+                             "(lowered where the training lines need it)")
+    parser.add_argument("--repeats", type=int, default=5, help="time the heading stage as the best of this many runs")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    documents, engine_labelled = load_corpus(args.corpus or [(DEFAULT_PDF_DIR, DEFAULT_OUTPUT_DIR)])
+    rows = [row for _, document_rows in documents.values() for row in document_rows]
+    classifier = fit(rows, args.accept, args.reject)
+    classifier.save(args.output)
+
+    held_out = cross_validate(documents, args.accept, args.reject)
+    rule_seconds = time_heading_stage(list(documents), None, args.repeats)
+    model_seconds = time_heading_stage(list(documents), classifier, args.repeats)
+    totals = {key: sum(row[key] for row in held_out)
+              for key in ("lines", "decided", "decided_correct", "correct", "rule_chain_correct")}
+    report = {
+        "documents": len(documents),
+        "engine_labelled_documents": engine_labelled,
+        "lines": len(rows),
+        "headings": sum(1 for _, label, _ in rows if label),
+        "model": classifier.to_dict(),
+        "held_out": held_out,
+        "held_out_totals": totals,
+        "heading_stage_seconds": {"rule_chain": round(rule_seconds, 4), "classifier": round(model_seconds, 4)},
+    }
+
+    for row in held_out:
+        print(f"{row['file']:<14} {row['lines']:>4} lines, {row['decided']:>4} decided by the model "
+              f"({row['decided_correct']} correct); accuracy {row['correct']}/{row['lines']} vs rule chain "
+              f"{row['rule_chain_correct']}/{row['lines']}; outline matches: {row['outline_matches']} "
+              f"(-{row['headings_removed']} +{row['headings_added']} ~{row['headings_relevelled']})")
+    if totals["lines"]:
+        print(f"Held out: {totals['decided'] / totals['lines']:.1%} of lines decided by the model, "
+              f"{totals['decided_correct'] / max(totals['decided'], 1):.1%} of those correctly; accuracy "
+              f"{totals['correct'] / totals['lines']:.1%} vs rule chain {totals['rule_chain_correct'] / totals['lines']:.1%}")
+    print(f"Heading stage over {len(documents)} documents: rule chain {rule_seconds:.4f}s, "
+          f"with the classifier {model_seconds:.4f}s")
+    print(f"Model trained on {len(rows)} lines ({report['headings']} headings) written to {args.output}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())